@@ -1,10 +1,6 @@
 // archive_script.js
 
-// 簡易繁簡轉換字典 (與 index.html 中的保持一致或從共享檔案引入)
-const tsMap = {'剧':'劇','集':'集','电':'電','影':'影','杂':'雜','志':'誌','时':'時','间':'間','档':'檔','案':'案','更':'更','新':'新','列':'列','表':'表','签':'簽','标':'標','题':'題','内':'內','容':'容','搜':'搜','寻':'尋','显':'顯','示':'示','隐':'隱','藏':'藏','数':'數','据':'據','库': '庫','简':'簡','繁':'繁','体':'體','字':'字','转':'轉','换':'換','优':'優','化':'化','验':'驗','证':'證','权':'權','限':'限','设':'設','置':'置','错':'錯','误':'誤','讯':'訊','息':'息','系':'系','统':'統','环':'環','境':'境','版':'版','本':'本','处':'處','理':'理','回':'回','应': '應','网':'網','页':'頁','浏':'瀏','览':'覽','器':'器','缓':'緩','存':'存','清':'清','除':'除','模':'模','块':'塊','组':'組','织':'織','结':'結','构':'構','状':'狀','态':'態','负':'負','载':'載','压':'壓','力':'力','测':'測','试':'試','性':'性','能':'能','调':'調','优':'優','部':'部', '署':'署','迭':'疊','代':'代','开':'開','发':'發','周':'週','期':'期','计':'計','划':'劃','实':'實','现':'現','功':'功','能':'能','需':'需','求':'求','规':'規','范':'範','说':'說','明':'明','书':'書','用':'用','户':'戶','体':'體','验':'驗','界':'界','面':'面','计':'計','交互':'互動', '动':'動','画':'畫','视':'視','觉':'覺','元':'元','素':'素','图':'圖','标':'標','颜':'顏','色':'色','体':'體','排':'排','版':'版','布':'佈','局':'局','响':'響','应':'應','式':'式','适':'適','配':'配','不':'不','同':'同','备':'備','屏':'屏','幕':'幕','尺':'尺','寸':'寸','全':'全','漫':'漫', ' ': ' '};
-const stMap = {}; for (const t in tsMap) { stMap[tsMap[t]] = t; }
-function toSimp(t) { if(!t) return ""; let r=""; for(let i=0;i<t.length;i++) { r += stMap[t[i]]||t[i]; } return r; }
-function toTrad(t) { if(!t) return ""; let r=""; for(let i=0;i<t.length;i++) { r += tsMap[t[i]]||t[i]; } return r; }
+// toTrad / toSimp 由先載入的 search_normalize.<hash>.js 提供 (與 index.html 共用)
 
 function escapeHTML(str) {
     if (!str) return "";
@@ -31,8 +27,18 @@ document.addEventListener('DOMContentLoaded', function() {
     const gotoPageBtn = document.getElementById('goto-page-btn');
 
 
-    let allData = []; // 儲存從 JSON 載入的全部資料
-    let filteredData = []; // 儲存過濾後的資料
+    const ARCHIVE_DATA_DIR = 'archive_data'; // Python 端輸出的分類 × 月份分片與 manifest
+
+    let manifest = null; // 分片模式下的 manifest；為 null 時使用舊的單一 media_updates.json
+    const shardCache = {}; // 分片檔名 -> Promise (每個分片最多下載一次)
+    const searchIndexCache = {}; // 索引檔名 (含雜湊) -> Promise (Python 端預先建立的各分片靜態搜尋索引)
+    let searchHits = null; // 以索引搜尋時命中的文件編號 (即該分類依時間倒序的位置)
+    let allData = []; // 舊模式：儲存從 JSON 載入的全部資料
+    let filteredData = []; // 儲存過濾後的資料 (搜尋結果或舊模式)
+    let totalItems = 0; // 目前檢視的總筆數
+    let useShardPaging = false; // 無搜尋詞時直接依 manifest 計算分頁，只下載需要的分片
+    let filterToken = 0; // 避免較舊的非同步結果覆蓋較新的
+    let pageToken = 0;
     let currentPage = 1;
     let itemsPerPage = parseInt(itemsPerPageSelect.value, 10);
     let currentActiveCategory = 'tvshow'; // 預設分類，可以從 URL 參數獲取或固定
@@ -55,7 +61,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     gotoPageBtn.addEventListener('click', function() {
         const pageNum = parseInt(gotoPageInput.value, 10);
-        const totalPages = Math.ceil(filteredData.length / itemsPerPage);
+        const totalPages = Math.ceil(totalItems / itemsPerPage);
         if (pageNum >= 1 && pageNum <= totalPages) {
             currentPage = pageNum;
             renderCurrentPage();
@@ -69,6 +75,27 @@ document.addEventListener('DOMContentLoaded', function() {
     function fetchData() {
         loadingIndicator.style.display = 'block';
         paginationControls.style.display = 'none';
+        // 優先讀取分片 manifest；若不存在 (尚未由新版程式發布) 則退回完整的 media_updates.json
+        fetch(`${ARCHIVE_DATA_DIR}/manifest.json`, { cache: 'no-cache' })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => {
+                manifest = data;
+                const categoriesWithData = new Set(Object.keys(manifest.categories || {}).filter(key => manifest.categories[key].count > 0));
+                initTabsAndRender(categoriesWithData);
+            })
+            .catch(error => {
+                console.warn('無法載入分片 manifest，改為載入完整 media_updates.json:', error);
+                manifest = null;
+                fetchLegacyData();
+            });
+    }
+
+    function fetchLegacyData() {
         // JSON 檔案應該與 archive.html 在同一目錄層級或相對路徑正確
         fetch('media_updates.json')
             .then(response => {
@@ -85,19 +112,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 });
                 // 預設按時間倒序 (JSON 本身應該已經是，以防萬一)
                 allData.sort((a, b) => b.timestamp_obj - a.timestamp_obj);
-                
-                generateTabButtons(); // 根據載入的資料動態生成 Tab
-                // 模擬點擊預設的 active tab (如果有的話)
-                const activeTabButton = tabButtonsContainer.querySelector('.tab-button.active');
-                if (activeTabButton) {
-                    currentActiveCategory = activeTabButton.getAttribute('data-category');
-                } else if (tabButtonsContainer.firstChild) { // 如果沒有 active，選第一個
-                    currentActiveCategory = tabButtonsContainer.firstChild.getAttribute('data-category');
-                    tabButtonsContainer.firstChild.classList.add('active');
-                }
-                
-                applyFilterAndRender();
-                loadingIndicator.style.display = 'none';
+                initTabsAndRender(new Set(allData.map(item => item.category)));
             })
             .catch(error => {
                 console.error('Error fetching or parsing media_updates.json:', error);
@@ -106,10 +121,175 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
-    function generateTabButtons() {
+    function initTabsAndRender(categoriesWithData) {
+        generateTabButtons(categoriesWithData); // 根據載入的資料動態生成 Tab
+        // 模擬點擊預設的 active tab (如果有的話)
+        const activeTabButton = tabButtonsContainer.querySelector('.tab-button.active');
+        if (activeTabButton) {
+            currentActiveCategory = activeTabButton.getAttribute('data-category');
+        } else if (tabButtonsContainer.firstChild) { // 如果沒有 active，選第一個
+            currentActiveCategory = tabButtonsContainer.firstChild.getAttribute('data-category');
+            tabButtonsContainer.firstChild.classList.add('active');
+        }
+
+        applyFilterAndRender();
+        loadingIndicator.style.display = 'none';
+    }
+
+    function fetchShard(shard) {
+        if (!shardCache[shard.file]) {
+            // 以內容雜湊作為版本參數：內容未變時可直接使用瀏覽器快取
+            shardCache[shard.file] = fetch(`${ARCHIVE_DATA_DIR}/${shard.file}?v=${shard.hash}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .catch(error => {
+                    delete shardCache[shard.file]; // 失敗時允許下次重試
+                    throw error;
+                });
+        }
+        return shardCache[shard.file];
+    }
+
+    function getCategoryShards(category) {
+        const entry = manifest && manifest.categories ? manifest.categories[category] : null;
+        return entry ? entry.shards : [];
+    }
+
+    // 取得某分類依時間倒序的第 [start, end) 筆，只下載涵蓋此範圍的分片
+    function fetchCategoryRange(category, start, end) {
+        const needed = [];
+        let offset = 0;
+        for (const shard of getCategoryShards(category)) {
+            const shardStart = offset;
+            const shardEnd = offset + shard.count;
+            offset = shardEnd;
+            if (shardEnd <= start) continue;
+            if (shardStart >= end) break;
+            needed.push({ shard: shard, from: Math.max(start - shardStart, 0), to: Math.min(end, shardEnd) - shardStart });
+        }
+        return Promise.all(needed.map(part => fetchShard(part.shard).then(items => items.slice(part.from, part.to))))
+            .then(parts => [].concat(...parts));
+    }
+
+    function fetchCategoryAll(category) {
+        return Promise.all(getCategoryShards(category).map(fetchShard)).then(parts => [].concat(...parts));
+    }
+
+    // 依文件編號取得紀錄：以 manifest 的累計筆數找出所在分片，只下載用得到的分片
+    function fetchCategoryDocs(category, docIds) {
+        const shards = getCategoryShards(category);
+        const offsets = [];
+        let offset = 0;
+        shards.forEach(shard => { offsets.push(offset); offset += shard.count; });
+        return Promise.all(docIds.map(docId => {
+            let low = 0, high = offsets.length - 1;
+            while (low < high) { // 找出最後一個 offsets[i] <= docId 的分片
+                const mid = (low + high + 1) >> 1;
+                if (offsets[mid] <= docId) low = mid; else high = mid - 1;
+            }
+            return fetchShard(shards[low]).then(items => items[docId - offsets[low]]);
+        })).then(items => items.filter(Boolean));
+    }
+
+    function fetchShardSearchIndex(shard) {
+        const key = `${shard.search.file}?v=${shard.search.hash}`;
+        if (!searchIndexCache[key]) {
+            searchIndexCache[key] = fetch(`${ARCHIVE_DATA_DIR}/${key}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .then(index => {
+                    index.decoded = {}; // 已解碼 (差值還原) 的倒排表
+                    return index;
+                })
+                .catch(error => {
+                    delete searchIndexCache[key];
+                    throw error;
+                });
+        }
+        return searchIndexCache[key];
+    }
+
+    // 每個分片各有一份搜尋索引 (文件編號為分片內的位置)；只有新增紀錄的月份需要重新下載
+    function fetchSearchIndex(category) {
+        const shards = getCategoryShards(category);
+        if (shards.length === 0 || !shards.every(shard => shard.search)) return Promise.resolve(null);
+        return Promise.all(shards.map(fetchShardSearchIndex));
+    }
+
+    // 與 Python 端 normalize_search_text 相同：小寫並以 search_normalize.js 的對照表統一為繁體
+    function normalizeForIndex(text) {
+        return toTrad(text.toLowerCase());
+    }
+
+    function getPostings(index, gram) {
+        if (!(gram in index.decoded)) {
+            const deltas = index.postings[gram];
+            let docIds = null;
+            if (deltas) {
+                docIds = new Array(deltas.length);
+                let previous = 0;
+                for (let i = 0; i < deltas.length; i++) { previous += deltas[i]; docIds[i] = previous; }
+            }
+            index.decoded[gram] = docIds;
+        }
+        return index.decoded[gram];
+    }
+
+    function intersectSorted(a, b) {
+        const result = [];
+        let i = 0, j = 0;
+        while (i < a.length && j < b.length) {
+            if (a[i] === b[j]) { result.push(a[i]); i++; j++; }
+            else if (a[i] < b[j]) i++;
+            else j++;
+        }
+        return result;
+    }
+
+    // 取各 n-gram 倒排表的交集，再以已正規化的文字確認確實包含整個查詢字串
+    function searchWithIndex(index, searchTerm) {
+        const query = normalizeForIndex(searchTerm);
+        const chars = Array.from(query);
+        if (chars.length < index.n) { // 查詢比 n-gram 短：直接比對預先正規化的文字
+            const hits = [];
+            index.docs.forEach((text, docId) => { if (text.includes(query)) hits.push(docId); });
+            return hits;
+        }
+        const grams = new Set();
+        for (let i = 0; i + index.n <= chars.length; i++) { grams.add(chars.slice(i, i + index.n).join('')); }
+        const lists = [];
+        for (const gram of grams) {
+            const docIds = getPostings(index, gram);
+            if (!docIds) return [];
+            lists.push(docIds);
+        }
+        lists.sort((a, b) => a.length - b.length);
+        let candidates = lists[0];
+        for (let i = 1; i < lists.length && candidates.length > 0; i++) { candidates = intersectSorted(candidates, lists[i]); }
+        return candidates.filter(docId => index.docs[docId].includes(query));
+    }
+
+    // 逐一查詢各分片的索引，再以分片的累計筆數把分片內編號轉為整個分類的文件編號
+    function searchCategoryIndexes(indexes, searchTerm) {
+        const hits = [];
+        let offset = 0;
+        indexes.forEach(index => {
+            for (const docId of searchWithIndex(index, searchTerm)) hits.push(offset + docId);
+            offset += index.docs.length;
+        });
+        return hits;
+    }
+
+    function generateTabButtons(categoriesWithData) {
         tabButtonsContainer.innerHTML = ''; // 清空現有按鈕
-        let categoriesWithData = new Set();
-        allData.forEach(item => categoriesWithData.add(item.category));
 
         // 確保預設分類按鈕最先被考慮
         let defaultCatInfo = categoriesOrder.find(c => c.key === DEFAULT_CATEGORY);
@@ -162,36 +342,97 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
 
+    function matchesSearch(item, searchTrad, searchSimp) {
+        const filename = (item.filename || "").toLowerCase();
+        const path = (item.relative_path || "").toLowerCase();
+        let textToSearch = (item.category === 'magazine') ? filename : path;
+
+        const targetTrad = toTrad(textToSearch);
+        const targetSimp = toSimp(textToSearch);
+
+        return (targetTrad.includes(searchTrad) || targetTrad.includes(searchSimp)) ||
+               (targetSimp.includes(searchTrad) || targetSimp.includes(searchSimp));
+    }
+
     function applyFilterAndRender() {
         const searchTerm = searchInput.value.toLowerCase().trim();
-        
-        if (searchTerm === "") {
-            // 無搜尋詞：顯示當前 active category 的所有資料
-            filteredData = allData.filter(item => item.category === currentActiveCategory);
-        } else {
-            const searchTrad = toTrad(searchTerm);
-            const searchSimp = toSimp(searchTerm);
-
-            filteredData = allData.filter(item => {
-                if (item.category !== currentActiveCategory) return false; // 只搜尋當前 Tab
+        const token = ++filterToken;
+        currentPage = 1; // 每次搜尋或切換 Tab 都回到第一頁
+        searchHits = null;
 
-                const filename = (item.filename || "").toLowerCase();
-                const path = (item.relative_path || "").toLowerCase();
-                let textToSearch = (item.category === 'magazine') ? filename : path;
-                
-                const targetTrad = toTrad(textToSearch);
-                const targetSimp = toSimp(textToSearch);
+        if (manifest && searchTerm === "") {
+            // 無搜尋詞：總筆數直接取自 manifest，分頁時只下載需要的分片
+            const entry = manifest.categories[currentActiveCategory];
+            useShardPaging = true;
+            totalItems = entry ? entry.count : 0;
+            renderCurrentPage();
+            updatePaginationControls();
+            return;
+        }
 
-                return (targetTrad.includes(searchTrad) || targetTrad.includes(searchSimp)) ||
-                       (targetSimp.includes(searchTrad) || targetSimp.includes(searchSimp));
-            });
+        useShardPaging = false;
+        if (manifest) {
+            // 分片模式：優先以靜態搜尋索引查詢，只有索引無法使用時才下載整個分類比對
+            const category = currentActiveCategory;
+            fetchSearchIndex(category)
+                .then(indexes => {
+                    if (token !== filterToken) return; // 已有較新的搜尋或 Tab 切換
+                    if (!indexes) {
+                        filterLoadedItems(fetchCategoryAll(category), searchTerm, token);
+                        return;
+                    }
+                    searchHits = searchCategoryIndexes(indexes, searchTerm);
+                    totalItems = searchHits.length;
+                    renderCurrentPage();
+                    updatePaginationControls();
+                })
+                .catch(error => {
+                    console.warn('無法載入搜尋索引，改為逐筆比對:', error);
+                    if (token === filterToken) filterLoadedItems(fetchCategoryAll(category), searchTerm, token);
+                });
+            return;
         }
-        currentPage = 1; // 每次搜尋或切換 Tab 都回到第一頁
-        renderCurrentPage();
-        updatePaginationControls();
+        filterLoadedItems(Promise.resolve(allData), searchTerm, token);
+    }
+
+    function filterLoadedItems(sourcePromise, searchTerm, token) {
+        sourcePromise.then(items => {
+            if (token !== filterToken) return; // 已有較新的搜尋或 Tab 切換
+            if (searchTerm === "") {
+                // 無搜尋詞：顯示當前 active category 的所有資料
+                filteredData = items.filter(item => item.category === currentActiveCategory);
+            } else {
+                const searchTrad = toTrad(searchTerm);
+                const searchSimp = toSimp(searchTerm);
+                filteredData = items.filter(item => item.category === currentActiveCategory && matchesSearch(item, searchTrad, searchSimp)); // 只搜尋當前 Tab
+            }
+            totalItems = filteredData.length;
+            renderCurrentPage();
+            updatePaginationControls();
+        }).catch(error => {
+            console.error('Error loading archive shards:', error);
+            tabContentContainer.innerHTML = '<p class="no-results">載入歷史記錄失敗，請稍後再試。</p>';
+        });
     }
 
     function renderCurrentPage() {
+        const token = ++pageToken;
+        const start = (currentPage - 1) * itemsPerPage;
+        const end = start + itemsPerPage;
+        let pagePromise;
+        if (useShardPaging) pagePromise = fetchCategoryRange(currentActiveCategory, start, end);
+        else if (searchHits) pagePromise = fetchCategoryDocs(currentActiveCategory, searchHits.slice(start, end));
+        else pagePromise = Promise.resolve(filteredData.slice(start, end));
+        pagePromise.then(paginatedItems => {
+            if (token !== pageToken) return; // 使用者已切換到其他頁面
+            renderItems(paginatedItems);
+        }).catch(error => {
+            console.error('Error loading archive shards:', error);
+            tabContentContainer.innerHTML = '<p class="no-results">載入歷史記錄失敗，請稍後再試。</p>';
+        });
+    }
+
+    function renderItems(paginatedItems) {
         tabContentContainer.innerHTML = ''; // 清空舊的內容面板
 
         const paneId = `pane-${currentActiveCategory}`;
@@ -206,10 +447,6 @@ document.addEventListener('DOMContentLoaded', function() {
             currentPane.classList.add('active'); 
         }
 
-        const start = (currentPage - 1) * itemsPerPage;
-        const end = start + itemsPerPage;
-        const paginatedItems = filteredData.slice(start, end);
-
         if (paginatedItems.length === 0) {
             currentPane.innerHTML = '<p class="no-results">此條件下無符合的記錄。</p>';
             return;
@@ -304,7 +541,6 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function updatePaginationControls() {
-        const totalItems = filteredData.length;
         const totalPages = Math.ceil(totalItems / itemsPerPage);
 
         if (totalPages <= 1) {
@@ -337,7 +573,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     if(nextPageBtn) {
         nextPageBtn.addEventListener('click', () => {
-            const totalPages = Math.ceil(filteredData.length / itemsPerPage);
+            const totalPages = Math.ceil(totalItems / itemsPerPage);
             if (currentPage < totalPages) {
                 currentPage++;
                 renderCurrentPage();
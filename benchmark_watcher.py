@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""watcher 效能基準測試
+
+在暫存目錄產生與 PATH_CONFIG 結構相同的假媒體庫 (電影、Season NN 劇集與 tvshow.nfo、全集目錄、雜誌、
+損壞的 NFO、中日文檔名)，把各版本 watcher 複製到獨立的暫存 repo 載入後，逐一計時各處理階段並記錄尖峰記憶體。
+結果附加到 GDState/bench_results/results.jsonl (本機狀態目錄，不進版本控制)，可比較不同版本 (例如 9.1.5 → 9.1.6) 或同一版本前後的差異。
+
+用法:
+    python benchmark_watcher.py                                  # 預設比較 Py_Old/watcher_v9.1.5.py 與 watcher_v9.1.6.py，1000 個檔案
+    python benchmark_watcher.py watcher_v9.1.6.py --sizes 1000,10000,100000
+    python benchmark_watcher.py --no-memory                      # 不啟用 tracemalloc (計時較接近實際，但不記錄記憶體)
+"""
+import os
+import re
+import ast
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import datetime
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import importlib.util
+from collections import Counter
+
+# --- 設定 ---
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WATCHERS = [os.path.join(SCRIPT_DIRECTORY, 'Py_Old', 'watcher_v9.1.5.py'), os.path.join(SCRIPT_DIRECTORY, 'watcher_v9.1.6.py')]
+DEFAULT_LAYOUT_SOURCE = os.path.join(SCRIPT_DIRECTORY, 'watcher_v9.1.6.py') # 從此版本的 PATH_CONFIG 取得媒體庫結構
+DEFAULT_SIZES = '1000'
+DEFAULT_SAMPLE_SIZE = 2000 # process_new_media 階段直接處理的項目數上限
+RESULTS_FILE = os.path.join(SCRIPT_DIRECTORY, 'GDState', 'bench_results', 'results.jsonl') # 與 watcher 的本機狀態檔放在一起 (.gitignore 已排除)
+ARCHIVE_JS_FILE = 'archive_script.js' # 新版 generate_html 需要，複製到暫存 repo
+CATEGORY_SHARES = [('tvshow', 0.45), ('movie', 0.20), ('collection', 0.15), ('animation', 0.10), ('magazine', 0.10)] # 媒體檔案數的分配比例
+MALFORMED_NFO_RATIO = 0.03 # 無法以 XML 解析的 NFO 比例 (走手動提取的備援路徑)
+EPISODE_NFO_WITHOUT_ID_RATIO = 0.5 # 集數 NFO 沒有 TMDb ID、需回頭找 tvshow.nfo 的比例
+NOISE_FILE_RATIO = 0.05 # 非目標副檔名 (字幕、海報) 的比例
+FILE_AGE_SECONDS = 86400 # 所有檔案與目錄的修改時間往前調整，讓寫入完成偵測視為早已寫完
+WINDOWS_PATH_LITERAL_PATTERN = re.compile(r'"([A-Za-z]):((?:\\\\[^"\\]*)*)"') # 原始碼中的 "H:\\..." 字串常數
+
+TITLE_WORDS = ['星際', '迷霧', '追兇者', '長安', '十二時辰', '鬼滅之刃', '進撃の巨人', '三体', '繁花', '漫长的季节', 'Frieren',
+               'The Last', 'Night', 'Ocean', 'Dune', '東京', '愛情公寓', 'Good Omens', '사랑의 불시착', '葬送のフリーレン', '（完整版）', 'Café']
+MAGAZINE_NAMES = ['天下雜誌', '商業周刊', '國家地理', 'The Economist', '科學人', '讀者文摘', '週刊文春']
+
+# --- 假媒體庫產生 ---
+def map_windows_path(windows_path, tree_root):
+    """把 H:\\a\\b 轉成 <tree_root>/H/a/b；與改寫原始碼時使用相同的組合方式，兩邊的路徑字串完全一致"""
+    drive, rest = windows_path.split(':', 1)
+    return '/'.join([tree_root.replace('\\', '/'), drive] + [part for part in rest.split('\\') if part])
+
+def load_layout(layout_source):
+    """從 watcher 原始碼讀出 PATH_CONFIG (不 import)；每個分類只取第一個根目錄，舊版硬編碼的 H 槽路徑也看得到完整的測試資料"""
+    with open(layout_source, 'r', encoding='utf-8') as f: module_ast = ast.parse(f.read())
+    for node in module_ast.body:
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == 'PATH_CONFIG' for target in node.targets):
+            layout = {}
+            for entry in ast.literal_eval(node.value): layout.setdefault(entry['category'], entry['path'])
+            return layout
+    raise ValueError(f"{layout_source} 中找不到 PATH_CONFIG")
+
+def make_title(rng, index):
+    words = rng.sample(TITLE_WORDS, rng.randint(1, 2))
+    return f"{' '.join(words)} {index}"
+
+def write_text(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f: f.write(content)
+
+def make_nfo(rng, root_tag, title, tmdb_id):
+    plot = f"{title} 的劇情簡介。" * rng.randint(1, 6) + ' <b>&amp;</b>' * rng.randint(0, 1)
+    uniqueid = f'\n  <uniqueid type="tmdb">{tmdb_id}</uniqueid>' if tmdb_id else ''
+    content = f'<?xml version="1.0" encoding="utf-8" standalone="yes"?>\n<{root_tag}>\n  <title>{title}</title>\n  <plot><![CDATA[{plot}]]></plot>{uniqueid}\n</{root_tag}>\n'
+    if rng.random() < MALFORMED_NFO_RATIO: content = content.replace(f'</{root_tag}>', '').replace('<![CDATA[', '') + '<broken' # 未閉合的標籤
+    return content
+
+def generate_media_tree(tree_root, layout, file_count, seed=0):
+    """產生約 file_count 個媒體檔案的假媒體庫；回傳統計與 NFO/媒體項目清單"""
+    rng = random.Random(seed); stats = Counter(); nfo_paths = []; media_items = [] # (路徑, 是否為 collection 目錄)
+    roots = {category: map_windows_path(path, tree_root) for category, path in layout.items()}
+    quotas = {category: max(1, int(file_count * share)) for category, share in CATEGORY_SHARES if category in roots}
+    next_tmdb_id = iter(range(100000, 10 ** 9))
+
+    def add_file(path, kind):
+        write_text(path, '\0' * rng.randint(0, 64)); stats[kind] += 1
+        if rng.random() < NOISE_FILE_RATIO: write_text(os.path.splitext(path)[0] + rng.choice(['.zh-TW.srt', '-poster.jpg']), 'noise'); stats['noise'] += 1
+
+    def add_nfo(path, root_tag, title, tmdb_id):
+        write_text(path, make_nfo(rng, root_tag, title, tmdb_id)); nfo_paths.append(path); stats['nfo'] += 1
+
+    def add_series(root, quota, is_collection=False, with_episode_nfo=True):
+        show_index = 0
+        while quota > 0:
+            show_index += 1; title = make_title(rng, show_index); show_dir = os.path.join(root, title).replace('\\', '/')
+            add_nfo(f"{show_dir}/tvshow.nfo", 'tvshow', title, next(next_tmdb_id))
+            if is_collection: media_items.append((show_dir, True)); stats['collection_dirs'] += 1
+            for season in range(1, rng.randint(1, 3) + 1):
+                for episode in range(1, rng.randint(6, 24) + 1):
+                    if quota <= 0: break
+                    episode_path = f"{show_dir}/Season {season:02d}/{title} S{season:02d}E{episode:02d}.{rng.choice(['mkv', 'mp4'])}"
+                    add_file(episode_path, 'episodes'); quota -= 1
+                    if not is_collection: media_items.append((episode_path, False))
+                    if with_episode_nfo and rng.random() < 0.8:
+                        add_nfo(os.path.splitext(episode_path)[0] + '.nfo', 'episodedetails', f"{title} 第 {episode} 集",
+                                None if rng.random() < EPISODE_NFO_WITHOUT_ID_RATIO else next(next_tmdb_id))
+
+    for category, quota in quotas.items():
+        root = roots[category]; os.makedirs(root, exist_ok=True)
+        if category in ('tvshow', 'collection', 'animation'):
+            add_series(root, quota, is_collection=category == 'collection', with_episode_nfo=category != 'animation')
+        elif category == 'movie':
+            for index in range(1, quota + 1):
+                title = make_title(rng, index); year = rng.randint(1980, 2025); movie_dir = f"{root}/{title} ({year})"
+                movie_path = f"{movie_dir}/{title} ({year}).mkv"
+                add_file(movie_path, 'movies'); media_items.append((movie_path, False))
+                if rng.random() < 0.9: add_nfo(f"{movie_dir}/{title} ({year}).nfo", 'movie', title, next(next_tmdb_id))
+        elif category == 'magazine':
+            for index in range(quota):
+                name = MAGAZINE_NAMES[index % len(MAGAZINE_NAMES)]
+                magazine_path = f"{root}/{name}/{name} {2000 + index // 12 % 26}-{index % 12 + 1:02d} 第{index}期.pdf"
+                add_file(magazine_path, 'magazines'); media_items.append((magazine_path, False))
+    # 所有項目的修改時間往前調整，新版的寫入完成偵測會立即放行，兩個版本比較的都是純處理成本
+    old_time = time.time() - FILE_AGE_SECONDS
+    for directory, _, files in os.walk(tree_root, topdown=False):
+        for filename in files: os.utime(os.path.join(directory, filename), (old_time, old_time))
+        os.utime(directory, (old_time, old_time))
+    return {'counts': dict(stats), 'nfo_paths': nfo_paths, 'media_items': media_items}
+
+# --- 載入待測版本 ---
+class NoSleepTime:
+    """取代待測模組中的 time 模組：sleep 不實際等待，只累計被略過的秒數"""
+    def __init__(self):
+        self.skipped_seconds = []
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def sleep(self, seconds):
+        self.skipped_seconds.append(seconds)
+
+def rewrite_windows_paths(source, tree_root):
+    """把原始碼中所有 "X:\\..." 路徑常數改成假媒體庫下的對應路徑 (舊版在函數內硬編碼了路徑)"""
+    def replace(match):
+        return json.dumps(map_windows_path(f"{match.group(1)}:{match.group(2).replace(chr(92) * 2, chr(92))}", tree_root), ensure_ascii=False)
+    return WINDOWS_PATH_LITERAL_PATTERN.sub(replace, source)
+
+def load_watcher(watcher_path, tree_root, repo_directory, module_index):
+    """把 watcher 複製到獨立的暫存 repo 後載入；REPO_PATH、GDLogs、GDState 與輸出檔都落在該目錄"""
+    with open(watcher_path, 'r', encoding='utf-8') as f: source = f.read()
+    os.makedirs(repo_directory, exist_ok=True)
+    module_path = os.path.join(repo_directory, os.path.basename(watcher_path))
+    with open(module_path, 'w', encoding='utf-8') as f: f.write(rewrite_windows_paths(source, tree_root))
+    archive_js_source = os.path.join(os.path.dirname(os.path.abspath(watcher_path)), ARCHIVE_JS_FILE)
+    if not os.path.exists(archive_js_source): archive_js_source = os.path.join(SCRIPT_DIRECTORY, ARCHIVE_JS_FILE)
+    if os.path.exists(archive_js_source): shutil.copy(archive_js_source, repo_directory)
+    spec = importlib.util.spec_from_file_location(f"bench_watcher_{module_index}", module_path)
+    module = importlib.util.module_from_spec(spec); spec.loader.exec_module(module)
+    module.time = NoSleepTime()
+    trigger_calls = []
+    module.trigger_update_process = lambda: trigger_calls.append(1) # 不排程 Git 操作
+    return module, trigger_calls, hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def get_records_container(module):
+    """新版為 media_index，舊版為 media_updates 列表"""
+    return module.media_index if hasattr(module, 'media_index') else module.media_updates
+
+def reset_watcher_caches(module):
+    """清空版本內的快取，讓各階段量到的是冷快取的成本 (輪詢目錄狀態保留，供重新輪詢階段使用)"""
+    for cache_name in ('nfo_cache', 'dir_listing_cache', 'day_fragment_cache'):
+        cache = getattr(module, cache_name, None)
+        if cache is not None: cache.clear()
+
+# --- 計時 ---
+def run_stage(results, stage_name, function, item_count=None, measure_memory=True):
+    if measure_memory: tracemalloc.reset_peak(); memory_before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter(); value = function(); elapsed = time.perf_counter() - started
+    if item_count is None: item_count = value if isinstance(value, int) else None
+    stage_result = {'seconds': round(elapsed, 4), 'items': item_count, 'items_per_second': round(item_count / elapsed, 1) if item_count and elapsed > 0 else None}
+    if measure_memory:
+        memory_after, memory_peak = tracemalloc.get_traced_memory()
+        stage_result['peak_kib'] = round((memory_peak - memory_before) / 1024, 1); stage_result['retained_kib'] = round((memory_after - memory_before) / 1024, 1)
+    results[stage_name] = stage_result
+    print(f"    {stage_name:<18} {elapsed:9.3f} 秒  {item_count if item_count is not None else '-':>8} 項"
+          + (f"  尖峰 {stage_result['peak_kib'] / 1024:8.1f} MiB" if measure_memory else ''))
+
+def benchmark_version(watcher_path, tree_root, tree, work_directory, module_index, sample_size, measure_memory):
+    module, trigger_calls, source_hash = load_watcher(watcher_path, tree_root, os.path.join(work_directory, f"repo_{module_index}"), module_index)
+    records = get_records_container(module); stages = {}
+    rng = random.Random(module_index)
+    sample_items = rng.sample(tree['media_items'], min(sample_size, len(tree['media_items'])))
+
+    def scan():
+        module.scan_and_process_new_files(); return len(records)
+
+    def process_sample():
+        return sum(1 for item_path, is_directory in sample_items if module.process_new_media(item_path, is_directory_event=is_directory))
+
+    def parse_all_nfo():
+        for nfo_path in tree['nfo_paths']: module.parse_nfo(nfo_path)
+        return len(tree['nfo_paths'])
+
+    run_stage(stages, 'scan', scan, measure_memory=measure_memory)
+    run_stage(stages, 'rescan', lambda: module.scan_and_process_new_files() or 0, item_count=len(tree['media_items']), measure_memory=measure_memory)
+    reset_watcher_caches(module)
+    run_stage(stages, 'process_new_media', process_sample, item_count=len(sample_items), measure_memory=measure_memory)
+    reset_watcher_caches(module)
+    run_stage(stages, 'parse_nfo', parse_all_nfo, measure_memory=measure_memory)
+    run_stage(stages, 'save_updates', lambda: module.save_updates(records), item_count=len(records), measure_memory=measure_memory)
+    if hasattr(module, 'compact_updates'): # 新版 save_updates 只附加日誌，完整快照由壓實寫出
+        run_stage(stages, 'compact_updates', lambda: module.compact_updates(records), item_count=len(records), measure_memory=measure_memory)
+    run_stage(stages, 'load_updates', lambda: len(module.load_updates()), measure_memory=measure_memory)
+    if hasattr(module, 'load_media_index'): # 新版啟動時由壓實寫出的狀態快照還原索引
+        run_stage(stages, 'load_media_index', lambda: len(module.load_media_index()), measure_memory=measure_memory)
+    reset_watcher_caches(module)
+    run_stage(stages, 'generate_html', lambda: module.generate_html(records), item_count=min(len(records), getattr(module, 'MAX_ITEMS_ON_INDEX_PAGE', len(records))), measure_memory=measure_memory)
+    return {'source_sha1': source_hash, 'records': len(records), 'trigger_calls': len(trigger_calls),
+            'skipped_sleep_seconds': round(sum(module.time.skipped_seconds), 1), 'stages': stages}
+
+# --- 結果記錄與比較 ---
+def get_version_label(watcher_path):
+    match = re.search(r'v(\d+(?:\.\d+)+)', os.path.basename(watcher_path))
+    return match.group(1) if match else os.path.splitext(os.path.basename(watcher_path))[0]
+
+def get_git_commit():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIRECTORY, capture_output=True, text=True, check=True).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError): return None
+
+def load_previous_results(results_file):
+    previous = {}
+    try:
+        with open(results_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try: result = json.loads(line)
+                except json.JSONDecodeError: continue
+                previous[(result.get('version'), result.get('size'), result.get('memory'))] = result # 保留最後一次
+    except FileNotFoundError: pass
+    return previous
+
+def format_change(current_seconds, baseline_seconds):
+    if not baseline_seconds or current_seconds is None: return ''
+    return f"{(current_seconds - baseline_seconds) / baseline_seconds * 100:+.0f}%"
+
+def print_comparison(size, run_results, previous_results):
+    """以第一個版本為基準列出各階段耗時，並標示與同版本上次紀錄的差異"""
+    stage_names = []
+    for result in reversed(run_results): # 以最新版本的階段順序為準
+        for stage_name in result['stages']:
+            if stage_name not in stage_names: stage_names.append(stage_name)
+    baseline = run_results[0]
+    print(f"\n=== {size} 個媒體檔案：各階段耗時 (秒)，括號內為相對於 {baseline['version']} 的變化，[ ] 內為相對於同版本上次紀錄 ===")
+    print(f"{'階段':<18}" + ''.join(f"{result['version']:>30}" for result in run_results))
+    for stage_name in stage_names:
+        row = f"{stage_name:<18}"
+        for result in run_results:
+            stage = result['stages'].get(stage_name)
+            if stage is None: row += f"{'-':>30}"; continue
+            baseline_stage = baseline['stages'].get(stage_name) if result is not baseline else None
+            previous = previous_results.get((result['version'], size, result['memory']), {}).get('stages', {}).get(stage_name, {})
+            cell = f"{stage['seconds']:.3f}"
+            if baseline_stage: cell += f" ({format_change(stage['seconds'], baseline_stage['seconds'])})"
+            if previous: cell += f" [{format_change(stage['seconds'], previous.get('seconds'))}]"
+            row += f"{cell:>30}"
+        print(row)
+
+def main():
+    parser = argparse.ArgumentParser(description='watcher 各處理階段的效能基準測試')
+    parser.add_argument('watchers', nargs='*', default=DEFAULT_WATCHERS, help='要測試的 watcher 原始碼路徑 (第一個作為比較基準)')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='以逗號分隔的媒體檔案數，例如 1000,10000,100000')
+    parser.add_argument('--sample', type=int, default=DEFAULT_SAMPLE_SIZE, help='process_new_media 階段處理的項目數上限')
+    parser.add_argument('--layout', default=DEFAULT_LAYOUT_SOURCE, help='從此 watcher 的 PATH_CONFIG 取得媒體庫結構')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='不啟用 tracemalloc')
+    parser.add_argument('--results', default=RESULTS_FILE, help='結果附加到此 JSONL 檔')
+    parser.add_argument('--keep-tree', action='store_true', help='保留暫存的假媒體庫與 repo 目錄')
+    args = parser.parse_args()
+
+    layout = load_layout(args.layout); measure_memory = not args.no_memory
+    previous_results = load_previous_results(args.results); git_commit = get_git_commit()
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    if measure_memory: tracemalloc.start()
+    for size in [int(value) for value in args.sizes.split(',') if value.strip()]:
+        work_directory = tempfile.mkdtemp(prefix=f'watcher_bench_{size}_'); tree_root = os.path.join(work_directory, 'library')
+        try:
+            generate_started = time.perf_counter()
+            tree = generate_media_tree(tree_root, layout, size, args.seed)
+            print(f"\n產生假媒體庫 ({size} 個媒體檔案) 耗時 {time.perf_counter() - generate_started:.1f} 秒: {tree['counts']}")
+            run_results = []
+            for module_index, watcher_path in enumerate(args.watchers):
+                version = get_version_label(watcher_path)
+                print(f"  [{version}] {watcher_path}")
+                version_result = benchmark_version(watcher_path, tree_root, tree, work_directory, module_index, args.sample, measure_memory)
+                result = {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'version': version, 'watcher': os.path.relpath(os.path.abspath(watcher_path), SCRIPT_DIRECTORY),
+                          'git_commit': git_commit, 'size': size, 'seed': args.seed, 'memory': measure_memory, 'tree': tree['counts'],
+                          'python': platform.python_version(), 'platform': platform.platform(), **version_result}
+                with open(args.results, 'a', encoding='utf-8') as f: f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                run_results.append(result)
+            print_comparison(size, run_results, previous_results)
+        finally:
+            if args.keep_tree: print(f"已保留暫存目錄: {work_directory}")
+            else: shutil.rmtree(work_directory, ignore_errors=True)
+    print(f"\n結果已附加到 {args.results}")
+
+if __name__ == '__main__':
+    main()
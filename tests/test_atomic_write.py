@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""write_file_atomic 寫出的檔案權限：新檔案依 umask，覆寫時沿用原檔案的權限 (而非 mkstemp 的 0600)"""
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+from watcher_loader import load_watcher
+
+def file_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+@unittest.skipIf(os.name == 'nt', 'Windows 只有唯讀屬性')
+class AtomicWriteModeTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix='watcher_atomic_')
+        self.watcher = load_watcher(self.repo)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo, ignore_errors=True)
+
+    def test_new_file_follows_umask(self):
+        path = os.path.join(self.repo, 'new.html')
+        self.watcher.write_file_atomic(path, ['<html>', '</html>'])
+        self.assertEqual(file_mode(path), 0o666 & ~self.watcher.PROCESS_UMASK)
+        with open(path, 'r', encoding='utf-8') as f: self.assertEqual(f.read(), '<html></html>')
+
+    def test_replaced_file_keeps_existing_mode(self):
+        path = os.path.join(self.repo, 'index.html')
+        with open(path, 'w', encoding='utf-8') as f: f.write('old')
+        os.chmod(path, 0o640)
+        self.watcher.write_file_atomic(path, 'new')
+        self.assertEqual(file_mode(path), 0o640)
+        self.assertEqual([name for name in os.listdir(self.repo) if name.endswith('.tmp')], []) # 暫存檔已替換
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Append-only 日誌：附加、當機後重播、中斷的壓實
+
+每個測試以 watcher_loader 把 watcher 載入暫存 repo；重新載入同一個 repo 即模擬程式當機後重新啟動 (不呼叫停止流程)。
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from watcher_loader import load_watcher, make_record, add_records
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix='watcher_journal_')
+        self.watcher = load_watcher(self.repo)
+        self.journal_path, self.compacting_path = self.watcher.get_journal_paths()
+        self.json_path = os.path.join(self.repo, self.watcher.UPDATES_JSON_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo, ignore_errors=True)
+
+    def newest_rows(self, watcher):
+        return [record.to_row() for record in watcher.media_index.newest()]
+
+    def read_journal_lines(self):
+        with open(self.journal_path, 'r', encoding='utf-8') as f: return f.read().splitlines()
+
+    def test_save_appends_only_new_records_without_compacting(self):
+        add_records(self.watcher, [make_record(self.watcher, i) for i in range(3)])
+        self.watcher.save_updates(self.watcher.media_index)
+        add_records(self.watcher, [make_record(self.watcher, 3)])
+        self.watcher.save_updates(self.watcher.media_index)
+        lines = self.read_journal_lines()
+        self.assertEqual([json.loads(line)['filename'] for line in lines], ['item0.mkv', 'item1.mkv', 'item2.mkv', 'item3.mkv'])
+        self.assertEqual(self.watcher.journal_line_count, 4)
+        self.assertFalse(os.path.exists(self.json_path)) # 未達門檻不會在儲存路徑上重寫快照
+
+    def test_replay_after_crash(self):
+        add_records(self.watcher, [make_record(self.watcher, i, category) for i, category in enumerate(['movie', 'tvshow', 'movie', 'anime'])])
+        self.watcher.save_updates(self.watcher.media_index)
+        add_records(self.watcher, [make_record(self.watcher, 9)]) # 尚未儲存就當機：這筆會遺失
+        with open(self.journal_path, 'a', encoding='utf-8') as f: f.write('{"filename": "torn.mkv", "absolute_pa') # 寫到一半的最後一行
+        expected = [row for row in self.newest_rows(self.watcher) if row[0] != 'item9.mkv']
+
+        restarted = load_watcher(self.repo)
+        self.assertEqual(self.newest_rows(restarted), expected)
+        self.assertEqual(restarted.media_index.content_digest(), restarted.MediaIndex(restarted.media_index.newest()).content_digest())
+        self.assertEqual(restarted.journal_line_count, 4)
+        self.assertIn(restarted.PathKey.of('/media/movie/Item0.mkv'), restarted.media_index)
+        # 殘行已截斷：重新啟動後附加的紀錄自成一行，再次當機重播時不會遺失
+        add_records(restarted, [make_record(restarted, 10)]); restarted.save_updates(restarted.media_index)
+        self.assertEqual(len(self.read_journal_lines()), 5)
+        self.assertEqual(self.newest_rows(load_watcher(self.repo)), self.newest_rows(restarted))
+        # 重播後再次加入相同路徑 (大小寫不同) 仍會被去重
+        self.assertFalse(restarted.record_new_update(make_record(restarted, 0, absolute_path='/MEDIA/movie/item0.mkv'), restarted.PathKey.of('/MEDIA/movie/item0.mkv')))
+
+    def test_interrupted_compaction_with_new_journal(self):
+        add_records(self.watcher, [make_record(self.watcher, i) for i in range(3)])
+        self.watcher.save_updates(self.watcher.media_index)
+        os.replace(self.journal_path, self.compacting_path) # 壓實輪替日誌後、寫出快照前當機
+        add_records(self.watcher, [make_record(self.watcher, i) for i in range(3, 5)])
+        self.watcher.save_updates(self.watcher.media_index) # 新紀錄寫入新的日誌
+        self.assertTrue(os.path.exists(self.compacting_path)); self.assertEqual(len(self.read_journal_lines()), 2)
+        expected = self.newest_rows(self.watcher)
+
+        restarted = load_watcher(self.repo)
+        self.assertEqual(self.newest_rows(restarted), expected) # 兩個日誌都重播
+
+        restarted.flush_updates_on_shutdown() # 停止時壓實：合併兩個日誌後寫出快照
+        self.assertFalse(os.path.exists(self.compacting_path)); self.assertFalse(os.path.exists(self.journal_path))
+        with open(self.json_path, 'r', encoding='utf-8') as f: snapshot = json.load(f)
+        self.assertEqual([item['filename'] for item in snapshot], [row[0] for row in expected])
+
+        reloaded = load_watcher(self.repo)
+        self.assertEqual(self.newest_rows(reloaded), expected)
+        self.assertEqual(reloaded.journal_line_count, 0)
+
+    def test_compaction_keeps_records_added_after_rotation(self):
+        add_records(self.watcher, [make_record(self.watcher, i) for i in range(3)])
+        self.watcher.save_updates(self.watcher.media_index)
+        self.watcher.compact_updates(self.watcher.media_index)
+        add_records(self.watcher, [make_record(self.watcher, 3)])
+        self.watcher.save_updates(self.watcher.media_index)
+        self.assertEqual(len(self.read_journal_lines()), 1) # 壓實後的新紀錄只在新日誌中
+        restarted = load_watcher(self.repo)
+        self.assertEqual(self.newest_rows(restarted), self.newest_rows(self.watcher))
+
+if __name__ == '__main__':
+    unittest.main()
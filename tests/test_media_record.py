@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""MediaRecord 與 JSON 的往返轉換：日誌、快照與 SQLite 匯出都依賴 from_json(to_json()) 不失真"""
+import json
+import shutil
+import tempfile
+import unittest
+
+from watcher_loader import load_watcher
+
+class MediaRecordTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.repo = tempfile.mkdtemp(prefix='watcher_record_')
+        cls.watcher = load_watcher(cls.repo)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.repo, ignore_errors=True)
+
+    def item(self, **fields):
+        item = {'filename': '電影 A.mkv', 'absolute_path': '/media/movie/電影 A.mkv', 'relative_path': '電影 A/電影 A.mkv',
+                'timestamp': '2024-03-05T06:07:08.123456', 'category': 'movie', 'tmdb_id': None, 'tmdb_url': None, 'plot': None}
+        item.update(fields)
+        return item
+
+    def assert_round_trip(self, item):
+        record = self.watcher.MediaRecord.from_json(item)
+        self.assertEqual(record.to_json(), item)
+        restored = self.watcher.MediaRecord.from_json(json.loads(json.dumps(record.to_json(), ensure_ascii=False)))
+        self.assertEqual(restored.to_row(), record.to_row())
+        return record
+
+    def test_derived_tmdb_url_is_not_stored(self):
+        record = self.assert_round_trip(self.item(tmdb_id=603, tmdb_url='https://www.themoviedb.org/movie/603', plot='劇情簡介'))
+        self.assertIsNone(record.tmdb_url_override)
+        tv_record = self.assert_round_trip(self.item(category='tvshow', tmdb_id=1399, tmdb_url='https://www.themoviedb.org/tv/1399'))
+        self.assertIsNone(tv_record.tmdb_url_override)
+
+    def test_tmdb_url_override_round_trips(self):
+        record = self.assert_round_trip(self.item(tmdb_id=603, tmdb_url='https://www.themoviedb.org/movie/604'))
+        self.assertEqual(record.tmdb_url_override, 'https://www.themoviedb.org/movie/604')
+        record = self.assert_round_trip(self.item(tmdb_url='https://example.com/a')) # 沒有 tmdb_id 但有連結
+        self.assertEqual(record.tmdb_url, 'https://example.com/a')
+
+    def test_explicit_missing_link_round_trips(self):
+        record = self.assert_round_trip(self.item(tmdb_id=603, tmdb_url=None)) # 有 tmdb_id 但明確沒有連結
+        self.assertEqual(record.tmdb_url_override, ''); self.assertIsNone(record.tmdb_url)
+        self.assertEqual(self.watcher.MediaRecord.from_json(self.item(tmdb_id=603, tmdb_url='')).to_row(), record.to_row())
+
+    def test_empty_plot_and_timestamps(self):
+        record = self.assert_round_trip(self.item(plot=None))
+        self.assertIsNone(record.plot)
+        self.assertEqual(record.timestamp.microsecond, 123456)
+        self.assert_round_trip(self.item(timestamp='1969-12-31T23:59:59.999999')) # 原點之前的時間戳為負數
+        self.assertEqual(self.watcher.MediaRecord.from_json(self.item(timestamp='2024-03-05T06:07:08')).to_json()['timestamp'], '2024-03-05T06:07:08')
+
+    def test_missing_fields_use_defaults(self):
+        record = self.watcher.MediaRecord.from_json({'timestamp': '2024-01-01T00:00:00'})
+        self.assertEqual((record.filename, record.absolute_path, record.relative_path, record.category), ('N/A', '', 'N/A', 'unknown'))
+        self.assertEqual(self.watcher.MediaRecord.from_json(record.to_json()).to_row(), record.to_row())
+
+if __name__ == '__main__':
+    unittest.main()
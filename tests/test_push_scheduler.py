@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""PushScheduler 的推送、合併多個 commit、失敗重試與退避狀態
+
+把 watcher 複製到暫存 repo 後載入 (REPO_PATH 取自腳本所在目錄，GDLogs / GDState 也寫在暫存目錄)，
+遠端為本機的 git init --bare。第一次推送時遠端尚不存在而失敗，建立後由背景執行緒在退避期滿重試成功。
+
+用法:
+    python -m unittest discover -s tests
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+import importlib.util
+
+WATCHER_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'watcher_v9.1.6.py')
+BACKOFF_INITIAL_SECONDS = 0.5 # 測試用的首次重試等待
+MIN_INTERVAL_SECONDS = 1 # 測試用的兩次 push 最短間隔
+
+def git(cwd, *args):
+    return subprocess.run(['git'] + list(args), cwd=cwd, capture_output=True, text=True, check=True, encoding='utf-8').stdout.strip()
+
+def wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate(): return True
+        time.sleep(0.02)
+    return False
+
+class PushSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_root = tempfile.mkdtemp(prefix='push_scheduler_')
+        self.repo = os.path.join(self.temp_root, 'repo'); self.remote = os.path.join(self.temp_root, 'remote.git')
+        os.makedirs(self.repo)
+        git(self.repo, 'init', '-q', '-b', 'main')
+        git(self.repo, 'config', 'user.email', 'watcher@example.com'); git(self.repo, 'config', 'user.name', 'watcher')
+        with open(os.path.join(self.repo, 'index.html'), 'w', encoding='utf-8') as f: f.write('<html></html>')
+        git(self.repo, 'add', 'index.html'); git(self.repo, 'commit', '-q', '-m', 'init')
+        git(self.repo, 'remote', 'add', 'origin', self.remote) # 遠端目錄尚未建立，第一次推送必定失敗
+        shutil.copy(WATCHER_SOURCE, os.path.join(self.repo, 'watcher.py'))
+        spec = importlib.util.spec_from_file_location(f"watcher_{os.path.basename(self.temp_root)}", os.path.join(self.repo, 'watcher.py'))
+        self.watcher = importlib.util.module_from_spec(spec); spec.loader.exec_module(self.watcher)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_root, ignore_errors=True)
+
+    def test_failed_push_backs_off_then_retries(self):
+        scheduler = self.watcher.PushScheduler(remote='origin', branch='main', min_interval=0, backoff_initial=BACKOFF_INITIAL_SECONDS, backoff_max=5)
+        scheduler.start()
+        requested_at = time.time(); scheduler.request()
+        self.assertTrue(wait_for(lambda: scheduler.get_stats()['failures'] == 1))
+        stats = scheduler.get_stats()
+        self.assertTrue(stats['pending']); self.assertEqual(stats['consecutive_failures'], 1); self.assertEqual(stats['pushes'], 0)
+        self.assertTrue(stats['last_error'])
+        self.assertGreater(stats['next_attempt_in'], 0); self.assertLessEqual(stats['next_attempt_in'], BACKOFF_INITIAL_SECONDS)
+        self.assertEqual(scheduler.requested_commits, 1) # 失敗的推送放回待推送計數
+
+        git(self.temp_root, 'init', '-q', '--bare', self.remote)
+        self.assertTrue(wait_for(lambda: scheduler.get_stats()['pushes'] == 1))
+        self.assertGreaterEqual(time.time() - requested_at, BACKOFF_INITIAL_SECONDS) # 退避期滿前不會重試
+        stats = scheduler.get_stats()
+        self.assertFalse(stats['pending']); self.assertEqual(stats['consecutive_failures'], 0); self.assertEqual(stats['failures'], 1)
+        self.assertEqual(stats['coalesced_commits'], 1)
+        self.assertEqual(git(self.remote, 'rev-parse', 'refs/heads/main'), git(self.repo, 'rev-parse', 'HEAD'))
+
+    def test_backoff_doubles_up_to_max(self):
+        scheduler = self.watcher.PushScheduler(remote='origin', branch='main', min_interval=0, backoff_initial=2, backoff_max=5)
+        scheduler.request()
+        expected_backoffs = [2, 4, 5]
+        for attempt, expected in enumerate(expected_backoffs, start=1):
+            started = time.time()
+            self.assertFalse(scheduler.push_now())
+            self.assertEqual(scheduler.consecutive_failures, attempt)
+            self.assertAlmostEqual(scheduler.next_attempt_time - started, expected, delta=1)
+        self.assertEqual(scheduler.requested_commits, 1) # 多次失敗不會重複累加同一個 commit
+        git(self.temp_root, 'init', '-q', '--bare', self.remote)
+        self.assertTrue(scheduler.push_now())
+        self.assertEqual(scheduler.consecutive_failures, 0); self.assertEqual(scheduler.get_stats()['failures'], len(expected_backoffs))
+        self.assertTrue(scheduler.push_now()) # 沒有待推送的 commit 時直接回傳成功
+
+    def test_commits_within_min_interval_coalesce_into_one_push(self):
+        git(self.temp_root, 'init', '-q', '--bare', self.remote)
+        push_log = os.path.join(self.temp_root, 'pushes.log') # 遠端每收到一次 push 記一行
+        hook_path = os.path.join(self.remote, 'hooks', 'post-receive')
+        with open(hook_path, 'w', encoding='utf-8') as f: f.write(f"#!/bin/sh\necho received >> '{push_log}'\n")
+        os.chmod(hook_path, 0o755)
+        scheduler = self.watcher.PushScheduler(remote='origin', branch='main', min_interval=MIN_INTERVAL_SECONDS, backoff_initial=BACKOFF_INITIAL_SECONDS, backoff_max=5)
+        scheduler.start()
+        scheduler.request()
+        self.assertTrue(wait_for(lambda: scheduler.get_stats()['pushes'] == 1))
+        first_push_at = time.time(); os.remove(push_log); coalesced_before = scheduler.get_stats()['coalesced_commits']
+
+        commit_count = 4
+        for i in range(commit_count): # 全部在 min_interval 內完成
+            with open(os.path.join(self.repo, 'index.html'), 'w', encoding='utf-8') as f: f.write(f'<html>{i}</html>')
+            git(self.repo, 'commit', '-q', '-a', '-m', f'update {i}')
+            scheduler.request()
+        self.assertEqual(scheduler.pending_commit_count(), commit_count)
+        self.assertTrue(wait_for(lambda: scheduler.get_stats()['pushes'] == 2))
+        self.assertGreaterEqual(time.time() - first_push_at, MIN_INTERVAL_SECONDS * 0.9) # 兩次 push 至少間隔 min_interval
+        time.sleep(0.2) # 確認沒有多餘的 push
+        with open(push_log, 'r', encoding='utf-8') as f: self.assertEqual(len(f.read().splitlines()), 1)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['pushes'], 2); self.assertEqual(stats['coalesced_commits'] - coalesced_before, commit_count)
+        self.assertFalse(stats['pending']); self.assertEqual(scheduler.requested_commits, 0); self.assertEqual(scheduler.pending_commit_count(), 0)
+        self.assertEqual(git(self.remote, 'rev-parse', 'refs/heads/main'), git(self.repo, 'rev-parse', 'HEAD'))
+
+if __name__ == '__main__':
+    unittest.main()
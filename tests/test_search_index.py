@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""archive 分片搜尋索引：差值編碼的倒排表、n-gram 交集、繁簡混合檔名與跨分片的文件編號
+
+以下的解碼與查詢與 archive_script.js 的 getPostings / searchWithIndex / searchCategoryIndexes 相同，
+查詢字串以 normalize_search_text 正規化 (即 search_normalize.js 的 toTrad + 小寫)。
+"""
+import json
+import shutil
+import tempfile
+import unittest
+
+from watcher_loader import load_watcher
+
+def decode_postings(deltas):
+    doc_ids = []; previous = 0
+    for delta in deltas: previous += delta; doc_ids.append(previous)
+    return doc_ids
+
+def intersect_sorted(a, b):
+    result = []; i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]: result.append(a[i]); i += 1; j += 1
+        elif a[i] < b[j]: i += 1
+        else: j += 1
+    return result
+
+class SearchIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.repo = tempfile.mkdtemp(prefix='watcher_search_')
+        cls.watcher = load_watcher(cls.repo)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.repo, ignore_errors=True)
+
+    def shard(self, *relative_paths):
+        return [{'filename': path.rsplit('/', 1)[-1], 'relative_path': path, 'category': 'movie'} for path in relative_paths]
+
+    def search(self, index, term):
+        query = self.watcher.normalize_search_text(term); n = index['n']
+        if len(query) < n: return [doc_id for doc_id, text in enumerate(index['docs']) if query in text]
+        lists = []
+        for gram in {query[i:i + n] for i in range(len(query) - n + 1)}:
+            if gram not in index['postings']: return []
+            lists.append(decode_postings(index['postings'][gram]))
+        lists.sort(key=len)
+        candidates = lists[0]
+        for doc_ids in lists[1:]: candidates = intersect_sorted(candidates, doc_ids)
+        return [doc_id for doc_id in candidates if query in index['docs'][doc_id]]
+
+    def search_category(self, indexes, term):
+        hits = []; offset = 0
+        for index in indexes:
+            hits.extend(offset + doc_id for doc_id in self.search(index, term))
+            offset += len(index['docs'])
+        return hits
+
+    def test_postings_are_delta_encoded(self):
+        index = self.watcher.build_search_index(self.shard('Alpha 電影.mkv', 'beta.mkv', 'ALPHA 2.mkv', 'gamma.mkv', 'alphabet.mkv'))
+        self.assertEqual(index['n'], self.watcher.SEARCH_NGRAM_SIZE)
+        self.assertEqual(index['postings']['al'], [0, 2, 2]) # 文件 0, 2, 4
+        self.assertEqual(decode_postings(index['postings']['al']), [0, 2, 4])
+        for gram, deltas in index['postings'].items():
+            doc_ids = decode_postings(deltas)
+            self.assertEqual(doc_ids, sorted(set(doc_ids)))
+            self.assertTrue(all(gram in index['docs'][doc_id] for doc_id in doc_ids))
+        self.assertNotIn('ts_map', index) # 對照表由 search_normalize.js 提供
+        self.assertEqual(json.loads(json.dumps(index, ensure_ascii=False)), index)
+
+    def test_simplified_and_traditional_queries_match_either_script(self):
+        index = self.watcher.build_search_index(self.shard('權力遊戲/第一季.mkv', '电视剧 数据.mkv', '權力與榮耀.mkv', 'Other.mkv'))
+        self.assertEqual(index['docs'][1], '電視劇 數據.mkv') # 文件以小寫繁體儲存
+        self.assertEqual(self.search(index, '权力'), [0, 2]) # 簡體查詢命中繁體檔名
+        self.assertEqual(self.search(index, '權力遊戲'), [0])
+        self.assertEqual(self.search(index, '電視劇'), [1]) # 繁體查詢命中簡體檔名
+        self.assertEqual(self.search(index, '电视剧 数据'), [1])
+        self.assertEqual(self.search(index, 'OTHER'), [3])
+        self.assertEqual(self.search(index, '力'), [0, 2]) # 比 n-gram 短的查詢直接比對文字
+        self.assertEqual(self.search(index, '權遊'), []) # 各 n-gram 都不存在時無結果
+        self.assertEqual(self.search(index, '力遊戲與'), []) # 交集後仍須確認包含整個查詢字串
+
+    def test_doc_ids_offset_by_preceding_shards(self):
+        newer = self.watcher.build_search_index(self.shard('權力遊戲 S02.mkv', 'Other.mkv'))
+        older = self.watcher.build_search_index(self.shard('a.mkv', 'b.mkv', '权力游戏 S01.mkv'))
+        self.assertEqual(self.search(older, '權力'), [2])
+        self.assertEqual(self.search_category([newer, older], '權力'), [0, 4]) # 第二個分片的編號加上第一個分片的筆數
+        self.assertEqual(self.search_category([newer, older], 'mkv'), list(range(5)))
+
+    def test_magazines_are_searched_by_filename(self):
+        records = [{'filename': '雜誌 2024.pdf', 'relative_path': '杂志/雜誌 2024.pdf', 'category': 'magazine'}]
+        index = self.watcher.build_search_index(records)
+        self.assertEqual(index['docs'], ['雜誌 2024.pdf'])
+
+if __name__ == '__main__':
+    unittest.main()
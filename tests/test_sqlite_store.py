@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""SQLite 儲存後端：依正規化路徑去重、依索引取最新 N 筆、匯出 media_updates.json"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from watcher_loader import load_watcher, make_record, add_records
+
+SQLITE_OVERRIDES = {'STORAGE_BACKEND': 'sqlite', 'JOURNAL_COMPACT_THRESHOLD': 5}
+
+class SqliteStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix='watcher_sqlite_')
+        self.watcher = load_watcher(self.repo, SQLITE_OVERRIDES)
+        self.assertIsNotNone(self.watcher.media_store)
+        self.json_path = os.path.join(self.repo, self.watcher.UPDATES_JSON_FILE)
+
+    def tearDown(self):
+        for watcher in [self.watcher] + getattr(self, 'restarted', []):
+            if watcher.media_store is not None: watcher.media_store.conn.close()
+        shutil.rmtree(self.repo, ignore_errors=True)
+
+    def restart(self, overrides=SQLITE_OVERRIDES):
+        self.restarted = getattr(self, 'restarted', []) + [load_watcher(self.repo, overrides)]
+        return self.restarted[-1]
+
+    def read_json(self):
+        with open(self.json_path, 'r', encoding='utf-8') as f: return json.load(f)
+
+    def test_dedup_by_normalized_path(self):
+        self.assertEqual(add_records(self.watcher, [make_record(self.watcher, 0), make_record(self.watcher, 1)]), 2)
+        duplicate = make_record(self.watcher, 0, absolute_path='/MEDIA/Movie/ITEM0.MKV')
+        self.assertFalse(self.watcher.record_new_update(duplicate, self.watcher.PathKey.of(duplicate.absolute_path))) # 仍在待寫入集合中
+        self.watcher.save_updates(self.watcher.media_index)
+        self.assertEqual(self.watcher.media_store.count(), 2)
+        self.assertFalse(self.watcher.record_new_update(duplicate, self.watcher.PathKey.of(duplicate.absolute_path))) # 已寫入資料庫
+        self.assertEqual(self.watcher.media_store.insert_many([duplicate, make_record(self.watcher, 2)]), 1) # 唯一索引忽略重複路徑
+        restarted = self.restart()
+        self.assertEqual(len(restarted.media_index), 3)
+        self.assertIn(restarted.PathKey.of('/media/MOVIE/item1.mkv'), restarted.media_index)
+
+    def test_newest_n_merges_stored_and_pending(self):
+        categories = ['movie', 'tvshow', 'anime', 'movie', 'tvshow', 'movie', 'anime', 'movie']
+        records = [make_record(self.watcher, i, category) for i, category in enumerate(categories)]
+        add_records(self.watcher, records[:5]); self.watcher.save_updates(self.watcher.media_index)
+        add_records(self.watcher, records[5:]) # 尚未寫入資料庫
+        newest_first = sorted(records, key=lambda record: record.timestamp_us, reverse=True)
+        self.assertEqual([record.filename for record in self.watcher.media_index.newest(3)], [record.filename for record in newest_first[:3]])
+        self.assertEqual([record.filename for record in self.watcher.media_index.newest(2, 'movie')], ['item7.mkv', 'item5.mkv'])
+        self.assertEqual([record.filename for record in self.watcher.media_store.newest(2, 'movie')], ['item3.mkv', 'item0.mkv']) # 只有已寫入的
+        self.assertEqual(len(self.watcher.media_index.newest()), len(records))
+        self.assertEqual([record.filename for record in self.watcher.get_latest_updates(self.watcher.media_index, 4)], [record.filename for record in newest_first[:4]])
+
+    def test_json_exported_at_threshold_and_shutdown(self):
+        add_records(self.watcher, [make_record(self.watcher, i) for i in range(5)])
+        self.watcher.save_updates(self.watcher.media_index) # 達門檻：背景匯出
+        self.watcher.compaction_thread.join()
+        self.assertEqual([item['filename'] for item in self.read_json()], [f'item{i}.mkv' for i in reversed(range(5))])
+        self.assertEqual(self.watcher.journal_line_count, 0)
+
+        add_records(self.watcher, [make_record(self.watcher, 5)])
+        self.watcher.save_updates(self.watcher.media_index)
+        self.assertEqual(len(self.read_json()), 5) # 未達門檻不匯出
+        self.watcher.flush_updates_on_shutdown()
+        self.assertEqual(len(self.read_json()), 6)
+        self.assertEqual(self.watcher.media_store.exported_count, 6)
+        self.assertEqual(self.restart().journal_line_count, 0)
+        journal_watcher = self.restart({}) # 改回 JSON 日誌後端時直接讀取匯出的快照
+        self.assertEqual([record.to_row() for record in journal_watcher.media_index.newest()], [record.to_row() for record in self.watcher.media_index.newest()])
+
+    def test_unexported_rows_after_crash_are_exported_on_shutdown(self):
+        add_records(self.watcher, [make_record(self.watcher, i) for i in range(2)])
+        self.watcher.save_updates(self.watcher.media_index) # 寫入資料庫後當機，未匯出
+        restarted = self.restart()
+        self.assertEqual(restarted.journal_line_count, 2)
+        restarted.flush_updates_on_shutdown()
+        self.assertEqual([item['filename'] for item in self.read_json()], ['item1.mkv', 'item0.mkv'])
+
+if __name__ == '__main__':
+    unittest.main()
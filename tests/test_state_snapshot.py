@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""二進位狀態快照：壓實後還原，media_updates.json 被改動時拒用並重新解析
+
+快照檔頭記錄來源 JSON 的 [大小, 修改時間 ns, sha1]。大小或 sha1 不同即拒用；只有修改時間不同 (內容雜湊相同，
+例如 checkout 或複製時被 touch) 則刻意沿用，不必為相同內容重新解析。
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from watcher_loader import load_watcher, make_record, add_records
+
+class StateSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp(prefix='watcher_snapshot_')
+        self.watcher = load_watcher(self.repo)
+        self.json_path = os.path.join(self.repo, self.watcher.UPDATES_JSON_FILE)
+        add_records(self.watcher, [make_record(self.watcher, i, category) for i, category in enumerate(['movie', 'tvshow', 'anime', 'movie'])])
+        self.watcher.save_updates(self.watcher.media_index)
+        self.watcher.compact_updates(self.watcher.media_index) # 寫出 JSON 與對應的狀態快照
+        self.expected = self.newest_rows(self.watcher)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo, ignore_errors=True)
+
+    def newest_rows(self, watcher):
+        return [record.to_row() for record in watcher.media_index.newest()]
+
+    def snapshot_for_current_json(self, watcher):
+        return watcher.load_state_snapshot(watcher.read_updates_source(self.json_path)[1])
+
+    def rewrite_json(self, transform):
+        with open(self.json_path, 'r', encoding='utf-8') as f: text = f.read()
+        with open(self.json_path, 'w', encoding='utf-8') as f: f.write(transform(text))
+
+    def test_snapshot_restored_after_compaction(self):
+        index = self.snapshot_for_current_json(self.watcher)
+        self.assertIsNotNone(index)
+        self.assertEqual([record.to_row() for record in index.newest()], self.expected)
+        self.assertIn(self.watcher.PathKey.of('/MEDIA/movie/item0.mkv'), index) # 路徑索引一併還原
+        self.assertEqual(self.newest_rows(load_watcher(self.repo)), self.expected)
+
+    def test_rejected_when_size_changes(self):
+        self.rewrite_json(lambda text: json.dumps(json.loads(text)[1:], ensure_ascii=False, indent=4))
+        self.assertIsNone(self.snapshot_for_current_json(self.watcher))
+        restarted = load_watcher(self.repo)
+        self.assertEqual(self.newest_rows(restarted), self.expected[1:]) # 依 JSON 重新解析，而非沿用快照
+        self.assertIsNotNone(self.snapshot_for_current_json(restarted)) # 並以新內容重建快照
+
+    def test_rejected_when_content_changes_with_same_size(self):
+        original_size = os.path.getsize(self.json_path)
+        self.rewrite_json(lambda text: text.replace('item0.mkv', 'itemX.mkv'))
+        self.assertEqual(os.path.getsize(self.json_path), original_size)
+        self.assertIsNone(self.snapshot_for_current_json(self.watcher)) # 大小與修改時間之外仍比對 sha1
+        restarted = load_watcher(self.repo)
+        self.assertIn('itemX.mkv', [row[0] for row in self.newest_rows(restarted)])
+        self.assertNotIn('item0.mkv', [row[0] for row in self.newest_rows(restarted)])
+
+    def test_mtime_only_change_keeps_snapshot(self):
+        st = os.stat(self.json_path)
+        os.utime(self.json_path, ns=(st.st_atime_ns, st.st_mtime_ns + 5 * 10**9))
+        index = self.snapshot_for_current_json(self.watcher)
+        self.assertIsNotNone(index) # 內容雜湊相同：刻意沿用
+        self.assertEqual([record.to_row() for record in index.newest()], self.expected)
+
+    def test_rejected_when_snapshot_version_differs(self):
+        snapshot_path = os.path.join(self.watcher.state_directory, self.watcher.STATE_SNAPSHOT_FILE)
+        source_signature = self.watcher.read_updates_source(self.json_path)[1]
+        self.watcher.STATE_SNAPSHOT_VERSION += 1
+        self.assertIsNone(self.watcher.load_state_snapshot(source_signature))
+        self.assertTrue(os.path.exists(snapshot_path))
+
+if __name__ == '__main__':
+    unittest.main()
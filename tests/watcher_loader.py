@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""測試共用：把 watcher 複製到暫存 repo 後載入
+
+REPO_PATH 取自腳本所在目錄，GDLogs / GDState 與所有輸出都寫在暫存目錄。設定常數 (例如 STORAGE_BACKEND) 在載入時
+就會決定開啟哪個儲存後端，因此以改寫原始碼的方式覆寫；同一個 repo 可重複載入，模擬程式重新啟動。
+"""
+import os
+import re
+import datetime
+import importlib.util
+
+WATCHER_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'watcher_v9.1.6.py')
+
+def load_watcher(repo, overrides=None):
+    """overrides: {常數名稱: 值}，取代原始碼中該常數的頂層賦值"""
+    with open(WATCHER_SOURCE, 'r', encoding='utf-8') as f: code = f.read()
+    for name, value in (overrides or {}).items():
+        code, count = re.subn(rf"^{name} = [^#\n]*", f"{name} = {value!r} ", code, count=1, flags=re.M)
+        if count != 1: raise KeyError(name)
+    watcher_path = os.path.join(repo, 'watcher.py')
+    with open(watcher_path, 'w', encoding='utf-8') as f: f.write(code)
+    load_watcher.generation += 1 # 每次載入都是獨立的模組
+    spec = importlib.util.spec_from_file_location(f"watcher_{os.path.basename(repo)}_{load_watcher.generation}", watcher_path)
+    watcher = importlib.util.module_from_spec(spec); spec.loader.exec_module(watcher)
+    return watcher
+load_watcher.generation = 0
+
+def make_record(watcher, index, category='movie', timestamp=None, **fields):
+    """以 JSON 格式建立一筆測試紀錄"""
+    item = {'filename': f'item{index}.mkv', 'absolute_path': f'/media/{category}/Item{index}.mkv', 'relative_path': f'Item{index}.mkv',
+            'timestamp': (timestamp or datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=index)).isoformat(), 'category': category}
+    item.update(fields)
+    return watcher.MediaRecord.from_json(item)
+
+def add_records(watcher, records):
+    """與監視器相同的路徑：加入 media_index 並排入日誌，回傳實際加入的筆數"""
+    return sum(1 for record in records if watcher.record_new_update(record, watcher.PathKey.of(record.absolute_path)))
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
 import time
 import xml.etree.ElementTree as ET
 from watchdog.observers import Observer
@@ -8,10 +9,23 @@ import logging
 import subprocess
 import datetime
 import threading
-from collections import defaultdict
+import queue
+import heapq
+import bisect
+import math
+import itertools
+import concurrent.futures
+import tempfile
+import stat
+from collections import defaultdict, OrderedDict, deque
 from itertools import groupby
 import json
-# import re # escape_html 函數中未使用 re
+import re
+import hashlib
+import pickle
+import io
+import sqlite3
+import http.server
 
 # --- 設定 ---
 # 透過此設定，讓程式能同時辨識 H 槽與 I 槽
@@ -34,82 +48,801 @@ PATH_CONFIG = [
 MONITORED_DIRECTORIES = [item['path'] for item in PATH_CONFIG]
 
 POLLING_INTERVAL_SECONDS = 300 
+POLLING_FULL_SWEEP_INTERVAL_SECONDS = 3600 # 增量輪詢之外，每隔此秒數完整重新列出所有目錄一次
+POLL_WORKER_COUNT = 10 # 平行掃描各監控根目錄的執行緒上限 (每個根目錄一個工作)
+POLL_MTIME_RACE_SECONDS = 2 # 目錄修改時間與上次列出時間相差不到此秒數時，下輪仍重新列出 (mtime 精度保護)
 TARGET_EXTENSIONS = ('.mkv', '.mp4', '.pdf') 
 OUTPUT_HTML_FILE = 'index.html'
 ARCHIVE_HTML_FILE = 'archive.html' 
 ARCHIVE_JS_FILE = 'archive_script.js' 
+ASSETS_DIRECTORY = 'assets' # 以內容雜湊命名的 CSS/JS 輸出目錄
+ARCHIVE_DATA_DIRECTORY = 'archive_data' # archive 頁面使用的分類 × 月份分片輸出目錄
+ARCHIVE_MANIFEST_FILE = 'manifest.json'
+SEARCH_NGRAM_SIZE = 2 # archive 靜態搜尋索引使用的 n-gram 長度
 UPDATES_JSON_FILE = 'media_updates.json'
+UPDATES_JOURNAL_FILE = 'media_updates.journal.jsonl' # 位於 GDState 目錄下的 append-only 日誌
+JOURNAL_COMPACT_THRESHOLD = 500 # 日誌累積多少行 (SQLite 後端為新增筆數) 後於背景壓實 (匯出) 回 media_updates.json
+STORAGE_BACKEND = 'journal' # 'journal' (JSON 快照 + 日誌) 或 'sqlite'
+SQLITE_DB_FILE = 'media_updates.db' # STORAGE_BACKEND = 'sqlite' 時使用，位於 GDState 目錄下
+BUILD_MANIFEST_FILE = 'build_manifest.json' # 位於 GDState 目錄下，記錄各輸出的輸入/輸出雜湊
+STATE_SNAPSHOT_FILE = 'media_updates.state.pickle' # 位於 GDState 目錄下，啟動時代替解析 media_updates.json 的二進位快照
 ITEMS_PER_PAGE = 30 
 GIT_ACTION_DELAY_SECONDS = 15
+GIT_PUSH_REMOTE = 'origin'
+GIT_PUSH_BRANCH = 'main'
+GIT_PUSH_MIN_INTERVAL_SECONDS = 60 # 兩次 push 之間的最短間隔；期間的 commit 合併為一次 push
+GIT_PUSH_BACKOFF_INITIAL_SECONDS = 30 # push 失敗後的首次重試等待，之後每次加倍
+GIT_PUSH_BACKOFF_MAX_SECONDS = 1800
+GIT_PUBLISH_MODE = 'targeted' # 'targeted' 只暫存本程式寫出的檔案並以 git plumbing 建立 commit；'add_all' 為舊版的 git add .；
+                               # 'output_branch' 把輸出檔 commit 到獨立的輸出分支 (定期壓縮歷史並強制推送，GitHub Pages 需改用此分支)
+GIT_OUTPUT_BRANCH = 'gh-pages' # GIT_PUBLISH_MODE = 'output_branch' 時使用的分支
+GIT_OUTPUT_SQUASH_COMMITS = 50 # 輸出分支累積超過此 commit 數時，下次發布壓縮成單一 commit
+GIT_MAINTENANCE_INTERVAL_SECONDS = 86400 # 輸出分支模式下執行 reflog expire + gc 的最短間隔
+GIT_GC_PRUNE_GRACE = '1.hour.ago' # gc 只清除早於此時間的無參照物件，其他 git 程序剛寫入的物件不會被刪除
 DEFAULT_CATEGORY = 'tvshow'
 MAX_ITEMS_ON_INDEX_PAGE = 5000
 POLLING_BATCH_SAVE_COUNT = 50
+INGEST_WORKER_COUNT = 4 # 處理檔案事件的背景工作執行緒數量 (監視器執行緒只負責排入佇列)
+INGEST_QUEUE_MAXSIZE = 1000 # 待處理事件佇列上限；佇列已滿時略過事件，交由定期輪詢補上
+SETTLE_INITIAL_INTERVAL_SECONDS = 0.2 # 寫入完成偵測：第一次複查的間隔
+SETTLE_MAX_INTERVAL_SECONDS = 5 # 檔案持續變動時，複查間隔逐次加倍直到此上限
+SETTLE_STABLE_SECONDS = 0.5 # 大小與修改時間連續維持不變多久即視為寫入完成
+SETTLE_DIRECTORY_STABLE_SECONDS = 2 # collection 目錄的子項目由雲端硬碟陸續同步，穩定期需較長
+SETTLE_OLD_FILE_SECONDS = 10 # 首次檢查時修改時間已早於此秒數的項目 (例如輪詢補上的舊檔案) 不必等穩定期，下一次複查簽章未變即視為完成
+SETTLE_MAX_WAIT_SECONDS = 3600 # 最長等待時間；超過後記錄警告並照常處理
+NFO_SETTLE_MAX_WAIT_SECONDS = 30 # 等待 NFO 寫入完成的上限
+EVENT_COALESCE_WINDOW_SECONDS = 1.0 # 同一路徑在此時間窗內的重複事件合併為一筆
+EVENT_COALESCE_INTERVAL_SECONDS = 0.5 # 事件合併層整批放行的週期
+COLLECTION_PENDING_MAX_SECONDS = 7200 # collection 目錄事件視為「處理中」的上限 (期間略過其底下的事件)
+TRIGGER_COALESCE_SECONDS = 2 # 事件觸發的儲存/發布要求在此秒數內合併為一次
+TEMP_FILE_PREFIXES = ('~$', '.') # 暫存檔與隱藏檔 (Office 鎖定檔、._ 中繼檔等)
+TEMP_FILE_SUFFIXES = ('.tmp', '.temp', '.part', '.partial', '.crdownload', '.download', '.!qb', '~')
+NFO_CACHE_MAX_ENTRIES = 512 # parse_nfo 結果的 LRU 快取上限 (以路徑、修改時間、大小為鍵)
+DIR_LISTING_CACHE_TTL_SECONDS = 10 # 目錄清單快取有效秒數 (監視器事件會提前使其失效)
+DIR_LISTING_CACHE_MAX_ENTRIES = 2048
+FRESHNESS_WINDOW_SIZE = 1000 # 以最近多少個已推送項目滾動計算新鮮度 p50/p95/p99
+FRESHNESS_MAX_TRACES = 20000 # 同時追蹤中的項目上限 (超過時捨棄最舊的追蹤)
+FRESHNESS_LOG_FILE = 'freshness.jsonl' # 位於 GDLogs 下，每個推送完成的項目一行延遲分解
+METRICS_PORT = None # 設為埠號 (例如 9108) 時於本機提供 Prometheus 文字格式的 /metrics；None 為停用
+METRICS_BIND_ADDRESS = '127.0.0.1'
 
 # --- 全域變數與初始化 ---
 git_timer = None
 # last_poll_time 初始化放在主程式區塊
 git_update_triggered = False 
+trigger_lock = threading.Lock() # 多個工作執行緒可能同時觸發儲存與 Git 計時器
 REPO_PATH = os.path.dirname(os.path.abspath(__file__))
 log_directory = os.path.join(REPO_PATH, 'GDLogs')
 if not os.path.exists(log_directory): os.makedirs(log_directory)
+state_directory = os.path.join(REPO_PATH, 'GDState') # 本機狀態檔 (不發布)
+if not os.path.exists(state_directory): os.makedirs(state_directory)
+# 產生的頁面、分片、assets 與 media_updates.json 寫入的目錄；輸出分支模式寫在 GDState 下 (不在主分支的工作目錄中)，
+# commit 時以此目錄作為 GIT_WORK_TREE，主分支不會出現未追蹤或已修改的輸出檔
+OUTPUT_DIRECTORY = os.path.join(state_directory, 'output_branch_tree') if GIT_PUBLISH_MODE == 'output_branch' else REPO_PATH
 log_file = os.path.join(log_directory, 'file_watcher.log')
 logging.basicConfig(filename=log_file, level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s',
                     encoding='utf-8', force=True)
 
-# --- 持久化函數 ---
+# --- 執行期指標 (Prometheus 文字格式，METRICS_PORT 啟用時由 /metrics 提供) ---
+# 不依賴 prometheus_client；計數在記憶體中累加，只有抓取時才組合輸出。
+metrics_registry = []
+METRIC_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def escape_metric_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_metric_labels(label_names, label_values, extra_labels=()):
+    pairs = [f'{name}="{escape_metric_label(value)}"' for name, value in list(zip(label_names, label_values)) + list(extra_labels)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    """指標基底：依標籤值分別記錄，建立時自動登記到 metrics_registry"""
+    metric_type = 'untyped'
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name; self.help_text = help_text; self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values = {} # 標籤值 tuple -> 數值 (直方圖為 [各桶計數, 總和, 次數])
+        metrics_registry.append(self)
+
+    def label_key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render_samples(self):
+        with self.lock: return [f"{self.name}{format_metric_labels(self.label_names, key)} {value}" for key, value in self.values.items()]
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"] + self.render_samples()
+
+class CounterMetric(Metric):
+    metric_type = 'counter'
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self.lock: self.values[key] = self.values.get(key, 0) + amount
+
+class GaugeMetric(Metric):
+    """callback 不為 None 時於抓取當下取值；回傳數值，或 [(標籤 dict, 數值), ...]"""
+    metric_type = 'gauge'
+    def __init__(self, name, help_text, label_names=(), callback=None):
+        super().__init__(name, help_text, label_names); self.callback = callback
+
+    def set(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock: self.values[key] = value
+
+    def render_samples(self):
+        if self.callback is None: return super().render_samples()
+        value = self.callback()
+        if isinstance(value, (int, float)): return [f"{self.name} {value}"]
+        return [f"{self.name}{format_metric_labels(self.label_names, self.label_key(labels))} {sample_value}" for labels, sample_value in value]
+
+class HistogramMetric(Metric):
+    metric_type = 'histogram'
+    def __init__(self, name, help_text, label_names=(), buckets=METRIC_DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names); self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None: state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1; state[1] += value; state[2] += 1
+
+    def render_samples(self):
+        samples = []
+        with self.lock:
+            for key, (bucket_counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                    cumulative += bucket_count
+                    samples.append(f"{self.name}_bucket{format_metric_labels(self.label_names, key, [('le', '+Inf' if bound == float('inf') else repr(bound))])} {cumulative}")
+                samples.append(f"{self.name}_sum{format_metric_labels(self.label_names, key)} {total}")
+                samples.append(f"{self.name}_count{format_metric_labels(self.label_names, key)} {count}")
+        return samples
+
+def render_metrics():
+    lines = []
+    for metric in metrics_registry:
+        try: lines.extend(metric.render())
+        except Exception as e: logging.warning(f"輸出指標 {metric.name} 時發生錯誤: {e}")
+    return '\n'.join(lines) + '\n'
+
+metric_events_received = CounterMetric('watcher_events_received_total', '監視器收到的檔案系統事件數', ('event',))
+metric_items_ingested = CounterMetric('watcher_items_ingested_total', '新增到 media_index 的紀錄數', ('category',))
+metric_process_seconds = HistogramMetric('watcher_process_new_media_seconds', 'process_new_media 耗時 (含等待寫入完成)', ('result',))
+metric_nfo_parse_seconds = HistogramMetric('watcher_nfo_parse_seconds', 'NFO 讀取與解析耗時 (快取未命中時)')
+metric_nfo_parse_failures = CounterMetric('watcher_nfo_parse_failures_total', 'NFO 解析失敗次數', ('reason',))
+metric_poll_root_seconds = HistogramMetric('watcher_poll_root_seconds', '單一監控根目錄的輪詢耗時', ('root',))
+metric_poll_last_timestamp = GaugeMetric('watcher_poll_last_completed_timestamp_seconds', '最近一次輪詢完成的時間 (Unix 秒)')
+metric_render_seconds = HistogramMetric('watcher_render_seconds', '輸出產生與寫入耗時', ('artifact',))
+metric_output_bytes = GaugeMetric('watcher_output_bytes', '最近一次寫出的輸出檔大小', ('artifact',))
+metric_git_seconds = HistogramMetric('watcher_git_seconds', 'Git commit / push 耗時', ('operation',))
+metric_git_failures = CounterMetric('watcher_git_failures_total', 'Git commit / push 失敗次數', ('operation',))
+metric_git_last_success = GaugeMetric('watcher_git_last_success_timestamp_seconds', '最近一次成功的 Git commit / push 時間 (Unix 秒)', ('operation',))
+metric_freshness_seconds = HistogramMetric('watcher_freshness_seconds', '項目從首次發現到推送完成的總延遲', ('source',),
+                                           buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 21600))
+metric_freshness_segment_seconds = HistogramMetric('watcher_freshness_segment_seconds', '新鮮度各區段耗時 (以區段結束的階段命名)', ('segment',),
+                                                   buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+metric_start_time = GaugeMetric('watcher_start_time_seconds', '程式啟動時間 (Unix 秒)'); metric_start_time.set(time.time())
+
+
+published_paths_lock = threading.Lock()
+published_output_paths = set() # 自上次 commit 以來寫入或刪除的 repo 相對路徑 (以 / 分隔)
+
+def mark_published_output(path):
+    relative_path = os.path.relpath(os.path.abspath(path), OUTPUT_DIRECTORY)
+    if relative_path.startswith('..') or relative_path.split(os.sep)[0] in (os.path.basename(log_directory), os.path.basename(state_directory), '.git'): return
+    with published_paths_lock: published_output_paths.add(relative_path.replace(os.sep, '/'))
+
+def remove_published_output(path):
+    """刪除已發布的輸出檔，並記錄此路徑以便下次 commit 一併移除"""
+    try: os.remove(path)
+    except FileNotFoundError: pass
+    mark_published_output(path)
+
+# --- 串流原子寫入 ---
+# 產生器逐段寫入同目錄的暫存檔，fsync 後以 os.replace 原子替換；讀者與 git 不會看到寫到一半的檔案。
+class VolatileChunk(str):
+    """每次產生都不同、但不代表內容變更的輸出片段 (例如頁面生成時間)；不計入內容雜湊"""
+    __slots__ = ()
+
+PROCESS_UMASK = os.umask(0); os.umask(PROCESS_UMASK) # os.umask 只能以設定新值的方式讀取；在載入時 (尚無其他執行緒) 讀取一次
+
+def output_file_mode(output_path):
+    """新檔案沿用既有目標檔的權限，否則與 open() 建立的檔案相同 (0o666 扣除 umask)；mkstemp 的暫存檔固定為 0600"""
+    try: return stat.S_IMODE(os.stat(output_path).st_mode)
+    except FileNotFoundError: return 0o666 & ~PROCESS_UMASK
+
+def write_file_atomic(output_path, chunks, unchanged_hash=None):
+    """chunks 可為字串或產生字串片段的可迭代物件；回傳內容雜湊 (不含 VolatileChunk 片段)。
+    雜湊等於 unchanged_hash 且檔案已存在時丟棄暫存檔，不替換也不記錄為發布輸出"""
+    directory = os.path.dirname(output_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix='.tmp', dir=directory)
+    content_hash = hashlib.sha1()
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for chunk in ([chunks] if isinstance(chunks, str) else chunks):
+                f.write(chunk)
+                if not isinstance(chunk, VolatileChunk): content_hash.update(chunk.encode('utf-8'))
+            if unchanged_hash is not None and content_hash.hexdigest() == unchanged_hash and os.path.exists(output_path):
+                f.close(); os.remove(temp_path)
+                return unchanged_hash
+            f.flush(); os.fsync(f.fileno())
+        os.chmod(temp_path, output_file_mode(output_path))
+        for attempt in range(5):
+            try: os.replace(temp_path, output_path); break
+            except PermissionError: # Windows 上目標檔案可能暫時被其他程序開啟
+                if attempt == 4: raise
+                time.sleep(0.2 * (attempt + 1))
+    except BaseException:
+        try: os.remove(temp_path)
+        except OSError: pass
+        raise
+    mark_published_output(output_path)
+    return content_hash.hexdigest()
+
+def iter_json_array(records):
+    """輸出與 json.dump(records, indent=4, ensure_ascii=False) 相同格式的片段，一次一筆"""
+    first = True
+    for record in records:
+        yield ('[\n    ' if first else ',\n    ') + json.dumps(record, ensure_ascii=False, indent=4).replace('\n', '\n    ')
+        first = False
+    yield '[]' if first else '\n]'
+
+# --- 建置 manifest (輸入未變的輸出不重新產生，輸出內容未變的檔案不重寫) ---
+# 每個 artifact 記錄輸入雜湊與各輸出檔的內容雜湊、大小、修改時間；輸入相同且輸出檔未被動過時整段略過。
+# 輸入雜湊一律包含本程式原始碼的雜湊，修改樣板或設定後所有輸出自動重建。
+with open(os.path.abspath(__file__), 'rb') as watcher_source_file: WATCHER_SOURCE_HASH = hashlib.sha1(watcher_source_file.read()).hexdigest()
+build_stats = {'built': 0, 'skipped': 0}
+
+def load_build_manifest():
+    try:
+        with open(os.path.join(state_directory, BUILD_MANIFEST_FILE), 'r', encoding='utf-8') as f: manifest = json.load(f)
+        if manifest.get('version') == 1 and isinstance(manifest.get('artifacts'), dict): return manifest
+    except (OSError, json.JSONDecodeError, AttributeError): pass
+    return {'version': 1, 'artifacts': {}}
+
+def save_build_manifest():
+    try: write_file_atomic(os.path.join(state_directory, BUILD_MANIFEST_FILE), json.dumps(build_manifest, ensure_ascii=False, indent=1))
+    except OSError as e: logging.error(f"儲存建置 manifest 失敗: {e}")
+
+def compute_build_inputs(*parts):
+    """artifact 的輸入雜湊；parts 須可 JSON 序列化，且不可包含生成時間等每次都不同的值"""
+    return hashlib.sha1(json.dumps([WATCHER_SOURCE_HASH, *parts], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def get_output_signature(relative_path):
+    try: st = os.stat(os.path.join(OUTPUT_DIRECTORY, *relative_path.split('/')))
+    except OSError: return None
+    return [st.st_size, st.st_mtime_ns]
+
+def is_artifact_current(artifact_name, input_hash):
+    """輸入雜湊相同且所有輸出檔的大小與修改時間都與上次寫出時一致"""
+    entry = build_manifest['artifacts'].get(artifact_name)
+    if not entry or entry.get('inputs') != input_hash: return False
+    return all(get_output_signature(relative_path) == output.get('signature') for relative_path, output in entry.get('outputs', {}).items())
+
+def get_recorded_output_hash(artifact_name, relative_path):
+    return build_manifest['artifacts'].get(artifact_name, {}).get('outputs', {}).get(relative_path, {}).get('hash')
+
+def record_artifact(artifact_name, input_hash, output_hashes):
+    """output_hashes 為 {repo 相對路徑: 內容雜湊 (無法取得時為 None)}"""
+    build_manifest['artifacts'][artifact_name] = {
+        'inputs': input_hash, 'built_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'outputs': {relative_path: {'hash': content_hash, 'signature': get_output_signature(relative_path)} for relative_path, content_hash in output_hashes.items()},
+    }
+
+build_manifest = load_build_manifest()
+
+# --- 更新紀錄 ---
+# 每筆紀錄為 __slots__ 物件：分類與劇情文字經 sys.intern 共用同一字串，時間戳為 epoch 微秒整數，
+# tmdb_url 由分類與 tmdb_id 推導 (只有與推導結果不同的舊資料才另外保存)。JSON 格式與 media_updates.json 相同。
+TIMESTAMP_EPOCH = datetime.datetime(1970, 1, 1) # 時間戳為無時區的本機時間，以此為原點換算
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+def to_epoch_us(timestamp):
+    if timestamp.tzinfo is not None: timestamp = timestamp.astimezone().replace(tzinfo=None) # 轉為本機時間
+    return (timestamp - TIMESTAMP_EPOCH) // ONE_MICROSECOND
+
+def derive_tmdb_url(category, tmdb_id):
+    return f"https://www.themoviedb.org/{'movie' if category == 'movie' else 'tv'}/{tmdb_id}" if tmdb_id else None
+
+def shard_month(timestamp):
+    """archive 分片的月份 ('YYYY-MM')，與 ISO 時間戳的前 7 個字元相同"""
+    return f"{timestamp.year:04d}-{timestamp.month:02d}"
+
+def shard_month_range(month):
+    """月份分片涵蓋的 [起, 迄) 時間"""
+    year, month_no = map(int, month.split('-'))
+    return datetime.datetime(year, month_no, 1), datetime.datetime(year + month_no // 12, month_no % 12 + 1, 1)
+
+class MediaRecord:
+    """單筆更新紀錄；加入 media_index 後不再修改 (索引的排序與雜湊依賴此點)"""
+    __slots__ = ('filename', 'absolute_path', 'relative_path', 'timestamp_us', 'category', 'tmdb_id', 'plot', 'tmdb_url_override')
+
+    def __init__(self, filename='N/A', absolute_path='', relative_path='N/A', timestamp_us=0, category='unknown', tmdb_id=None, plot=None, tmdb_url_override=None):
+        # tmdb_url_override: None 表示依 tmdb_id 推導；'' 表示明確沒有連結
+        self.filename = filename; self.absolute_path = absolute_path; self.relative_path = relative_path
+        self.timestamp_us = timestamp_us; self.category = sys.intern(category); self.tmdb_id = tmdb_id
+        self.plot = sys.intern(plot) if plot else plot; self.tmdb_url_override = tmdb_url_override
+
+    @property
+    def timestamp(self):
+        return TIMESTAMP_EPOCH + datetime.timedelta(0, 0, self.timestamp_us)
+
+    @property
+    def tmdb_url(self):
+        if self.tmdb_url_override is None: return derive_tmdb_url(self.category, self.tmdb_id)
+        return self.tmdb_url_override or None
+
+    @classmethod
+    def from_json(cls, item):
+        category = item.get('category', 'unknown'); tmdb_id = item.get('tmdb_id', None); tmdb_url = item.get('tmdb_url', None) or None
+        return cls(item.get('filename', 'N/A'), item.get('absolute_path', ''), item.get('relative_path', 'N/A'),
+                   to_epoch_us(datetime.datetime.fromisoformat(item.get('timestamp', datetime.datetime.min.isoformat()))), category, tmdb_id,
+                   item.get('plot', None), None if tmdb_url == derive_tmdb_url(category, tmdb_id) else (tmdb_url or ''))
+
+    def to_json(self):
+        return {'filename': self.filename, 'absolute_path': self.absolute_path, 'relative_path': self.relative_path,
+                'timestamp': self.timestamp.isoformat(), 'category': self.category,
+                'tmdb_id': self.tmdb_id, 'tmdb_url': self.tmdb_url, 'plot': self.plot}
+
+    def digest(self):
+        """64 位元的紀錄雜湊；紀錄集合的指紋為各紀錄雜湊的總和 (與加入順序無關)"""
+        return int.from_bytes(hashlib.sha1(f"{self.absolute_path}\0{self.timestamp_us}\0{self.category}\0{self.filename}".encode('utf-8')).digest()[:8], 'big')
+
+    def to_row(self):
+        """與建構子參數順序相同的 tuple，用於狀態快照與內容比較"""
+        return (self.filename, self.absolute_path, self.relative_path, self.timestamp_us, self.category, self.tmdb_id, self.plot, self.tmdb_url_override)
+
+    def __eq__(self, other):
+        return self.to_row() == other.to_row() if isinstance(other, MediaRecord) else NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"MediaRecord({self.category!r}, {self.filename!r}, {self.timestamp.isoformat()})"
+
+# --- 持久化函數 (Append-only 日誌 + 背景壓實) ---
+# media_updates.json 為排序後的快照；新紀錄只以單行 JSON 附加到 GDState 下的日誌檔，
+# 每次儲存的成本與歷史總量無關。日誌累積到門檻後於背景壓實回快照。
+journal_lock = threading.Lock()      # 保護 pending_journal_items 與日誌輪替
+compaction_lock = threading.Lock()   # 同一時間只允許一個壓實程序
+pending_journal_items = []           # 已加入 media_index、尚未寫入日誌的紀錄
+journal_line_count = 0               # 目前日誌檔的行數 (SQLite 後端為上次匯出 JSON 後新增的筆數)；用於判斷是否需要壓實
+compaction_thread = None
+
+def get_updates_json_path(filename=UPDATES_JSON_FILE):
+    """快照寫在 OUTPUT_DIRECTORY；輸出分支模式第一次啟動時，沿用主分支工作目錄中既有的舊快照"""
+    filepath = os.path.join(OUTPUT_DIRECTORY, filename); legacy_path = os.path.join(REPO_PATH, filename)
+    if filepath != legacy_path and not os.path.exists(filepath) and os.path.exists(legacy_path): return legacy_path
+    return filepath
+
+def get_journal_paths(filename=UPDATES_JOURNAL_FILE):
+    journal_path = os.path.join(state_directory, filename)
+    return journal_path, journal_path + '.compacting'
+
+def read_journal(journal_path):
+    """逐行讀取日誌檔；最後一行若因當機而不完整會被略過並截斷，之後附加的紀錄才不會接在殘行後面而一併遺失"""
+    entries = []
+    if not os.path.exists(journal_path): return entries
+    with open(journal_path, 'rb+') as f:
+        raw = f.read()
+        if raw and not raw.endswith(b'\n'):
+            raw = raw[:raw.rfind(b'\n') + 1]; f.truncate(len(raw))
+            logging.warning(f"日誌 {os.path.basename(journal_path)} 的最後一行不完整 (可能因當機中斷)，已截斷。")
+    for line_no, line in enumerate(raw.decode('utf-8').splitlines(), 1):
+        line = line.strip()
+        if not line: continue
+        try: entries.append(json.loads(line))
+        except json.JSONDecodeError as e: logging.warning(f"日誌 {os.path.basename(journal_path)} 第 {line_no} 行無法解析，已跳過: {e}")
+    return entries
+
+# --- SQLite 儲存後端 (STORAGE_BACKEND = 'sqlite' 時啟用) ---
+class SqliteMediaStore:
+    """以 SQLite 保存完整歷史；路徑唯一索引用於去重，(category, timestamp) 索引用於取最新 N 筆"""
+    COLUMNS = ('filename', 'absolute_path', 'relative_path', 'timestamp', 'category', 'tmdb_id', 'tmdb_url', 'plot')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS media_updates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, path_key TEXT,
+                filename TEXT, absolute_path TEXT, relative_path TEXT, timestamp TEXT NOT NULL, category TEXT NOT NULL,
+                tmdb_id TEXT, tmdb_url TEXT, plot TEXT)""")
+            self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_media_path_key ON media_updates(path_key)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_media_category_ts ON media_updates(category, timestamp)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_media_ts ON media_updates(timestamp)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS media_meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.row_count = self.conn.execute('SELECT COUNT(*) FROM media_updates').fetchone()[0]
+        self.digest = self._load_digest()
+        row = self.conn.execute("SELECT value FROM media_meta WHERE key = 'exported_count'").fetchone()
+        self.exported_count = int(row[0]) if row is not None else 0 # 上次匯出 media_updates.json 時的筆數
+
+    def _load_digest(self):
+        """紀錄集合的指紋 (與 MediaIndex 相同算法)；舊資料庫尚未記錄時掃描一次後寫入"""
+        row = self.conn.execute("SELECT value FROM media_meta WHERE key = 'digest'").fetchone()
+        if row is not None: return int(row[0])
+        rows = self.conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM media_updates").fetchall()
+        digest = sum(record.digest() for record in self._rows_to_updates(rows)) & 0xFFFFFFFFFFFFFFFF
+        with self.conn: self.conn.execute("INSERT OR REPLACE INTO media_meta (key, value) VALUES ('digest', ?)", (str(digest),))
+        return digest
+
+    def _row_values(self, item):
+        record = item.to_json()
+        path_key = record['absolute_path'].lower() or None # 無路徑的紀錄不參與唯一索引
+        return (path_key,) + tuple(record.get(column) for column in self.COLUMNS)
+
+    def _rows_to_updates(self, rows):
+        updates = []
+        for row in rows:
+            try: updates.append(MediaRecord.from_json(dict(zip(self.COLUMNS, row))))
+            except (ValueError, TypeError) as e: logging.warning(f"(SQLite) 載入單筆紀錄時出錯，已跳過: {row}. 錯誤: {e}")
+        return updates
+
+    def count(self):
+        with self.lock: return self.row_count
+
+    def insert_many(self, items):
+        """在單一交易中批次寫入，重複路徑由唯一索引忽略；指紋與紀錄在同一交易中更新。回傳實際新增筆數"""
+        insert_sql = f"INSERT OR IGNORE INTO media_updates (path_key, {', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * (len(self.COLUMNS) + 1))})"
+        with self.lock:
+            inserted = 0; digest = self.digest
+            with self.conn:
+                for item in items:
+                    if self.conn.execute(insert_sql, self._row_values(item)).rowcount: inserted += 1; digest += item.digest()
+                digest &= 0xFFFFFFFFFFFFFFFF
+                self.conn.execute("INSERT OR REPLACE INTO media_meta (key, value) VALUES ('digest', ?)", (str(digest),))
+            self.row_count += inserted; self.digest = digest
+            return inserted
+
+    def contains(self, path_key):
+        with self.lock: return self.conn.execute('SELECT 1 FROM media_updates WHERE path_key = ?', (path_key,)).fetchone() is not None
+
+    def newest(self, limit, category=None):
+        """依索引取出最新的 limit 筆 (可指定分類)，不需在記憶體中排序完整歷史"""
+        columns = ', '.join(self.COLUMNS)
+        with self.lock:
+            limit = -1 if limit is None else limit # SQLite 的 LIMIT -1 表示不限筆數
+            if category is None: rows = self.conn.execute(f'SELECT {columns} FROM media_updates ORDER BY timestamp DESC, id LIMIT ?', (limit,)).fetchall()
+            else: rows = self.conn.execute(f'SELECT {columns} FROM media_updates WHERE category = ? ORDER BY timestamp DESC, id LIMIT ?', (category, limit)).fetchall()
+        return self._rows_to_updates(rows)
+
+    def month_records(self, category, month):
+        """某分類某月份的紀錄，依 (category, timestamp) 索引以時間字串區間查詢"""
+        start, end = (bound.isoformat() for bound in shard_month_range(month))
+        with self.lock: rows = self.conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM media_updates WHERE category = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp DESC, id", (category, start, end)).fetchall()
+        return self._rows_to_updates(rows)
+
+    def shard_keys(self):
+        with self.lock: return set(self.conn.execute('SELECT DISTINCT category, substr(timestamp, 1, 7) FROM media_updates').fetchall())
+
+    def load_all(self):
+        with self.lock: rows = self.conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM media_updates ORDER BY timestamp DESC").fetchall()
+        return self._rows_to_updates(rows)
+
+    def mark_exported(self, count):
+        """記錄已匯出到 media_updates.json 的筆數；紀錄只增不刪，與目前筆數的差即為尚未匯出的筆數"""
+        with self.lock:
+            with self.conn: self.conn.execute("INSERT OR REPLACE INTO media_meta (key, value) VALUES ('exported_count', ?)", (str(count),))
+            self.exported_count = count
+
+    def iter_json_records(self):
+        """依時間倒序逐筆輸出與 media_updates.json 相同格式的紀錄 (時間戳本身即為 ISO 字串，不需轉換)；
+        以另一個連線逐列讀取，不一次載入全部資料列，WAL 模式下匯出期間也不阻擋寫入"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for row in conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM media_updates ORDER BY timestamp DESC"): yield dict(zip(self.COLUMNS, row))
+        finally: conn.close()
+
+def open_media_store():
+    if STORAGE_BACKEND != 'sqlite': return None
+    db_path = os.path.join(state_directory, SQLITE_DB_FILE)
+    try:
+        store = SqliteMediaStore(db_path)
+        logging.info(f"使用 SQLite 儲存後端: {db_path}")
+        return store
+    except sqlite3.Error as e:
+        logging.error(f"開啟 SQLite 資料庫 {db_path} 失敗: {e}。改用 JSON 日誌儲存。")
+        return None
+
+def get_latest_updates(all_updates, limit):
+    """取出最新的 limit 筆紀錄；SQLite 後端依 (category, timestamp) 索引查詢，MediaIndex 直接合併各分類的有序序列，都不需全域排序"""
+    if isinstance(all_updates, (MediaIndex, SqliteMediaIndex)): return all_updates.newest(limit)
+    return sorted(all_updates, key=lambda x: x.timestamp_us, reverse=True)[:limit]
+
+def parse_update_items(items):
+    """把 JSON 紀錄轉為更新紀錄並依路徑 (小寫) 去重，保留先出現者；無法解析的紀錄略過"""
+    loaded_updates = []; seen_paths = set()
+    for item in items:
+        try:
+            update_item = MediaRecord.from_json(item)
+            path_lower = update_item.absolute_path.lower()
+            if path_lower:
+                if path_lower in seen_paths: continue # 壓實期間可能同時存在於快照與日誌中
+                seen_paths.add(path_lower)
+            loaded_updates.append(update_item)
+        except (ValueError, TypeError, AttributeError) as item_e: logging.warning(f"載入單筆紀錄時出錯，已跳過: {item}. 錯誤: {item_e}")
+    return loaded_updates
+
 def load_updates(filename=UPDATES_JSON_FILE):
-    filepath = os.path.join(REPO_PATH, filename)
+    """讀取快照 (media_updates.json) 後，依序重播壓實中與目前的日誌檔；SQLite 後端則直接依索引讀取"""
+    global journal_line_count
+    if media_store is not None: return load_updates_from_store(filename)
+    filepath = get_updates_json_path(filename)
+    journal_path, compacting_path = get_journal_paths()
     try:
+        data = []
         if os.path.exists(filepath):
             with open(filepath, 'r', encoding='utf-8') as f: data = json.load(f)
-            loaded_updates = []
-            for item in data:
-                try:
-                    update_item = {
-                        'timestamp': datetime.datetime.fromisoformat(item.get('timestamp', datetime.datetime.min.isoformat())),
-                        'category': item.get('category', 'unknown'), 'filename': item.get('filename', 'N/A'),
-                        'absolute_path': item.get('absolute_path', ''), 'relative_path': item.get('relative_path', 'N/A'),
-                        'tmdb_id': item.get('tmdb_id', None), 'tmdb_url': item.get('tmdb_url', None),
-                        'plot': item.get('plot', None) }
-                    loaded_updates.append(update_item)
-                except (ValueError, TypeError) as item_e: logging.warning(f"載入單筆紀錄時出錯，已跳過: {item}. 錯誤: {item_e}")
-            logging.info(f"成功從 {filename} 載入 {len(loaded_updates)} 筆有效更新紀錄。")
-            loaded_updates.sort(key=lambda x: x.get('timestamp', datetime.datetime.min), reverse=True)
-            return loaded_updates
-        else: logging.info(f"{filename} 不存在，將創建新的更新列表。"); return []
+        else: logging.info(f"{filename} 不存在，將創建新的更新列表。")
+        journal_entries = read_journal(compacting_path)
+        current_journal_entries = read_journal(journal_path)
+        journal_line_count = len(current_journal_entries)
+        loaded_updates = parse_update_items(data + journal_entries + current_journal_entries)
+        logging.info(f"成功從 {filename} 載入 {len(data)} 筆快照紀錄，並從日誌重播 {len(journal_entries) + len(current_journal_entries)} 筆，共 {len(loaded_updates)} 筆有效更新紀錄。")
+        loaded_updates.sort(key=lambda x: x.timestamp_us, reverse=True)
+        return loaded_updates
     except (json.JSONDecodeError, OSError) as e: logging.error(f"從 {filename} 載入更新紀錄失敗: {e}。將使用空的列表。"); return []
     except Exception as e_generic: logging.error(f"從 {filename} 載入時發生未預期錯誤: {e_generic}。將使用空的列表。"); return []
 
-def save_updates(updates, filename=UPDATES_JSON_FILE):
-    global processed_paths_set 
-    filepath = os.path.join(REPO_PATH, filename)
+def import_json_into_store(filename=UPDATES_JSON_FILE):
+    """首次啟用 SQLite：從既有的 JSON 快照與日誌匯入"""
+    global media_store
+    if media_store.count() != 0: return
+    store = media_store; media_store = None
+    try: existing_updates = load_updates(filename)
+    finally: media_store = store
+    if existing_updates:
+        inserted = media_store.insert_many(existing_updates)
+        logging.info(f"(SQLite) 已從 {filename} 與日誌匯入 {inserted} 筆紀錄。")
+
+def load_updates_from_store(filename=UPDATES_JSON_FILE):
     try:
-        data_to_save = []
-        current_updates_sorted = sorted(updates, key=lambda x: x.get('timestamp', datetime.datetime.min), reverse=True)
-        new_processed_paths_this_save = set() 
-        for item in current_updates_sorted:
+        import_json_into_store(filename)
+        loaded_updates = media_store.load_all()
+        logging.info(f"(SQLite) 成功載入 {len(loaded_updates)} 筆有效更新紀錄。")
+        return loaded_updates
+    except sqlite3.Error as e: logging.error(f"(SQLite) 載入更新紀錄失敗: {e}。將使用空的列表。"); return []
+
+def record_new_update(update_info, path_key):
+    """將新紀錄加入 media_index 並排入待寫入日誌的佇列；路徑已存在時回傳 False"""
+    with journal_lock:
+        if not media_index.add(update_info, path_key): return False
+        pending_journal_items.append(update_info)
+        archive_dirty_shards.add((update_info.category, shard_month(update_info.timestamp)))
+    metric_items_ingested.inc(category=update_info.category)
+    return True
+
+def save_updates(updates, filename=UPDATES_JSON_FILE):
+    """只把尚未持久化的新紀錄附加到日誌檔 (或在單一 SQLite 交易中寫入)；累積達門檻時於背景壓實 (SQLite 後端為匯出) 成快照"""
+    global journal_line_count
+    journal_path, _ = get_journal_paths()
+    with journal_lock:
+        items_to_append = pending_journal_items[:]
+        pending_journal_items.clear()
+        if items_to_append and media_store is not None:
+            try:
+                inserted = media_index.persist(items_to_append)
+                journal_line_count += inserted
+                logging.info(f"(SQLite) 已在單一交易中寫入 {inserted} 筆新紀錄。")
+                freshness_tracer.mark_records(items_to_append, 'persisted')
+            except sqlite3.Error as e:
+                pending_journal_items[:0] = items_to_append # 放回佇列，下次再試
+                logging.error(f"(SQLite) 寫入新紀錄失敗: {e}")
+                return
+        elif items_to_append:
             try:
-                item_copy = item.copy()
-                if isinstance(item_copy.get('timestamp'), datetime.datetime): item_copy['timestamp'] = item['timestamp'].isoformat()
-                else: item_copy['timestamp'] = datetime.datetime.now().isoformat(); logging.warning(f"記錄缺少有效時間戳，已使用目前時間: {item.get('filename', 'N/A')}")
-                data_to_save.append(item_copy)
-                if item.get('absolute_path'): new_processed_paths_this_save.add(item.get('absolute_path').lower())
-            except Exception as item_save_e: logging.warning(f"處理單筆紀錄儲存時出錯，已跳過: {item.get('filename', 'N/A')}. 錯誤: {item_save_e}")
-        with open(filepath, 'w', encoding='utf-8') as f: json.dump(data_to_save, f, ensure_ascii=False, indent=4)
-        logging.info(f"成功將 {len(data_to_save)} 筆更新紀錄儲存到 {filename}。")
-        processed_paths_set = new_processed_paths_this_save
-        logging.info(f"processed_paths_set 已基於儲存內容更新，包含 {len(processed_paths_set)} 條路徑。")
-    except (TypeError, OSError) as e: logging.error(f"儲存更新紀錄到 {filename} 失敗: {e}")
-    except Exception as e_generic: logging.error(f"儲存到 {filename} 時發生未預期錯誤: {e_generic}")
-
-media_updates = load_updates()
-processed_paths_set = set(item.get('absolute_path', '').lower() for item in media_updates if item.get('absolute_path'))
+                with open(journal_path, 'a', encoding='utf-8') as f:
+                    for item in items_to_append: f.write(json.dumps(item.to_json(), ensure_ascii=False) + '\n')
+                    f.flush(); os.fsync(f.fileno())
+                journal_line_count += len(items_to_append)
+                freshness_tracer.mark_records(items_to_append, 'persisted')
+                logging.info(f"已將 {len(items_to_append)} 筆新紀錄附加到日誌 {os.path.basename(journal_path)} (目前 {journal_line_count} 行)。")
+            except (TypeError, OSError) as e:
+                pending_journal_items[:0] = items_to_append # 放回佇列，下次再試
+                logging.error(f"附加紀錄到日誌 {journal_path} 失敗: {e}")
+                return
+    if journal_line_count >= JOURNAL_COMPACT_THRESHOLD: schedule_compaction(updates, filename)
+
+def schedule_compaction(updates, filename=UPDATES_JSON_FILE):
+    global compaction_thread
+    if compaction_thread is not None and compaction_thread.is_alive(): return
+    logging.info(f"{'自上次匯出後已新增' if media_store is not None else '日誌已達'} {journal_line_count} 筆 (門檻 {JOURNAL_COMPACT_THRESHOLD})，於背景壓實成快照...")
+    compaction_thread = threading.Thread(target=compact_updates, args=(updates, filename), name='journal-compaction', daemon=True)
+    compaction_thread.start()
+
+def flush_updates_on_shutdown(filename=UPDATES_JSON_FILE):
+    """停止時寫入尚未持久化的紀錄並壓實成快照 (下次啟動不必重播日誌)；SQLite 後端則把尚未匯出的紀錄匯出到 JSON"""
+    save_updates(media_index, filename)
+    if compaction_thread is not None and compaction_thread.is_alive(): compaction_thread.join()
+    if journal_line_count or os.path.exists(get_journal_paths()[1]):
+        logging.info(f"停止前壓實日誌 ({journal_line_count} 行) 到 {filename}...")
+        compact_updates(media_index, filename)
+
+def compact_updates(updates, filename=UPDATES_JSON_FILE):
+    """輪替日誌後把完整排序列表逐筆串流寫成快照，成功後才刪除舊日誌；回傳寫出的筆數 (失敗時為 None)"""
+    global journal_line_count
+    filepath = os.path.join(OUTPUT_DIRECTORY, filename)
+    journal_path, compacting_path = get_journal_paths()
+    with compaction_lock:
+        try:
+            with journal_lock:
+                if os.path.exists(journal_path):
+                    if os.path.exists(compacting_path): # 上次壓實中斷，合併後再處理
+                        with open(journal_path, 'r', encoding='utf-8') as src, open(compacting_path, 'a', encoding='utf-8') as dst: dst.write(src.read())
+                        os.remove(journal_path)
+                    else: os.replace(journal_path, compacting_path)
+                journal_line_count = 0
+                state = updates.copy_state() if media_store is None else None # 與日誌輪替同一把鎖：快照恰好包含輪替前已加入索引的紀錄
+            saved_count = 0
+            def iter_records(): # 逐筆轉換並計數，不在記憶體中累積完整的 JSON 列表
+                nonlocal saved_count
+                if media_store is not None: # SQLite 後端直接依索引匯出
+                    for item in media_store.iter_json_records(): saved_count += 1; yield item
+                    return
+                for record in MediaIndex.iter_newest(state['sort_keys'], state['records']): # 依時間倒序，在鎖外合併
+                    try: item = record.to_json()
+                    except Exception as item_save_e: logging.warning(f"處理單筆紀錄儲存時出錯，已跳過: {record.filename}. 錯誤: {item_save_e}"); continue
+                    saved_count += 1; yield item
+            json_hash = write_file_atomic(filepath, iter_json_array(iter_records()))
+            metric_output_bytes.set(os.path.getsize(filepath), artifact=filename)
+            if os.path.exists(compacting_path): os.remove(compacting_path)
+            if media_store is not None: media_store.mark_exported(saved_count)
+            elif saved_count == sum(map(len, state['records'].values())): # 快照須與剛寫出的 JSON 內容完全對應
+                st = os.stat(filepath); save_state_snapshot(MediaIndex.pickle_state(state), [st.st_size, st.st_mtime_ns, json_hash])
+            logging.info(f"壓實完成：已將 {saved_count} 筆更新紀錄儲存到 {filename}。")
+            return saved_count
+        except (TypeError, OSError, sqlite3.Error) as e: logging.error(f"壓實更新紀錄到 {filename} 失敗: {e}"); return None
+        except Exception as e_generic: logging.error(f"壓實到 {filename} 時發生未預期錯誤: {e_generic}"); return None
+
+# --- 繁簡正規化與靜態搜尋索引 ---
+# search_normalize.js 的 tsMap 即由此產生的簡→繁對照 (僅單字)；搜尋一律以「小寫 + 繁體」為正規形式
+SIMP_TO_TRAD_MAP = {
+    '剧': '劇', '电': '電', '杂': '雜', '志': '誌', '时': '時', '间': '間', '档': '檔', '签': '簽', '标': '標', '题': '題',
+    '内': '內', '寻': '尋', '显': '顯', '隐': '隱', '数': '數', '据': '據', '库': '庫', '简': '簡', '体': '體', '转': '轉',
+    '换': '換', '优': '優', '验': '驗', '证': '證', '权': '權', '设': '設', '错': '錯', '误': '誤', '讯': '訊', '统': '統',
+    '环': '環', '处': '處', '应': '應', '网': '網', '页': '頁', '浏': '瀏', '览': '覽', '缓': '緩', '块': '塊', '组': '組',
+    '织': '織', '结': '結', '构': '構', '状': '狀', '态': '態', '负': '負', '载': '載', '压': '壓', '测': '測', '试': '試',
+    '调': '調', '迭': '疊', '开': '開', '发': '發', '周': '週', '计': '計', '划': '劃', '实': '實', '现': '現', '规': '規',
+    '范': '範', '说': '說', '书': '書', '户': '戶', '动': '動', '画': '畫', '视': '視', '觉': '覺', '图': '圖', '颜': '顏',
+    '布': '佈', '响': '響', '适': '適', '备': '備',
+}
+SIMP_TO_TRAD_TABLE = str.maketrans(SIMP_TO_TRAD_MAP)
+
+def normalize_search_text(text):
+    """搜尋用的正規形式：小寫並統一轉為繁體"""
+    return (text or '').lower().translate(SIMP_TO_TRAD_TABLE)
+
+def search_text_for_record(category, filename, relative_path):
+    # 與頁面既有行為一致：雜誌依檔名搜尋，其餘分類依相對路徑搜尋
+    return normalize_search_text(filename if category == 'magazine' else relative_path)
+
+def build_search_index(shard_records):
+    """建立單一分片的倒排索引；文件編號即分片內依時間倒序的位置 (archive_script.js 以各分片的累計筆數換算成分類內的位置)"""
+    docs = [search_text_for_record(record.get('category'), record.get('filename'), record.get('relative_path')) for record in shard_records]
+    postings = defaultdict(list)
+    for doc_id, text in enumerate(docs):
+        for gram in {text[i:i + SEARCH_NGRAM_SIZE] for i in range(len(text) - SEARCH_NGRAM_SIZE + 1)}:
+            postings[gram].append(doc_id)
+    encoded_postings = {}
+    for gram, doc_ids in postings.items(): # 以差值編碼縮小檔案
+        previous = 0; deltas = []
+        for doc_id in doc_ids: deltas.append(doc_id - previous); previous = doc_id
+        encoded_postings[gram] = deltas
+    return {'version': 1, 'n': SEARCH_NGRAM_SIZE, 'docs': docs, 'postings': encoded_postings} # 繁簡對照表由共用的 search_normalize.js 提供，不隨每個分片重複
+
+# --- Archive 分片輸出 (分類 × 月份) ---
+# archive.html 只需下載 manifest 與目前分頁所需的分片。manifest 保留在記憶體中，
+# 發布時只重寫自上次發布後有新紀錄的 (分類, 月份) 分片與其搜尋索引，其餘分片連讀都不必。
+ARCHIVE_MANIFEST_VERSION = 2 # 2: 搜尋索引改為每個分片一份 (文件編號為分片內的位置)
+archive_dirty_shards = set()  # 自上次發布後有新紀錄的 (分類, 月份)；由 record_new_update 在 journal_lock 下加入
+archive_shards_synced = False # 啟動後尚未確認磁碟上的分片與 media_index 一致時，第一次發布做完整比對
+
+def write_archive_shards(index, shard_keys=None):
+    """重寫 shard_keys 指定的 (分類, 月份) 分片與其搜尋索引並更新 manifest；shard_keys 為 None 時比對全部分片並移除多餘的檔案"""
+    shards_root = os.path.join(OUTPUT_DIRECTORY, ARCHIVE_DATA_DIRECTORY)
+    manifest_categories = archive_manifest['categories']
+    written_files = []
+
+    def write_if_changed(relative_file, content, previous_hash):
+        content_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+        output_path = os.path.join(shards_root, *relative_file.split('/'))
+        if previous_hash != content_hash or not os.path.exists(output_path):
+            write_file_atomic(output_path, content); written_files.append(relative_file)
+        return content_hash
+
+    def remove_shard_files(shard_entry):
+        for relative_file in (shard_entry['file'], shard_entry['search']['file']):
+            try: remove_published_output(os.path.join(shards_root, *relative_file.split('/')))
+            except OSError: pass
+
+    full_rebuild = shard_keys is None
+    if full_rebuild: shard_keys = index.shard_keys() | {(category, shard['month']) for category, entry in manifest_categories.items() for shard in entry['shards']}
+    for category, month in sorted(shard_keys):
+        records = [record.to_json() for record in index.month_records(category, month)]
+        category_entry = manifest_categories.setdefault(category, {'count': 0, 'latest': None, 'shards': []})
+        shards_by_month = {shard['month']: shard for shard in category_entry['shards']}
+        previous = shards_by_month.pop(month, None)
+        if not records:
+            if previous: remove_shard_files(previous)
+        else:
+            shard_file = f"{category}/{month}.json"; search_file = f"search/{category}/{month}.json"
+            content_hash = write_if_changed(shard_file, json.dumps(records, ensure_ascii=False, separators=(',', ':')), previous and previous['hash'])
+            search_hash = write_if_changed(search_file, json.dumps(build_search_index(records), ensure_ascii=False, separators=(',', ':')), previous and previous['search']['hash'])
+            shards_by_month[month] = {'month': month, 'file': shard_file, 'count': len(records), 'latest': records[0]['timestamp'], 'hash': content_hash, 'search': {'file': search_file, 'hash': search_hash}}
+        category_entry['shards'] = sorted(shards_by_month.values(), key=lambda x: x['month'], reverse=True)
+        category_entry['count'] = sum(shard['count'] for shard in category_entry['shards'])
+        category_entry['latest'] = max((shard['latest'] for shard in category_entry['shards']), default=None)
+        if not category_entry['shards']: del manifest_categories[category]
+    archive_manifest['total'] = sum(entry['count'] for entry in manifest_categories.values())
+    write_file_atomic(os.path.join(shards_root, ARCHIVE_MANIFEST_FILE), json.dumps(archive_manifest, ensure_ascii=False, indent=1))
+    if full_rebuild: # 舊版 manifest 列出、但已不屬於任何分片的檔案 (例如 v1 的分類搜尋索引)
+        current_files = {path for entry in manifest_categories.values() for shard in entry['shards'] for path in (shard['file'], shard['search']['file'])}
+        for relative_file in set(archive_legacy_files) - current_files:
+            try: remove_published_output(os.path.join(shards_root, *relative_file.split('/')))
+            except OSError: pass
+        archive_legacy_files.clear()
+    logging.info(f"Archive 分片輸出完成：{'完整比對' if full_rebuild else '增量更新'} {len(shard_keys)} 個分片，本次重寫 {len(written_files)} 個檔案。")
+
+def load_archive_manifest():
+    """從既有 manifest 還原分片雜湊，重啟後未變的分片也不必重寫；舊版 manifest 列出的檔案記入 archive_legacy_files"""
+    manifest_path = os.path.join(OUTPUT_DIRECTORY, ARCHIVE_DATA_DIRECTORY, ARCHIVE_MANIFEST_FILE)
+    empty_manifest = {'version': ARCHIVE_MANIFEST_VERSION, 'total': 0, 'categories': {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f: manifest = json.load(f)
+        if manifest.get('version') == ARCHIVE_MANIFEST_VERSION:
+            for category_entry in manifest['categories'].values():
+                for shard in category_entry['shards']: shard['hash'], shard['search']['hash'], shard['file'] # 格式檢查
+            return manifest
+        for category_entry in manifest.get('categories', {}).values():
+            archive_legacy_files.extend(entry['file'] for entry in category_entry.get('shards', []) + ([category_entry['search']] if 'search' in category_entry else []))
+        return empty_manifest
+    except (OSError, json.JSONDecodeError, KeyError, AttributeError, TypeError): return empty_manifest
+
+archive_legacy_files = [] # 舊版 manifest 列出的檔案，下次完整比對時移除不再使用者
+archive_manifest = load_archive_manifest()
 
 # --- NFO 解析函數 ---
+# --- NFO 解析結果快取 ---
+# 同一季的每一集都會解析同一個 tvshow.nfo；以 (路徑, 修改時間, 大小) 為鍵，檔案內容變動時自然失效。
+nfo_cache = OrderedDict()
+nfo_cache_lock = threading.Lock()
+nfo_cache_loading = {} # 快取鍵 -> threading.Event，避免多個工作執行緒同時讀取同一個 NFO
+nfo_cache_stats = {'hits': 0, 'misses': 0}
+
 def parse_nfo(nfo_path):
+    try: stat_result = os.stat(nfo_path)
+    except OSError: logging.warning(f"NFO 檔案不存在: {nfo_path}"); metric_nfo_parse_failures.inc(reason='missing'); return None, None
+    cache_key = (PathKey.of(nfo_path), stat_result.st_mtime_ns, stat_result.st_size)
+    while True:
+        with nfo_cache_lock:
+            if cache_key in nfo_cache:
+                nfo_cache.move_to_end(cache_key); nfo_cache_stats['hits'] += 1
+                logging.debug(f"NFO 快取命中: {nfo_path}"); return nfo_cache[cache_key]
+            loading_event = nfo_cache_loading.get(cache_key)
+            if loading_event is None:
+                nfo_cache_loading[cache_key] = threading.Event(); nfo_cache_stats['misses'] += 1; break
+        loading_event.wait() # 其他執行緒正在解析同一檔案，等待後重新查詢快取
+    result = (None, None); parse_started = time.perf_counter()
+    try: result = read_and_parse_nfo(nfo_path)
+    finally:
+        metric_nfo_parse_seconds.observe(time.perf_counter() - parse_started)
+        with nfo_cache_lock:
+            nfo_cache[cache_key] = result
+            while len(nfo_cache) > NFO_CACHE_MAX_ENTRIES: nfo_cache.popitem(last=False)
+            nfo_cache_loading.pop(cache_key).set()
+    return result
+
+def get_nfo_cache_stats():
+    with nfo_cache_lock: return {'hits': nfo_cache_stats['hits'], 'misses': nfo_cache_stats['misses'], 'entries': len(nfo_cache)}
+
+def read_and_parse_nfo(nfo_path):
     logging.info(f"嘗試解析 NFO: {nfo_path}")
-    if not os.path.exists(nfo_path): logging.warning(f"NFO 檔案不存在: {nfo_path}"); return None, None
     try:
         with open(nfo_path, 'r', encoding='utf-8') as f: content = f.read()
         tree = ET.fromstring(content); plot_element = tree.find('.//plot'); plot = plot_element.text if plot_element is not None else None; tmdb_id = None
@@ -126,47 +859,618 @@ def parse_nfo(nfo_path):
             if plot_tag_start in content_lower:
                 start_index = content_lower.find(plot_tag_start) + len(plot_tag_start); end_index = content.find(plot_tag_end, start_index)
                 if end_index != -1: plot = content[start_index:end_index].strip()
-            if tmdb_id or plot: logging.info(f"NFO 手動提取結果 - TMDb ID: {tmdb_id}, Plot: {'有' if plot else '無'}"); return tmdb_id, plot
-            else: logging.warning(f"無法從非標準 XML NFO 中提取資訊: {nfo_path}"); return None, None
-        except Exception as extract_e: logging.error(f"手動提取 NFO 資訊時發生錯誤 ({nfo_path}): {extract_e}"); return None, None
-    except Exception as e: logging.error(f"讀取或解析 NFO 時發生未知錯誤 ({nfo_path}): {e}"); return None, None
+            if tmdb_id or plot: logging.info(f"NFO 手動提取結果 - TMDb ID: {tmdb_id}, Plot: {'有' if plot else '無'}"); metric_nfo_parse_failures.inc(reason='xml_recovered'); return tmdb_id, plot
+            else: logging.warning(f"無法從非標準 XML NFO 中提取資訊: {nfo_path}"); metric_nfo_parse_failures.inc(reason='xml_unrecoverable'); return None, None
+        except Exception as extract_e: logging.error(f"手動提取 NFO 資訊時發生錯誤 ({nfo_path}): {extract_e}"); metric_nfo_parse_failures.inc(reason='xml_unrecoverable'); return None, None
+    except Exception as e: logging.error(f"讀取或解析 NFO 時發生未知錯誤 ({nfo_path}): {e}"); metric_nfo_parse_failures.inc(reason='read_error'); return None, None
+
+# --- 目錄清單快取 (以一次 os.scandir 取代逐一的 exists/isfile 探測) ---
+# 同一目錄下的兄弟檔案共用同一份清單；輪詢的 os.walk 結果直接預先填入，監視器事件則使對應目錄失效。
+dir_listing_cache = OrderedDict() # normcase 目錄路徑 -> (到期時間, {normcase 名稱: 是否為檔案})
+dir_listing_lock = threading.Lock()
+dir_listing_stats = {'lookups': 0, 'listings': 0}
+
+def store_directory_listing(directory, listing):
+    directory_key = os.path.normcase(os.path.abspath(directory))
+    with dir_listing_lock:
+        dir_listing_cache[directory_key] = (time.time() + DIR_LISTING_CACHE_TTL_SECONDS, listing)
+        dir_listing_cache.move_to_end(directory_key)
+        while len(dir_listing_cache) > DIR_LISTING_CACHE_MAX_ENTRIES: dir_listing_cache.popitem(last=False)
+
+def get_directory_listing(directory):
+    """回傳 {normcase 名稱: 是否為檔案}；目錄不存在時回傳空字典"""
+    directory_key = os.path.normcase(os.path.abspath(directory))
+    with dir_listing_lock:
+        dir_listing_stats['lookups'] += 1
+        cached = dir_listing_cache.get(directory_key)
+        if cached is not None and cached[0] > time.time(): return cached[1]
+    listing = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try: listing[os.path.normcase(entry.name)] = entry.is_file()
+                except OSError: listing[os.path.normcase(entry.name)] = False
+    except OSError: pass
+    with dir_listing_lock: dir_listing_stats['listings'] += 1
+    store_directory_listing(directory, listing)
+    return listing
+
+def prime_directory_listing(directory, dirnames, filenames):
+    """以 os.walk 已取得的結果填入快取，後續查詢不必再列目錄"""
+    listing = {os.path.normcase(name): False for name in dirnames}
+    listing.update((os.path.normcase(name), True) for name in filenames)
+    store_directory_listing(directory, listing)
+
+def invalidate_directory_listing(path):
+    """路徑本身與其上層目錄的清單皆失效 (新增、刪除、搬移事件)"""
+    path_key = os.path.normcase(os.path.abspath(path))
+    with dir_listing_lock:
+        dir_listing_cache.pop(path_key, None); dir_listing_cache.pop(os.path.dirname(path_key), None)
+
+def get_dir_listing_cache_stats():
+    with dir_listing_lock: return {'lookups': dir_listing_stats['lookups'], 'listings': dir_listing_stats['listings'], 'entries': len(dir_listing_cache)}
+
+def cached_path_exists(path):
+    return os.path.normcase(os.path.basename(path)) in get_directory_listing(os.path.dirname(path))
+
+def cached_isfile(path):
+    # 快取未列出時仍以實際檢查為準，避免過期清單誤判而漏掉新檔案
+    return get_directory_listing(os.path.dirname(path)).get(os.path.normcase(os.path.basename(path))) is True or os.path.isfile(path)
 
 def find_nfo_path(media_filepath):
     base_name = os.path.splitext(media_filepath)[0]; nfo_path = base_name + '.nfo'; parent_dir = os.path.dirname(media_filepath); grandparent_dir = os.path.dirname(parent_dir)
-    if os.path.exists(nfo_path): logging.debug(f"找到同名 NFO: {nfo_path}"); return nfo_path, 'self'
+    if cached_path_exists(nfo_path): logging.debug(f"找到同名 NFO: {nfo_path}"); return nfo_path, 'self'
     tvshow_nfo_path = os.path.join(parent_dir, 'tvshow.nfo')
-    if os.path.exists(tvshow_nfo_path): logging.info(f"找到上層 tvshow.nfo: {tvshow_nfo_path}"); return tvshow_nfo_path, 'parent'
+    if cached_path_exists(tvshow_nfo_path): logging.info(f"找到上層 tvshow.nfo: {tvshow_nfo_path}"); return tvshow_nfo_path, 'parent'
     if os.path.basename(parent_dir).lower().startswith('season'):
          tvshow_nfo_path_gp = os.path.join(grandparent_dir, 'tvshow.nfo')
-         if os.path.exists(tvshow_nfo_path_gp): logging.info(f"找到上上層 tvshow.nfo: {tvshow_nfo_path_gp}"); return tvshow_nfo_path_gp, 'grandparent'
+         if cached_path_exists(tvshow_nfo_path_gp): logging.info(f"找到上上層 tvshow.nfo: {tvshow_nfo_path_gp}"); return tvshow_nfo_path_gp, 'grandparent'
     logging.warning(f"找不到與 {media_filepath} 對應的 NFO 檔案"); return None, None
 
 
 # --- 輔助函數: 根據路徑取得設定 ---
+class PathKey(str):
+    """路徑的正規化鍵 (絕對路徑、小寫)，與 media_index 等處使用的字串相同；每個路徑只計算一次並沿途傳遞"""
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, path):
+        return path if isinstance(path, PathKey) else cls(os.path.abspath(path).lower())
+
+    def child(self, name):
+        """由目錄鍵直接組出子項目的鍵，不必再呼叫 abspath (name 為 scandir 取得的單一名稱)"""
+        return PathKey(self + name.lower() if self.endswith(os.sep) else self + os.sep + name.lower())
+
+    def components(self):
+        return [component for component in self.split(os.sep) if component]
+
+class PathConfigMatcher:
+    """PATH_CONFIG 根目錄依路徑元件建成的樹 (trie)；由上而下走訪一次即得到最深 (最精確) 的匹配設定"""
+    def __init__(self, path_config):
+        self.root = {}
+        for config in path_config:
+            node = self.root
+            for component in PathKey.of(config['path']).components(): node = node.setdefault(component, {})
+            node.setdefault(None, config) # None 鍵存放設定；重複路徑以 PATH_CONFIG 中先出現者為準
+
+    def match(self, path_key):
+        node = self.root; best_config = None
+        for component in path_key.components():
+            node = node.get(component)
+            if node is None: break
+            best_config = node.get(None, best_config)
+        return best_config
+
+def compile_path_config():
+    """依目前的 PATH_CONFIG 重建匹配樹與 MONITORED_DIRECTORIES (修改 PATH_CONFIG 後呼叫)"""
+    global path_config_matcher
+    path_config_matcher = PathConfigMatcher(PATH_CONFIG)
+    MONITORED_DIRECTORIES[:] = [item['path'] for item in PATH_CONFIG]
+
 def get_media_config(filepath):
-    """根據檔案或目錄的絕對路徑，從 PATH_CONFIG 中找到最匹配的設定"""
-    abs_filepath_lower = os.path.abspath(filepath).lower()
-    # 為了找到最精確的匹配(例如 H:\...\A\B 會優先匹配 H:\...\A\B 而不是 H:\...\A)
-    # 我們將設定按路徑長度倒序排序
-    sorted_config = sorted(PATH_CONFIG, key=lambda x: len(x['path']), reverse=True)
-    for config in sorted_config:
-        if abs_filepath_lower.startswith(os.path.abspath(config['path']).lower()):
-            return config
-    return None
+    """根據檔案或目錄的絕對路徑 (或 PathKey)，從 PATH_CONFIG 中找到最匹配的設定"""
+    # 以路徑元件比對，H:\...\A\B 會優先匹配 H:\...\A\B 而不是 H:\...\A，且 H:\...\AB 不會誤配 H:\...\A
+    return path_config_matcher.match(PathKey.of(filepath))
+
+path_config_matcher = PathConfigMatcher(PATH_CONFIG)
+
+# --- 記憶體中的更新紀錄索引 ---
+class MediaIndex:
+    """取代原本的 media_updates 列表：路徑雜湊索引負責去重，各分類維持依時間遞增的序列，最新 k 筆以合併取得"""
+    def __init__(self, records=()):
+        self.lock = threading.RLock()
+        self.by_path = {} # PathKey -> 紀錄
+        self.sort_keys = defaultdict(list) # 分類 -> 遞增的 (timestamp_us, -序號)；序號讓同時間的紀錄維持加入順序
+        self.records = defaultdict(list) # 分類 -> 與 sort_keys 對齊的紀錄
+        self.sequence = 0
+        self.count = 0
+        self.digest = 0 # 各紀錄雜湊的總和 (與加入順序無關)，作為建置 manifest 的輸入雜湊
+        self._bulk_load(records)
+
+    def _bulk_load(self, records):
+        """結果與逐筆 add 相同，但先附加、最後每個分類排序一次 (已依時間倒序的快照逐筆 bisect 插入會是 O(n²))"""
+        digest = self.digest
+        for record in records:
+            path_key = PathKey(record.absolute_path.lower()) if record.absolute_path else None
+            if path_key and path_key in self.by_path: continue
+            self.sequence += 1
+            self.sort_keys[record.category].append((record.timestamp_us, -self.sequence)); self.records[record.category].append(record)
+            if path_key: self.by_path[path_key] = record
+            self.count += 1
+            digest += record.digest()
+        self.digest = digest & 0xFFFFFFFFFFFFFFFF
+        for category, category_keys in self.sort_keys.items():
+            order = sorted(range(len(category_keys)), key=category_keys.__getitem__)
+            category_records = self.records[category]
+            self.sort_keys[category] = [category_keys[i] for i in order]; self.records[category] = [category_records[i] for i in order]
+
+    def add(self, record, path_key=None):
+        """加入一筆紀錄；路徑已存在時不加入並回傳 False"""
+        if path_key is None and record.absolute_path: path_key = PathKey(record.absolute_path.lower())
+        category = record.category; record_digest = record.digest()
+        with self.lock:
+            if path_key and path_key in self.by_path: return False
+            self.sequence += 1; sort_key = (record.timestamp_us, -self.sequence)
+            category_keys = self.sort_keys[category]
+            position = bisect.bisect(category_keys, sort_key) # 新紀錄通常是最新的，插入位置即尾端
+            category_keys.insert(position, sort_key); self.records[category].insert(position, record)
+            if path_key: self.by_path[path_key] = record
+            self.count += 1
+            self.digest = (self.digest + record_digest) & 0xFFFFFFFFFFFFFFFF
+        return True
+
+    def __contains__(self, path_key):
+        return path_key in self.by_path
+
+    def __len__(self):
+        return self.count
+
+    def path_count(self):
+        return len(self.by_path)
+
+    def content_digest(self):
+        """紀錄集合的指紋；紀錄加入後不會修改，集合相同即所有衍生輸出的資料相同"""
+        with self.lock: return f"{self.count}:{self.digest:016x}"
+
+    def newest(self, limit=None, category=None):
+        """依時間倒序回傳最新 limit 筆 (None 為全部)；只取前 k 筆時成本為 O(k log 分類數)"""
+        with self.lock:
+            if category is not None:
+                category_records = self.records.get(category, [])
+                start = 0 if limit is None else max(len(category_records) - limit, 0)
+                return category_records[start:][::-1]
+            return self.merge_newest(self.sort_keys, self.records, limit)
+
+    @staticmethod
+    def iter_newest(sort_keys, records, limit=None):
+        """合併各分類的遞增序列，依時間倒序逐筆產生前 limit 筆"""
+        streams = [zip(reversed(sort_keys[key]), reversed(records[key])) for key in records]
+        merged = heapq.merge(*streams, key=lambda pair: pair[0], reverse=True)
+        return (record for _, record in itertools.islice(merged, limit))
+
+    @staticmethod
+    def merge_newest(sort_keys, records, limit=None):
+        return list(MediaIndex.iter_newest(sort_keys, records, limit))
+
+    def month_records(self, category, month):
+        """某分類某月份的紀錄 (依時間倒序，與 newest 相同順序)；以二分搜尋取出區間"""
+        start, end = (to_epoch_us(bound) for bound in shard_month_range(month))
+        with self.lock:
+            category_keys = self.sort_keys.get(category, [])
+            return self.records[category][bisect.bisect_left(category_keys, (start,)):bisect.bisect_left(category_keys, (end,))][::-1]
+
+    def shard_keys(self):
+        """所有非空的 (分類, 月份)；每個月份只需一次二分搜尋即可跳到下個月份"""
+        keys = set()
+        with self.lock:
+            for category, category_keys in self.sort_keys.items():
+                position = 0
+                while position < len(category_keys):
+                    month = shard_month(self.records[category][position].timestamp); keys.add((category, month))
+                    position = bisect.bisect_left(category_keys, (to_epoch_us(shard_month_range(month)[1]),), position)
+        return keys
+
+    def copy_state(self):
+        """鎖內只做淺複製 (紀錄加入後不再修改)；轉成可 pickle 的格式 (pickle_state) 在鎖外進行"""
+        with self.lock:
+            return {'sort_keys': {category: keys[:] for category, keys in self.sort_keys.items()},
+                    'records': {category: records[:] for category, records in self.records.items()},
+                    'by_path': dict(self.by_path), 'sequence': self.sequence, 'count': self.count, 'digest': self.digest}
+
+    @staticmethod
+    def pickle_state(state):
+        """copy_state 的結果轉為可直接 pickle 的內部狀態；紀錄轉為 tuple、PathKey 轉為一般字串，快照不依賴腳本的模組名稱"""
+        path_key_of = {id(record): str(path_key) for path_key, record in state['by_path'].items()}
+        return {'sort_keys': state['sort_keys'],
+                'rows': {category: [record.to_row() for record in records] for category, records in state['records'].items()},
+                'path_keys': {category: [path_key_of.get(id(record)) for record in records] for category, records in state['records'].items()},
+                'sequence': state['sequence'], 'count': state['count'], 'digest': state['digest']}
+
+    def export_state(self):
+        return self.pickle_state(self.copy_state())
+
+    @classmethod
+    def from_state(cls, state):
+        """由 export_state 的結果還原，不需重新排序、計算雜湊或建立路徑索引"""
+        index = cls()
+        index.sort_keys.update(state['sort_keys'])
+        for category, rows in state['rows'].items():
+            records = index.records[category] = [MediaRecord(*row) for row in rows]
+            index.by_path.update(zip(state['path_keys'][category], records)) # 只用於成員檢查，PathKey 與一般字串的雜湊及比較結果相同
+        index.by_path.pop(None, None) # 無路徑的紀錄
+        index.sequence, index.count, index.digest = state['sequence'], state['count'], state['digest']
+        return index
+
+class SqliteMediaIndex:
+    """SQLite 後端的 media_index：完整歷史只留在資料庫，去重 (contains) 與最新 N 筆 (newest) 都走索引；
+    記憶體中只保留已加入、尚未寫入資料庫的紀錄"""
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.RLock()
+        self.pending = {} # PathKey (無路徑的紀錄以 id) -> 尚未寫入資料庫的紀錄
+        self.pending_digest = 0
+
+    def add(self, record, path_key=None):
+        """加入一筆紀錄；路徑已存在 (資料庫或待寫入集合) 時不加入並回傳 False"""
+        if path_key is None and record.absolute_path: path_key = PathKey(record.absolute_path.lower())
+        with self.lock:
+            if path_key and (path_key in self.pending or self.store.contains(path_key)): return False
+            self.pending[path_key or id(record)] = record
+            self.pending_digest = (self.pending_digest + record.digest()) & 0xFFFFFFFFFFFFFFFF
+        return True
+
+    def persist(self, records):
+        """在單一交易中寫入資料庫，成功後才從待寫入集合移除；回傳實際新增筆數"""
+        with self.lock:
+            inserted = self.store.insert_many(records)
+            persisted_ids = {id(record) for record in records}
+            for key in [key for key, record in self.pending.items() if id(record) in persisted_ids]:
+                self.pending_digest = (self.pending_digest - self.pending.pop(key).digest()) & 0xFFFFFFFFFFFFFFFF
+        return inserted
+
+    def __contains__(self, path_key):
+        with self.lock: return path_key in self.pending or self.store.contains(path_key)
+
+    def __len__(self):
+        with self.lock: return self.store.count() + len(self.pending)
+
+    def path_count(self):
+        return len(self)
+
+    def content_digest(self):
+        with self.lock: return f"{len(self)}:{(self.store.digest + self.pending_digest) & 0xFFFFFFFFFFFFFFFF:016x}"
+
+    def newest(self, limit=None, category=None):
+        """資料庫依索引取出最新 limit 筆，再與尚未寫入的紀錄合併 (同時間者依加入順序)"""
+        with self.lock:
+            pending = sorted((record for record in self.pending.values() if category is None or record.category == category), key=lambda record: record.timestamp_us, reverse=True)
+            stored = self.store.newest(limit, category)
+        return list(itertools.islice(heapq.merge(stored, pending, key=lambda record: record.timestamp_us, reverse=True), limit))
+
+    def month_records(self, category, month):
+        with self.lock:
+            pending = sorted((record for record in self.pending.values() if record.category == category and shard_month(record.timestamp) == month), key=lambda record: record.timestamp_us, reverse=True)
+            stored = self.store.month_records(category, month)
+        return list(heapq.merge(stored, pending, key=lambda record: record.timestamp_us, reverse=True))
+
+    def shard_keys(self):
+        with self.lock: return self.store.shard_keys() | {(record.category, shard_month(record.timestamp)) for record in self.pending.values()}
+
+# --- 二進位狀態快照 (快速啟動) ---
+# media_updates.json 對應的 MediaIndex 狀態 (已解析的時間戳、排序後的序列、路徑索引) 以 pickle 存在 GDState 下。
+# 檔頭記錄來源 JSON 的大小、修改時間與 sha1；啟動時一致才還原，否則解析 JSON 並重建快照。之後一律重播日誌。
+STATE_SNAPSHOT_VERSION = 2
+
+def read_updates_source(filepath):
+    """一次讀取 media_updates.json 的原始內容；回傳 (bytes, [大小, 修改時間 ns, sha1])，檔案不存在時為 (None, None)"""
+    try:
+        with open(filepath, 'rb') as f: raw = f.read(); st = os.fstat(f.fileno())
+    except FileNotFoundError: return None, None
+    return raw, [st.st_size, st.st_mtime_ns, hashlib.sha1(raw).hexdigest()]
+
+def load_state_snapshot(source_signature):
+    """快照的來源與目前的 media_updates.json 內容一致時還原 MediaIndex，否則回傳 None"""
+    if source_signature is None: return None
+    snapshot_path = os.path.join(state_directory, STATE_SNAPSHOT_FILE)
+    try:
+        with open(snapshot_path, 'rb') as f: stream = io.BytesIO(f.read())
+        header = pickle.load(stream)
+        recorded_source = header.get('source') or [None, None, None]
+        if header.get('version') != STATE_SNAPSHOT_VERSION: logging.info("狀態快照格式版本不同，改為解析 JSON。"); return None
+        if recorded_source[0] != source_signature[0] or recorded_source[2] != source_signature[2]:
+            logging.info(f"狀態快照已過期 ({UPDATES_JSON_FILE} 內容已變更)，改為解析 JSON。"); return None
+        if recorded_source[1] != source_signature[1]: logging.debug(f"{UPDATES_JSON_FILE} 修改時間不同但內容雜湊相同，沿用狀態快照。")
+        return MediaIndex.from_state(pickle.load(stream))
+    except FileNotFoundError: logging.info("尚無狀態快照，將解析 JSON 並建立。"); return None
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError, ValueError, IndexError) as e:
+        logging.warning(f"讀取狀態快照 {snapshot_path} 失敗: {e}。改為解析 JSON。"); return None
+
+def save_state_snapshot(state, source_signature):
+    """寫出與 source_signature 所指 JSON 內容對應的狀態快照 (state 為 export_state 的結果；先寫暫存檔再替換)"""
+    if source_signature is None: return
+    snapshot_path = os.path.join(state_directory, STATE_SNAPSHOT_FILE)
+    os.makedirs(state_directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{STATE_SNAPSHOT_FILE}.", suffix='.tmp', dir=state_directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'version': STATE_SNAPSHOT_VERSION, 'source': source_signature}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush(); os.fsync(f.fileno())
+        os.replace(temp_path, snapshot_path)
+        logging.info(f"已更新狀態快照 ({state['count']} 筆紀錄)。")
+    except (OSError, pickle.PicklingError, TypeError) as e:
+        try: os.remove(temp_path)
+        except OSError: pass
+        logging.error(f"寫入狀態快照 {snapshot_path} 失敗: {e}")
+
+def load_media_index(filename=UPDATES_JSON_FILE):
+    """啟動時建立 media_index：狀態快照有效時一次讀取還原，否則解析 JSON 並重建快照；兩者之後都重播日誌。SQLite 後端不載入歷史"""
+    global journal_line_count
+    if media_store is not None:
+        try: import_json_into_store(filename)
+        except sqlite3.Error as e: logging.error(f"(SQLite) 從 {filename} 匯入更新紀錄失敗: {e}")
+        journal_line_count = max(media_store.count() - media_store.exported_count, 0) # 上次匯出後當機而未匯出的筆數
+        logging.info(f"(SQLite) 資料庫中共 {media_store.count()} 筆紀錄 ({journal_line_count} 筆尚未匯出到 {filename})；去重與最新 N 筆皆以索引查詢，不載入記憶體。")
+        return SqliteMediaIndex(media_store)
+    filepath = get_updates_json_path(filename)
+    journal_path, compacting_path = get_journal_paths()
+    try:
+        raw, source_signature = read_updates_source(filepath)
+        index = load_state_snapshot(source_signature)
+        if index is not None: logging.info(f"已從狀態快照還原 {len(index)} 筆紀錄 (略過解析 {filename})。")
+        else:
+            if raw is None: logging.info(f"{filename} 不存在，將創建新的更新列表。")
+            index = MediaIndex(parse_update_items(json.loads(raw) if raw is not None else []))
+            save_state_snapshot(index.export_state(), source_signature)
+        journal_entries = read_journal(compacting_path)
+        current_journal_entries = read_journal(journal_path)
+        journal_line_count = len(current_journal_entries)
+        replayed = sum(1 for update_item in parse_update_items(journal_entries + current_journal_entries) if index.add(update_item))
+        logging.info(f"從日誌重播 {len(journal_entries) + len(current_journal_entries)} 筆 (新增 {replayed} 筆)，共 {len(index)} 筆有效更新紀錄。")
+        return index
+    except (json.JSONDecodeError, OSError) as e: logging.error(f"從 {filename} 載入更新紀錄失敗: {e}。將使用空的列表。"); return MediaIndex()
+    except Exception as e_generic: logging.error(f"從 {filename} 載入時發生未預期錯誤: {e_generic}。將使用空的列表。"); return MediaIndex()
+
+media_store = open_media_store()
+media_index = load_media_index()
 
    
     
+# --- 新鮮度追蹤 (檔案出現 → 推送完成) ---
+# 每個項目依序記錄各階段的時間；推送完成後輸出各區段耗時，並納入滾動百分位數。
+# 輪詢發現的項目以估計的出現時間為 first_seen，'discovered' 為實際被輪詢發現的時間；
+# 'publish_started' 為延遲發布 (GIT_ACTION_DELAY_SECONDS) 結束、開始產生頁面的時間。
+FRESHNESS_STAGES = ('first_seen', 'discovered', 'settled', 'parsed', 'persisted', 'publish_started', 'rendered', 'committed', 'pushed')
+FRESHNESS_SEGMENT_LABELS = {'discovered': '等待輪詢', 'settled': '寫入完成偵測', 'parsed': '解析', 'persisted': '儲存', 'publish_started': '發布延遲',
+                            'rendered': '產生頁面', 'committed': 'commit', 'pushed': 'push'} # 以區段結束的階段命名
+
+def percentile(sorted_values, fraction):
+    """sorted_values 須已排序；以最近排名法取百分位數，空列表回傳 None"""
+    if not sorted_values: return None
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)), 1) - 1]
+
+class FreshnessTracer:
+    """追蹤每個新項目從首次發現 (事件或輪詢) 到推送完成的各階段時間"""
+    def __init__(self, window_size=FRESHNESS_WINDOW_SIZE, max_traces=FRESHNESS_MAX_TRACES):
+        self.lock = threading.Lock()
+        self.traces = OrderedDict() # PathKey -> {'path', 'source', 'stages': {階段: Unix 時間}}
+        self.completed = deque(maxlen=window_size) # (總延遲, {區段: 秒數})
+        self.max_traces = max_traces
+        self.stats = {'started': 0, 'completed': 0, 'dropped': 0}
+
+    def start(self, path, source, path_key=None, when=None):
+        """首次發現項目；已在追蹤中 (例如事件與輪詢都發現) 時保留較早的紀錄"""
+        key = PathKey.of(path_key or path)
+        with self.lock:
+            if key in self.traces: return
+            self.traces[key] = {'path': path, 'source': source, 'stages': {'first_seen': when or time.time()}}
+            self.stats['started'] += 1
+            while len(self.traces) > self.max_traces: self.traces.popitem(last=False); self.stats['dropped'] += 1
+
+    def mark(self, path, stage, path_key=None, when=None):
+        key = PathKey.of(path_key or path)
+        with self.lock:
+            trace = self.traces.get(key)
+            if trace is not None: trace['stages'].setdefault(stage, when or time.time())
+
+    def mark_records(self, records, stage):
+        when = time.time()
+        for record in records:
+            if record.absolute_path: self.mark(record.absolute_path, stage, when=when)
+
+    def discard(self, path, path_key=None):
+        """項目不會發布 (被忽略、重複或處理失敗) 時停止追蹤"""
+        with self.lock: self.traces.pop(PathKey.of(path_key or path), None)
+
+    def advance_all(self, stage, required_stage, not_after=None):
+        """把已到達 required_stage (且不晚於 not_after)、尚未到達 stage 的項目都標記為 stage；回傳這些項目的鍵"""
+        now = time.time(); advanced = []
+        with self.lock:
+            for key, trace in self.traces.items():
+                stages = trace['stages']
+                if stage in stages or required_stage not in stages: continue
+                if not_after is not None and stages[required_stage] > not_after: continue
+                stages[stage] = now; advanced.append(key)
+        return advanced
+
+    def finalize(self, keys):
+        """結束追蹤並輸出各項目的延遲分解"""
+        finished = []
+        with self.lock:
+            for key in keys:
+                trace = self.traces.pop(key, None)
+                if trace is None: continue
+                stages = trace['stages']; present = [stage for stage in FRESHNESS_STAGES if stage in stages]
+                segments = {stage: max(stages[stage] - stages[previous], 0) for previous, stage in zip(present, present[1:])}
+                total = stages[present[-1]] - stages['first_seen']
+                self.completed.append((total, segments)); self.stats['completed'] += 1
+                finished.append((trace, segments, total))
+        if not finished: return
+        log_lines = []
+        for trace, segments, total in finished:
+            metric_freshness_seconds.observe(total, source=trace['source'])
+            for stage, seconds in segments.items(): metric_freshness_segment_seconds.observe(seconds, segment=stage)
+            logging.info(f"(新鮮度) {os.path.basename(trace['path'])} ({trace['source']}): 總計 {total:.1f} 秒 — "
+                         + ' / '.join(f"{FRESHNESS_SEGMENT_LABELS[stage]} {seconds:.1f}" for stage, seconds in segments.items()))
+            log_lines.append(json.dumps({'path': trace['path'], 'source': trace['source'], 'total': round(total, 3),
+                                         'stages': {stage: round(when, 3) for stage, when in trace['stages'].items()},
+                                         'segments': {stage: round(seconds, 3) for stage, seconds in segments.items()}}, ensure_ascii=False))
+        try:
+            with open(os.path.join(log_directory, FRESHNESS_LOG_FILE), 'a', encoding='utf-8') as f: f.write('\n'.join(log_lines) + '\n')
+        except OSError as e: logging.warning(f"寫入新鮮度紀錄 {FRESHNESS_LOG_FILE} 失敗: {e}")
+
+    def get_summary(self):
+        """最近完成項目的 p50/p95/p99 總延遲，以及各區段的 p95 與平均占比"""
+        with self.lock:
+            completed = list(self.completed); in_flight = len(self.traces); stats = dict(self.stats)
+        totals = sorted(total for total, _ in completed)
+        summary = {'count': len(totals), 'in_flight': in_flight, **stats,
+                   'p50': percentile(totals, 0.5), 'p95': percentile(totals, 0.95), 'p99': percentile(totals, 0.99), 'segments': {}}
+        grand_total = sum(totals)
+        for stage in FRESHNESS_STAGES[1:]:
+            values = sorted(segments[stage] for _, segments in completed if stage in segments)
+            if values: summary['segments'][stage] = {'p95': percentile(values, 0.95), 'share': sum(values) / grand_total if grand_total else 0}
+        return summary
+
+freshness_tracer = FreshnessTracer()
+
+def format_freshness_summary(summary):
+    if not summary['count']: return f"新鮮度: 尚無完成的項目 (追蹤中 {summary['in_flight']})"
+    segment_text = ', '.join(f"{FRESHNESS_SEGMENT_LABELS[stage]} {info['p95']:.1f}s/{info['share']:.0%}" for stage, info in summary['segments'].items())
+    return (f"新鮮度 p50/p95/p99: {summary['p50']:.1f}/{summary['p95']:.1f}/{summary['p99']:.1f} 秒 (最近 {summary['count']} 項，追蹤中 {summary['in_flight']})，"
+            f"各區段 p95/占比: {segment_text}")
+
 # --- HTML Escape 函數 ---
 def escape_html(text):
     if not text: return ""
     return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
 
+# --- 檔案寫入完成偵測 (取代固定的 time.sleep 等待) ---
+# 以大小與修改時間作為簽章，短間隔起步、持續變動時逐次拉長間隔複查；簽章維持不變一段時間後才放行。
+def get_settle_signature(path, is_directory=False):
+    """回傳路徑的 (大小, 修改時間) 簽章；目錄則彙總其直接子項目。路徑不存在時回傳 None"""
+    try:
+        if not is_directory:
+            stat_result = os.stat(path)
+            return (stat_result.st_size, stat_result.st_mtime_ns)
+        entry_count, total_size, latest_mtime_ns = 0, 0, os.stat(path).st_mtime_ns
+        with os.scandir(path) as entries:
+            for entry in entries:
+                stat_result = entry.stat(follow_symlinks=False)
+                entry_count += 1; latest_mtime_ns = max(latest_mtime_ns, stat_result.st_mtime_ns)
+                if entry.is_file(follow_symlinks=False): total_size += stat_result.st_size
+        return (entry_count, total_size, latest_mtime_ns)
+    except OSError:
+        return None
+
+def new_settle_state(path, is_directory=False, max_wait=SETTLE_MAX_WAIT_SECONDS):
+    now = time.time()
+    return {'path': path, 'is_directory': is_directory, 'max_wait': max_wait, 'first_seen': now,
+            'signature': None, 'stable_since': now, 'interval': SETTLE_INITIAL_INTERVAL_SECONDS,
+            'stable_seconds': SETTLE_DIRECTORY_STABLE_SECONDS if is_directory else SETTLE_STABLE_SECONDS, 'old_file': False}
+
+def advance_settle_state(state, now):
+    """複查一次並更新狀態；回傳 'settled'、'pending' 或 'gone' (路徑已消失，例如暫存檔被改名)"""
+    signature = get_settle_signature(state['path'], state['is_directory'])
+    if signature is None: return 'gone'
+    if signature != state['signature']:
+        is_first_check = state['signature'] is None
+        state['signature'] = signature; state['stable_since'] = now
+        if is_first_check: state['old_file'] = now - signature[-1] / 1e9 >= SETTLE_OLD_FILE_SECONDS # 舊檔案只縮短複查間隔，仍須再確認一次未變動
+        else:
+            state['old_file'] = False # 修改時間雖舊但大小仍在變 (例如保留原修改時間的複製)，改用一般穩定期
+            state['interval'] = min(state['interval'] * 2, SETTLE_MAX_INTERVAL_SECONDS)
+    elif state['old_file'] or now - state['stable_since'] >= state['stable_seconds']: # 連續兩次簽章相同
+        return 'settled'
+    if now - state['first_seen'] >= state['max_wait']:
+        logging.warning(f"[{os.path.basename(state['path'])}] (寫入偵測) 等待超過 {state['max_wait']} 秒仍在變動，照常繼續處理。")
+        return 'settled'
+    return 'pending'
+
+def next_settle_delay(state, now):
+    """下一次複查前的等待秒數；簽章未變時只等到穩定期滿為止"""
+    delay = state['interval']
+    if state['signature'] is not None:
+        delay = min(delay, max(state['stable_since'] + (0 if state['old_file'] else state['stable_seconds']) - now, 0.05))
+    return delay
+
+def wait_until_settled(path, is_directory=False, max_wait=SETTLE_MAX_WAIT_SECONDS):
+    """阻塞直到路徑寫入完成 (供輪詢與 NFO 使用)；路徑消失時回傳 False"""
+    state = new_settle_state(path, is_directory, max_wait)
+    while True:
+        now = time.time(); result = advance_settle_state(state, now)
+        if result != 'pending': return result == 'settled'
+        time.sleep(next_settle_delay(state, now))
+
+class SettleScheduler:
+    """以單一計時執行緒同時追蹤多個寫入中的路徑，穩定後呼叫 on_settled(path, is_directory, path_key)"""
+    def __init__(self, on_settled):
+        self.on_settled = on_settled
+        self.condition = threading.Condition()
+        self.pending = {} # PathKey -> 偵測狀態
+        self.heap = [] # (下次複查時間, 序號, PathKey)
+        self.sequence = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='settle-scheduler', daemon=True)
+        self.thread.start()
+
+    def submit(self, path, is_directory=False, path_key=None):
+        """加入追蹤；同一路徑已在等待中時合併為一筆，回傳 False"""
+        key = PathKey.of(path_key or path)
+        with self.condition:
+            if key in self.pending: return False
+            self.pending[key] = new_settle_state(path, is_directory); self.pending[key]['key'] = key
+            self._schedule(key, time.time())
+            self.condition.notify()
+        return True
+
+    def pending_count(self):
+        with self.condition: return len(self.pending)
+
+    def _schedule(self, key, due_time):
+        self.sequence += 1
+        heapq.heappush(self.heap, (due_time, self.sequence, key))
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.time():
+                    self.condition.wait(timeout=self.heap[0][0] - time.time() if self.heap else None)
+                _, _, key = heapq.heappop(self.heap)
+                state = self.pending[key]
+            now = time.time()
+            try: result = advance_settle_state(state, now) # stat 可能較慢 (雲端硬碟)，不持有鎖
+            except Exception as e: logging.exception(f"[{os.path.basename(state['path'])}] (寫入偵測) 檢查時發生錯誤: {e}"); result = 'gone'
+            with self.condition:
+                if result == 'pending':
+                    self._schedule(key, now + next_settle_delay(state, now)); continue
+                del self.pending[key]
+            if result == 'gone':
+                logging.info(f"[{os.path.basename(state['path'])}] (寫入偵測) 路徑已不存在，放棄追蹤。"); continue
+            logging.debug(f"[{os.path.basename(state['path'])}] (寫入偵測) 已穩定，等待 {now - state['first_seen']:.2f} 秒。")
+            try: self.on_settled(state['path'], state['is_directory'], state['key'])
+            except Exception as e: logging.exception(f"[{os.path.basename(state['path'])}] (寫入偵測) 交付處理時發生錯誤: {e}")
+
 # --- 核心處理邏輯函數 ---
-def process_new_media(filepath, is_directory_event=False):
+def process_new_media(filepath, is_directory_event=False, settled=False, path_key=None):
+    """處理單一新項目並記錄耗時；回傳新紀錄或 None"""
+    started = time.perf_counter(); update_info = None
+    try:
+        update_info = process_new_media_item(filepath, is_directory_event, settled, path_key)
+        return update_info
+    finally:
+        metric_process_seconds.observe(time.perf_counter() - started, result='added' if update_info else 'ignored')
+        if update_info: freshness_tracer.mark(filepath, 'parsed', path_key)
+        else: freshness_tracer.discard(filepath, path_key)
+
+def process_new_media_item(filepath, is_directory_event=False, settled=False, path_key=None):
+    # settled=True 表示呼叫端 (寫入偵測排程器) 已確認項目寫入完成；path_key 為呼叫端已算好的 PathKey
     item_name = os.path.basename(filepath)
     logging.debug(f"[{item_name}] (process_new_media) >> 開始處理 {'目錄' if is_directory_event else '檔案'}: {filepath}...")
     try:
-        config = get_media_config(filepath)
+        config = get_media_config(path_key or filepath)
         if not config:
             logging.warning(f"[{item_name}] (process_new_media) << 在 PATH_CONFIG 中找不到對應設定，忽略。")
             return None
@@ -179,13 +1483,15 @@ def process_new_media(filepath, is_directory_event=False):
                 logging.debug(f"[{item_name}] (process_new_media) << 非 'collection' 目錄事件 (分類為 {category})，忽略。")
                 return None
             
-            logging.debug(f"[{item_name}] (process_new_media) >> 目錄分類為 'collection'，等待 5 秒...")
-            time.sleep(5)
+            if not settled:
+                logging.debug(f"[{item_name}] (process_new_media) >> 目錄分類為 'collection'，等待目錄內容寫入完成...")
+                wait_until_settled(filepath, is_directory=True)
+                freshness_tracer.mark(filepath, 'settled', path_key)
             
             nfo_path = os.path.join(filepath, 'tvshow.nfo')
             tmdb_id, plot = None, None
-            if os.path.exists(nfo_path):
-                time.sleep(2)
+            if cached_path_exists(nfo_path):
+                wait_until_settled(nfo_path, max_wait=NFO_SETTLE_MAX_WAIT_SECONDS)
                 tmdb_id, plot = parse_nfo(nfo_path)
             else:
                 logging.warning(f"[{item_name}] (process_new_media) >> 在 collection 目錄中未找到 tvshow.nfo。")
@@ -195,16 +1501,11 @@ def process_new_media(filepath, is_directory_event=False):
             except ValueError:
                 relative_path = item_name
 
-            update_info = {
-                'filename': item_name, 'absolute_path': filepath, 'relative_path': relative_path,
-                'timestamp': datetime.datetime.now(), 'category': 'collection',
-                'tmdb_id': tmdb_id, 'tmdb_url': f"https://www.themoviedb.org/tv/{tmdb_id}" if tmdb_id else None,
-                'plot': plot
-            }
+            update_info = MediaRecord(item_name, filepath, relative_path, to_epoch_us(datetime.datetime.now()), 'collection', tmdb_id, plot)
             logging.debug(f"[{item_name}] (process_new_media) << 目錄處理完成。")
             return update_info
 
-        elif os.path.isfile(filepath):
+        elif cached_isfile(filepath):
             if category == 'collection':
                 logging.debug(f"[{item_name}] (process_new_media) << 檔案位於 'collection' 目錄下，由目錄事件統一處理，忽略此檔案事件。")
                 return None
@@ -213,24 +1514,25 @@ def process_new_media(filepath, is_directory_event=False):
                 logging.debug(f"[{item_name}] (process_new_media) << 副檔名不符，忽略。")
                 return None
 
-            logging.debug(f"[{item_name}] (process_new_media) >> 等待 5 秒...")
-            time.sleep(5)
+            if not settled:
+                logging.debug(f"[{item_name}] (process_new_media) >> 等待檔案寫入完成...")
+                if not wait_until_settled(filepath):
+                    logging.info(f"[{item_name}] (process_new_media) << 檔案在寫入完成前已消失，忽略。")
+                    return None
+                freshness_tracer.mark(filepath, 'settled', path_key)
             
             try:
                 relative_path = os.path.relpath(filepath, base_path)
             except ValueError:
                 relative_path = filepath
             
-            update_info = {
-                'filename': item_name, 'absolute_path': filepath, 'relative_path': relative_path,
-                'timestamp': datetime.datetime.now(), 'category': category,
-                'tmdb_id': None, 'tmdb_url': None, 'plot': None
-            }
+            timestamp_us = to_epoch_us(datetime.datetime.now()) # 以寫入完成的時間為準，NFO 解析時間不計入
+            tmdb_id, plot = None, None
 
             if category in ['movie', 'tvshow']:
                 nfo_path, nfo_type = find_nfo_path(filepath)
                 if nfo_path:
-                    time.sleep(5)
+                    wait_until_settled(nfo_path, max_wait=NFO_SETTLE_MAX_WAIT_SECONDS)
                     tmdb_id, plot = parse_nfo(nfo_path)
                     if not tmdb_id and nfo_type == 'self' and category == 'tvshow':
                         logging.info(f"[{item_name}] 本地 NFO ({nfo_path}) 缺少 TMDb ID，嘗試父級...")
@@ -241,15 +1543,12 @@ def process_new_media(filepath, is_directory_event=False):
                                  tmdb_id = tmdb_id_parent
                                  plot = plot if plot else plot_parent
                                  logging.info(f"[{item_name}] 從父級 NFO ({parent_nfo_path}) 獲取到 TMDb ID: {tmdb_id}")
-                    if tmdb_id:
-                        update_info['tmdb_id'] = tmdb_id
-                        update_info['tmdb_url'] = f"https://www.themoviedb.org/{'movie' if category == 'movie' else 'tv'}/{tmdb_id}"
-                    if plot:
-                        update_info['plot'] = plot
             elif category == 'magazine':
-                update_info['plot'] = "雜誌已更新。"
+                plot = "雜誌已更新。"
             elif category == 'animation':
-                update_info['plot'] = "動漫已更新。"
+                plot = "動漫已更新。"
+
+            update_info = MediaRecord(item_name, filepath, relative_path, timestamp_us, category, tmdb_id or None, plot or None)
 
             logging.debug(f"[{item_name}] (process_new_media) << 檔案處理完成。")
             return update_info
@@ -260,25 +1559,190 @@ def process_new_media(filepath, is_directory_event=False):
         logging.exception(f"[{item_name}] (process_new_media) !! 處理時發生未預期錯誤: {e}")
         return None
 
+# --- 靜態資源 (CSS/JS) ---
+# 頁面的樣式與腳本輸出為 assets/ 下以內容雜湊命名的檔案；內容不變時檔名不變，瀏覽器可長期快取，git 也不會有差異。
+INDEX_PAGE_CSS = """
+body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; padding: 15px; background-color: #f8f9fa; color: #333; }
+.container { max-width: 1200px; margin: 0 auto; }
+h1 { text-align: center; color: #0056b3; margin-bottom: 10px; }
+.archive-link-container { text-align: center; margin-bottom: 20px; }
+.archive-link-container a { font-size: 1.1em; color: #17a2b8; text-decoration: none; padding: 8px 15px; border-radius: 4px; transition: background-color 0.2s ease, color 0.2s ease; }
+.archive-link-container a:hover { background-color: #17a2b8; color: white; text-decoration: none; }
+.search-container { margin-bottom: 20px; text-align: center; }
+#search-input { padding: 8px 12px; font-size: 1em; border: 1px solid #ccc; border-radius: 4px; width: 60%; max-width: 400px; transition: border-color 0.2s ease, box-shadow 0.2s ease; }
+#search-input:focus { border-color: #007bff; box-shadow: 0 0 0 2px rgba(0, 123, 255, 0.25); outline: none; }
+.tab-buttons { display: flex; justify-content: center; margin-bottom: 25px; border-bottom: 2px solid #dee2e6; flex-wrap: wrap; padding: 0 10px; }
+.tab-button { padding: 10px 15px; cursor: pointer; border: none; background-color: transparent; font-size: 1.05em; color: #007bff; margin: 0 3px 0px 3px; border-bottom: 3px solid transparent; transition: color 0.2s ease, border-color 0.2s ease; white-space: nowrap; }
+.tab-button:hover { color: #0056b3; }
+.tab-button.active { color: #0056b3; font-weight: bold; border-bottom-color: #0056b3; }
+/* *** 新增：Tab 上最新日期的樣式 *** */
+.tab-latest-date { font-size: 0.8em; color: #6c757d; margin-left: 5px; font-weight: normal; }
+.tab-content { }
+.content-pane { display: none; animation: fadeIn 0.3s ease-in-out; }
+.content-pane.active { display: block; }
+@keyframes fadeIn { from { opacity: 0; } to { opacity: 1; } }
+.day-group { margin-bottom: 15px; border: 1px solid #e9ecef; border-radius: 4px; background-color: #fff; overflow: hidden; }
+.day-header { background-color: #f1f3f5; color: #495057; padding: 10px 15px; margin: 0; cursor: pointer; font-weight: bold; display: flex; align-items: center; transition: background-color 0.2s ease; }
+.day-header:hover { background-color: #e9ecef; }
+.toggle-icon { display: inline-block; width: 1em; margin-right: 8px; text-align: center; font-weight: bold; }
+.update-list { list-style: none; padding: 0 15px 15px 15px; margin: 0; display: none; }
+.update-list.visible { display: block; }
+h3 { color: #17a2b8; margin-top: 20px; margin-bottom: 10px; border-left: 4px solid #17a2b8; padding-left: 10px; font-size: 1.3em; }
+li.update-item { margin-bottom: 10px; padding: 10px 12px; background-color: #fff; border: none; border-bottom: 1px solid #eee; border-radius: 0; box-shadow: none; transition: background-color 0.1s ease; }
+li.update-item:last-child { border-bottom: none; }
+.item-header { display: flex; justify-content: space-between; align-items: baseline; margin-bottom: 4px; }
+.item-header strong { font-size: 1.05em; color: #003975; margin-bottom: 0; flex-grow: 1; margin-right: 10px; word-break: break-all; }
+.item-time { font-size: 0.8em; color: #777; white-space: nowrap; }
+.file-path { font-family: 'Courier New', Courier, monospace; font-size: 0.8em; color: #666; margin-bottom: 6px; word-break: break-all; }
+blockquote { margin: 6px 0 6px 0px; padding: 6px 10px; border-left: 3px solid #007bff; background-color: #e9f5ff; color: #333; font-size: 0.85em; }
+a { color: #007bff; text-decoration: none; }
+a:hover { text-decoration: underline; }
+.tmdb-link { display: inline-block; margin-top: 4px; font-size: 0.85em; }
+.update-item.hidden-item { display: none; }
+.load-more-button.day-pagination { display: block; margin: 15px auto 5px auto; padding: 8px 16px; font-size: 0.9em; cursor: pointer; background-color: #28a745; color: white; border: none; border-radius: 4px; transition: background-color 0.2s ease; }
+.load-more-button.day-pagination:hover { background-color: #218838; }
+.highlight { background-color: yellow; font-weight: bold; }
+.update-item.search-hidden { display: none !important; }
+.day-group.search-hidden { display: none !important; }
+h3.search-hidden { display: none !important; }
+.search-active .load-more-button.day-pagination { display: none !important; }
+.footer-time { margin-top: 40px; text-align: center; font-size: 0.9em; color: #888; }
+"""
+
+INDEX_PAGE_JS = """
+document.addEventListener('DOMContentLoaded', function() {
+    const itemsPerPage = PAGE_CONFIG.itemsPerPage;
+    const tabButtons = document.querySelectorAll('.tab-button'); const contentPanes = document.querySelectorAll('.content-pane');
+    const tabContainer = document.querySelector('.tab-buttons'); const searchInput = document.getElementById('search-input');
+    const container = document.querySelector('.container'); const latestDateStr = PAGE_CONFIG.latestDateStr;
+    if (tabContainer) { tabContainer.addEventListener('click', function(event) { if (event.target.classList.contains('tab-button')) {
+        const targetCategory = event.target.getAttribute('data-category'); tabButtons.forEach(button => { button.classList.remove('active'); }); event.target.classList.add('active');
+        contentPanes.forEach(pane => { pane.classList.toggle('active', pane.id === `pane-${targetCategory}`); });
+        filterItems(); resetAccordionState(targetCategory); updateAllPaginationButtonsVisibility(); } });
+    } else { console.error("Tab container not found!"); }
+    contentPanes.forEach(pane => { pane.addEventListener('click', function(event) {
+        const header = event.target.closest('.day-header');
+        if (header && !event.target.closest('.load-more-button')) {
+            const targetListId = header.getAttribute('data-target'); const targetList = pane.querySelector(targetListId);
+            const dayGroup = header.parentElement; const icon = header.querySelector('.toggle-icon');
+            if (targetList && dayGroup && icon) { dayGroup.classList.toggle('expanded'); targetList.classList.toggle('visible'); icon.textContent = dayGroup.classList.contains('expanded') ? '-' : '+'; } } }); });
+     function setupDayPagination(listElement) { if (!listElement) return; const listId = listElement.id; const button = listElement.parentElement.querySelector(`.load-more-button.day-pagination[data-target-list="#${listId}"]`); if (!button) { return; }
+         const allItemsInList = listElement.querySelectorAll('.update-item'); let visibleCount = 0;
+         allItemsInList.forEach(item => { if (!item.classList.contains('hidden-item') && !item.classList.contains('search-hidden')) { visibleCount++; } });
+         const totalVisibleItems = Array.from(allItemsInList).filter(item => !item.classList.contains('search-hidden')).length;
+         button.style.display = (totalVisibleItems > visibleCount && !container.classList.contains('search-active')) ? 'block' : 'none';
+         if (!button.dataset.listenerAttached) { button.addEventListener('click', function() { let newlyShown = 0; const hiddenItems = listElement.querySelectorAll('.update-item.hidden-item:not(.search-hidden)'); hiddenItems.forEach((item) => { if (newlyShown < itemsPerPage) { item.classList.remove('hidden-item'); newlyShown++; } }); if (listElement.querySelectorAll('.update-item.hidden-item:not(.search-hidden)').length === 0) { button.style.display = 'none'; } }); button.dataset.listenerAttached = 'true'; } }
+    function updateAllPaginationButtonsVisibility() { document.querySelectorAll('ul.update-list').forEach(list => { setupDayPagination(list); const button = list.parentElement.querySelector(`.load-more-button.day-pagination[data-target-list="#${list.id}"]`); if (button && container.classList.contains('search-active')) { button.style.display = 'none'; } }); }
+    function filterItems() { const searchTerm = searchInput.value.toLowerCase().trim(); const activeTabButton = document.querySelector('.tab-button.active'); const activeCategory = activeTabButton ? activeTabButton.getAttribute('data-category') : null; container.classList.toggle('search-active', searchTerm !== ""); if (!activeCategory) return; const searchNorm = toTrad(searchTerm); let visibleMonths = new Set(); let visibleDays = new Set();
+        document.querySelectorAll('.update-item').forEach(item => { const itemCategory = item.getAttribute('data-category'); let isMatch = false;
+            if (itemCategory === activeCategory) { if (searchTerm === "") { isMatch = true; } else { if (item.getAttribute('data-search').includes(searchNorm)) { isMatch = true; } } }
+            item.classList.toggle('search-hidden', !isMatch);
+            if (isMatch) { const dayGroup = item.closest('.day-group'); if (dayGroup) { visibleDays.add(dayGroup); const monthHeader = dayGroup.previousElementSibling; if (monthHeader && monthHeader.tagName === 'H3') { visibleMonths.add(monthHeader); } if (!dayGroup.classList.contains('expanded')) { dayGroup.classList.add('expanded'); const list = dayGroup.querySelector('.update-list'); if (list) list.classList.add('visible'); const icon = dayGroup.querySelector('.toggle-icon'); if (icon) icon.textContent = '-'; } } } });
+        document.querySelectorAll('.day-group').forEach(group => { const parentPane = group.closest('.content-pane'); if (parentPane && parentPane.id === `pane-${activeCategory}`) { group.classList.toggle('search-hidden', !visibleDays.has(group)); } else if (!parentPane || !parentPane.classList.contains('active')) { group.classList.add('search-hidden'); } });
+         document.querySelectorAll('.tab-content h3').forEach(h3 => { const parentPane = h3.closest('.content-pane'); if (parentPane && parentPane.id === `pane-${activeCategory}`) { h3.classList.toggle('search-hidden', !visibleMonths.has(h3)); } else if (!parentPane || !parentPane.classList.contains('active')) { h3.classList.add('search-hidden'); } });
+         if (searchTerm === "") { resetAccordionState(activeCategory); updateAllPaginationButtonsVisibility(); } else { document.querySelectorAll('.load-more-button.day-pagination').forEach(btn => { btn.style.display = 'none'; }); } }
+    function resetAccordionState(activeCategory) { document.querySelectorAll('.day-group').forEach(group => { const parentPane = group.closest('.content-pane'); const dayHeader = group.querySelector('.day-header'); const list = group.querySelector('.update-list'); const icon = group.querySelector('.toggle-icon');
+        if (parentPane && dayHeader && list && icon) { if(parentPane.id === `pane-${activeCategory}`) { const listId = list.id; const dateStrFromId = listId ? listId.split('-').pop() : null; const isLatestDay = latestDateStr && dateStrFromId && dateStrFromId === latestDateStr.replace(/-/g, ''); group.classList.toggle('expanded', isLatestDay); list.classList.toggle('visible', isLatestDay); icon.textContent = isLatestDay ? '-' : '+'; } else { group.classList.remove('expanded'); list.classList.remove('visible'); icon.textContent = '+'; } } }); }
+    if (searchInput) { searchInput.addEventListener('input', filterItems); }
+    updateAllPaginationButtonsVisibility(); const initialActiveTabButton = document.querySelector('.tab-button.active'); const initialActiveCategory = initialActiveTabButton ? initialActiveTabButton.getAttribute('data-category') : null; if(initialActiveCategory) { resetAccordionState(initialActiveCategory); }
+});
+"""
+
+ARCHIVE_PAGE_CSS = """
+body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; padding: 15px; background-color: #f8f9fa; color: #333; } .container { max-width: 1200px; margin: 0 auto; } h1 { text-align: center; color: #0056b3; margin-bottom: 20px; } .search-container { margin-bottom: 20px; text-align: center; } #archive-search-input { padding: 8px 12px; font-size: 1em; border: 1px solid #ccc; border-radius: 4px; width: 60%; max-width: 400px; } .archive-controls { margin-bottom: 20px; text-align: center; } .archive-controls label { margin-right: 10px; } .archive-controls select, .archive-controls input[type="number"] { padding: 6px; border-radius: 4px; border: 1px solid #ccc; margin-right: 15px;} #loading-indicator { text-align: center; font-size: 1.2em; padding: 20px; display: none; } #archive-results-container { margin-top: 20px; } .pagination-controls { text-align: center; margin-top: 20px; } .pagination-controls button { padding: 8px 15px; margin: 0 5px; cursor: pointer; background-color: #007bff; color:white; border:none; border-radius:4px; } .pagination-controls button:disabled { background-color: #ccc; cursor: not-allowed; } .pagination-info { margin: 0 15px; } .tab-buttons { display: flex; justify-content: center; margin-bottom: 25px; border-bottom: 2px solid #dee2e6; flex-wrap: wrap; padding: 0 10px; } .tab-button { padding: 10px 15px; cursor: pointer; border: none; background-color: transparent; font-size: 1.05em; color: #007bff; margin: 0 3px 0px 3px; border-bottom: 3px solid transparent; transition: color 0.2s ease, border-color 0.2s ease; white-space: nowrap; } .tab-button:hover { color: #0056b3; } .tab-button.active { color: #0056b3; font-weight: bold; border-bottom-color: #0056b3; } .content-pane { display: none; animation: fadeIn 0.3s ease-in-out; } .content-pane.active { display: block; } @keyframes fadeIn { from { opacity: 0; } to { opacity: 1; } } .day-group { margin-bottom: 15px; border: 1px solid #e9ecef; border-radius: 4px; background-color: #fff; overflow: hidden; } .day-header { background-color: #f1f3f5; color: #495057; padding: 10px 15px; margin: 0; cursor: pointer; font-weight: bold; display: flex; align-items: center; transition: background-color 0.2s ease; } .day-header:hover { background-color: #e9ecef; } .toggle-icon { display: inline-block; width: 1em; margin-right: 8px; text-align: center; font-weight: bold; } .update-list { list-style: none; padding: 0 15px 15px 15px; margin: 0; display: none; } .update-list.visible { display: block; } h3 { color: #17a2b8; margin-top: 20px; margin-bottom: 10px; border-left: 4px solid #17a2b8; padding-left: 10px; font-size: 1.3em; } li.update-item { margin-bottom: 10px; padding: 10px 12px; background-color: #fff; border: none; border-bottom: 1px solid #eee; border-radius: 0; box-shadow: none; transition: background-color 0.1s ease; } li.update-item:last-child { border-bottom: none; } .item-header { display: flex; justify-content: space-between; align-items: baseline; margin-bottom: 4px; } .item-header strong { font-size: 1.05em; color: #003975; margin-bottom: 0; flex-grow: 1; margin-right: 10px; word-break: break-all; } .item-time { font-size: 0.8em; color: #777; white-space: nowrap; } .file-path { font-family: 'Courier New', Courier, monospace; font-size: 0.8em; color: #666; margin-bottom: 6px; word-break: break-all; } blockquote { margin: 6px 0 6px 0px; padding: 6px 10px; border-left: 3px solid #007bff; background-color: #e9f5ff; color: #333; font-size: 0.85em; } a { color: #007bff; text-decoration: none; } a:hover { text-decoration: underline; } .tmdb-link { display: inline-block; margin-top: 4px; font-size: 0.85em; } .highlight { background-color: yellow; font-weight: bold; } .footer-time { margin-top: 40px; text-align: center; font-size: 0.9em; color: #888; } .no-results { text-align: center; padding: 20px; font-style: italic; color: #6c757d; }
+"""
+
+def build_search_normalize_js():
+    """index.html 與 archive.html 共用的繁簡轉換腳本，對照表與 Python 端 SIMP_TO_TRAD_MAP 相同"""
+    return ("// 簡易繁簡轉換 (由 watcher 依 SIMP_TO_TRAD_MAP 產生，index.html 與 archive.html 共用)\n"
+            f"const tsMap = {json.dumps(SIMP_TO_TRAD_MAP, ensure_ascii=False)};\n"
+            "const stMap = {}; for (const t in tsMap) { stMap[tsMap[t]] = t; }\n"
+            "function toSimp(t) { if(!t) return \"\"; let r=\"\"; for(let i=0;i<t.length;i++) { r += stMap[t[i]]||t[i]; } return r; }\n"
+            "function toTrad(t) { if(!t) return \"\"; let r=\"\"; for(let i=0;i<t.length;i++) { r += tsMap[t[i]]||t[i]; } return r; }\n")
+
+def publish_static_asset(logical_name, extension, content):
+    """以內容雜湊命名寫入 assets/；檔案已存在則不重寫，並移除同名的舊版本。回傳頁面使用的相對路徑"""
+    content_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]
+    asset_filename = f"{logical_name}.{content_hash}.{extension}"
+    assets_dir = os.path.join(OUTPUT_DIRECTORY, ASSETS_DIRECTORY)
+    asset_path = os.path.join(assets_dir, asset_filename)
+    if not os.path.exists(asset_path):
+        write_file_atomic(asset_path, content)
+        logging.info(f"已輸出靜態資源: {ASSETS_DIRECTORY}/{asset_filename}")
+        stale_pattern = re.compile(rf"^{re.escape(logical_name)}\.[0-9a-f]{{10}}\.{re.escape(extension)}$")
+        for existing_name in os.listdir(assets_dir):
+            if existing_name != asset_filename and stale_pattern.match(existing_name):
+                try: remove_published_output(os.path.join(assets_dir, existing_name)); logging.info(f"已移除舊版靜態資源: {existing_name}")
+                except OSError as e: logging.warning(f"移除舊版靜態資源 {existing_name} 失敗: {e}")
+    return f"{ASSETS_DIRECTORY}/{asset_filename}"
+
+def publish_static_assets():
+    """輸出兩個頁面引用的 CSS/JS，回傳 {名稱: 相對路徑}"""
+    with open(os.path.join(REPO_PATH, ARCHIVE_JS_FILE), 'r', encoding='utf-8') as f: archive_js = f.read()
+    return {
+        'index_css': publish_static_asset('index', 'css', INDEX_PAGE_CSS),
+        'index_js': publish_static_asset('index', 'js', INDEX_PAGE_JS),
+        'archive_css': publish_static_asset('archive', 'css', ARCHIVE_PAGE_CSS),
+        'archive_js': publish_static_asset('archive_script', 'js', archive_js),
+        'search_js': publish_static_asset('search_normalize', 'js', build_search_normalize_js()),
+    }
+
+# --- 依 (分類, 日期) 快取已渲染的 HTML 片段 ---
+day_fragment_cache = {} # (category, 'YYYY-MM-DD') -> (內容雜湊, html)
+
+def render_day_group_html(category_key, day, day_items, is_latest_day_in_active_pane, items_per_page_val):
+    try: day_str = datetime.datetime.strptime(day, "%Y-%m-%d").strftime("%m 月 %d 日 (%A)")
+    except ValueError: day_str = day
+    day_html = ""
+    day_group_classes = "day-group" + (" expanded" if is_latest_day_in_active_pane else ""); list_id = f"list-{category_key}-{day.replace('-', '')}"
+    day_html += f'            <div class="{day_group_classes}">\n'; day_html += f'                <h4 class="day-header" data-target="#{list_id}"><span class="toggle-icon">{"+" if not is_latest_day_in_active_pane else "-"}</span> {day_str}</h4>\n'; list_visibility_class = "visible" if is_latest_day_in_active_pane else ""
+    day_html += f'                <ul class="update-list {list_visibility_class}" id="{list_id}" data-category="{category_key}">\n'
+    item_counter_for_day = 0
+    for item in day_items:
+        item_counter_for_day += 1; visibility_class = "hidden-item" if item_counter_for_day > items_per_page_val else ""
+        time_str = item.timestamp.strftime('%H:%M:%S'); plot_text = item.plot or ''; escaped_plot = escape_html(plot_text); item_display_name = escape_html(item.filename); relative_path_text = escape_html(item.relative_path); tmdb_url_val = item.tmdb_url
+        data_path_for_search = relative_path_text; data_filename_for_search = item_display_name if category_key == 'magazine' else ""; data_search_text = escape_html(search_text_for_record(item.category, item.filename, item.relative_path))
+        day_html += f'                    <li class="update-item {visibility_class}" data-filename="{data_filename_for_search}" data-path="{data_path_for_search}" data-search="{data_search_text}" data-category="{category_key}">\n'; day_html += '                       <div class="item-header">\n'; day_html += f"                            <strong>{item_display_name}</strong>\n"; day_html += f"                            <span class='item-time'>{time_str}</span>\n"; day_html += '                       </div>\n'; day_html += f"                        <div class='file-path'>{relative_path_text}</div>\n"
+        if tmdb_url_val: day_html += f'                        <a href="{tmdb_url_val}" target="_blank" class="tmdb-link">TMDb 連結</a>\n'
+        if escaped_plot: day_html += f"                        <blockquote>{escaped_plot}</blockquote>\n"; day_html += "                    </li>\n"
+    day_html += '                </ul>\n'
+    if item_counter_for_day > items_per_page_val: day_html += f'                <button class="load-more-button day-pagination" data-target-list="#{list_id}" style="display: none;">顯示更多</button>\n'
+    day_html += '            </div>\n'
+    return day_html
+
+def get_day_group_html(category_key, day, day_items, is_latest_day_in_active_pane, items_per_page_val):
+    """只有當天項目內容或展開狀態改變時才重新渲染該日的區塊；以 sha1 比對序列化後的欄位 (內建 hash() 碰撞時會沿用錯誤的片段)"""
+    fragment_fields = [is_latest_day_in_active_pane, items_per_page_val, [item.to_row() for item in day_items]]
+    content_hash = hashlib.sha1(json.dumps(fragment_fields, ensure_ascii=False, separators=(',', ':')).encode('utf-8')).hexdigest()
+    cached = day_fragment_cache.get((category_key, day))
+    if cached is not None and cached[0] == content_hash: return cached[1]
+    day_html = render_day_group_html(category_key, day, day_items, is_latest_day_in_active_pane, items_per_page_val)
+    day_fragment_cache[(category_key, day)] = (content_hash, day_html)
+    return day_html
+
 # --- HTML 生成函數 ---
 # --- HTML 生成函數 (V9.1.3 - 徹底移除錯誤註解，調整歷史連結位置) ---
 # --- HTML 生成函數 (V9.1.4 - Tab 顯示最新日期) ---
-def generate_html(all_updates_full_history):
+TAB_CONTENT_MARKER = '\x00TAB_CONTENT\x00' # 頁面樣板中分頁內容的位置
+
+GENERATED_TIME_MARKER = '\x00GENERATED_TIME\x00' # 頁面樣板中生成時間的位置 (以 VolatileChunk 輸出)
+
+def iter_index_html(all_updates_full_history, asset_urls=None):
+    """以片段串流產生 index.html，不需在記憶體中組合整頁"""
     global MAX_ITEMS_ON_INDEX_PAGE, ARCHIVE_HTML_FILE, DEFAULT_CATEGORY # 確保引用
-    updates_to_display = sorted(all_updates_full_history, key=lambda x: x.get('timestamp', datetime.datetime.min), reverse=True)[:MAX_ITEMS_ON_INDEX_PAGE]
+    updates_to_display = get_latest_updates(all_updates_full_history, MAX_ITEMS_ON_INDEX_PAGE)
     logging.info(f"將從 {len(all_updates_full_history)} 筆總記錄中，選取最新的 {len(updates_to_display)} 筆用於產生 index.html。")
     
     categorized_updates = defaultdict(list);
     for update in updates_to_display: # 注意：這裡使用的是 updates_to_display
-        category = update.get('category', 'unknown')
-        categorized_updates[category].append(update)
+        categorized_updates[update.category].append(update)
 
     # *** 修改開始：計算每個分類的最新更新日期 ***
     category_latest_dates = {}
     for category_key, items_in_category in categorized_updates.items():
         if items_in_category:
             # items_in_category 已經是按時間倒序的 (因為 updates_to_display 是)
-            latest_item_timestamp = items_in_category[0].get('timestamp')
+            latest_item_timestamp = items_in_category[0].timestamp
             if isinstance(latest_item_timestamp, datetime.datetime):
                 category_latest_dates[category_key] = latest_item_timestamp.strftime('%m/%d') # 只顯示月/日
             else:
@@ -287,6 +1751,7 @@ def generate_html(all_updates_full_history):
             category_latest_dates[category_key] = "--" # 此分類無項目
     # *** 修改結束 ***    
 
+    asset_urls = asset_urls or publish_static_assets()
     now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'); items_per_page_val = ITEMS_PER_PAGE; default_category_val = DEFAULT_CATEGORY
     tab_buttons_html = ""; categories_order = [('tvshow', '劇集'), ('movie', '電影'), ('collection', '全集'), ('animation', '動漫'), ('magazine', '雜誌')]; available_categories = []
     default_category_has_content = bool(categorized_updates.get(default_category_val))
@@ -320,102 +1785,18 @@ def generate_html(all_updates_full_history):
          tab_buttons_html += f'        <button class="tab-button {is_active}" data-category="unknown">{button_text_unknown}</button>\n'; 
          available_categories.append('unknown')
          
-    tab_content_html = ""; processed_categories = categories_order + [('unknown', '未分類')]; found_updates_overall = False
+    processed_categories = categories_order + [('unknown', '未分類')]; used_fragment_keys = set()
+    found_updates_overall = any(categorized_updates.get(category_key) for category_key, _ in processed_categories)
     latest_date_overall = None
-    if updates_to_display: latest_date_overall = max(u.get('timestamp', datetime.datetime.min) for u in updates_to_display).date()
-    for category_key, _ in processed_categories:
-        updates_in_category = categorized_updates.get(category_key, [])
-        if not updates_in_category: continue
-        found_updates_overall = True; is_active_pane = "";
-        if default_category_has_content:
-            if category_key == default_category_val: is_active_pane = "active"
-        elif available_categories and category_key == available_categories[0]: is_active_pane = "active"
-        pane_content = ""; month_groups = groupby(updates_in_category, key=lambda x: x.get('timestamp', datetime.datetime.min).strftime('%Y-%m')); has_content_in_pane = False
-        for year_month, month_group in month_groups:
-            month_items = list(month_group);
-            if not month_items: continue
-            try: month_dt = datetime.datetime.strptime(year_month + "-01", "%Y-%m-%d"); month_str = month_dt.strftime("%Y 年 %m 月")
-            except ValueError: month_str = year_month
-            pane_content += f'            <h3>{month_str}</h3>\n'
-            day_groups = groupby(month_items, key=lambda x: x.get('timestamp', datetime.datetime.min).strftime('%Y-%m-%d'))
-            for day, day_group in day_groups:
-                day_items = list(day_group);
-                if not day_items: continue
-                day_dt = None
-                try: day_dt = datetime.datetime.strptime(day, "%Y-%m-%d"); day_str = day_dt.strftime("%m 月 %d 日 (%A)")
-                except ValueError: day_str = day
-                has_content_in_pane = True
-                is_latest_day_in_active_pane = is_active_pane == "active" and day_dt and day_dt.date() == latest_date_overall; day_group_classes = "day-group" + (" expanded" if is_latest_day_in_active_pane else ""); list_id = f"list-{category_key}-{day.replace('-', '')}"
-                pane_content += f'            <div class="{day_group_classes}">\n'; pane_content += f'                <h4 class="day-header" data-target="#{list_id}"><span class="toggle-icon">{"+" if not is_latest_day_in_active_pane else "-"}</span> {day_str}</h4>\n'; list_visibility_class = "visible" if is_latest_day_in_active_pane else ""
-                pane_content += f'                <ul class="update-list {list_visibility_class}" id="{list_id}" data-category="{category_key}">\n'
-                item_counter_for_day = 0
-                for item in day_items:
-                    item_counter_for_day += 1; visibility_class = "hidden-item" if item_counter_for_day > items_per_page_val else ""
-                    time_str = item.get('timestamp', datetime.datetime.min).strftime('%H:%M:%S'); plot_text = item.get('plot', '') or ''; escaped_plot = escape_html(plot_text); item_display_name = escape_html(item.get('filename', 'N/A')); relative_path_text = escape_html(item.get('relative_path', 'N/A')); tmdb_url_val = item.get('tmdb_url', '')
-                    data_path_for_search = relative_path_text; data_filename_for_search = item_display_name if category_key == 'magazine' else ""
-                    pane_content += f'                    <li class="update-item {visibility_class}" data-filename="{data_filename_for_search}" data-path="{data_path_for_search}" data-category="{category_key}">\n'; pane_content += '                       <div class="item-header">\n'; pane_content += f"                            <strong>{item_display_name}</strong>\n"; pane_content += f"                            <span class='item-time'>{time_str}</span>\n"; pane_content += '                       </div>\n'; pane_content += f"                        <div class='file-path'>{relative_path_text}</div>\n"
-                    if tmdb_url_val: pane_content += f'                        <a href="{tmdb_url_val}" target="_blank" class="tmdb-link">TMDb 連結</a>\n'
-                    if escaped_plot: pane_content += f"                        <blockquote>{escaped_plot}</blockquote>\n"; pane_content += "                    </li>\n"
-                pane_content += '                </ul>\n'
-                if item_counter_for_day > items_per_page_val: pane_content += f'                <button class="load-more-button day-pagination" data-target-list="#{list_id}" style="display: none;">顯示更多</button>\n'
-                pane_content += '            </div>\n'
-        if not has_content_in_pane: pane_content += "            <p>此分類目前沒有更新紀錄。</p>\n"
-        tab_content_html += f'        <div class="content-pane {is_active_pane}" id="pane-{category_key}">\n{pane_content}        </div>\n'
-    if not found_updates_overall: tab_content_html = "<p>目前沒有任何更新紀錄。</p>\n"
+    if updates_to_display: latest_date_overall = max(updates_to_display, key=lambda u: u.timestamp_us).timestamp.date()
     
-    # --- 組合完整的 HTML (f-string 版本 - 確保大括號正確) ---
+    # --- 組合完整的 HTML (f-string 版本 - 確保大括號正確；分頁內容於中段串流輸出) ---
     html_output = f"""<!DOCTYPE html>
 <html lang="zh-TW">
 <head>
     <meta charset="UTF-8"> <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>媒體更新列表 (最新 {MAX_ITEMS_ON_INDEX_PAGE} 筆)</title>
-    <style> 
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; padding: 15px; background-color: #f8f9fa; color: #333; }} 
-        .container {{ max-width: 1200px; margin: 0 auto; }} 
-        h1 {{ text-align: center; color: #0056b3; margin-bottom: 10px; }} 
-        .archive-link-container {{ text-align: center; margin-bottom: 20px; }} 
-        .archive-link-container a {{ font-size: 1.1em; color: #17a2b8; text-decoration: none; padding: 8px 15px; border-radius: 4px; transition: background-color 0.2s ease, color 0.2s ease; }} 
-        .archive-link-container a:hover {{ background-color: #17a2b8; color: white; text-decoration: none; }} 
-        .search-container {{ margin-bottom: 20px; text-align: center; }} 
-        #search-input {{ padding: 8px 12px; font-size: 1em; border: 1px solid #ccc; border-radius: 4px; width: 60%; max-width: 400px; transition: border-color 0.2s ease, box-shadow 0.2s ease; }} 
-        #search-input:focus {{ border-color: #007bff; box-shadow: 0 0 0 2px rgba(0, 123, 255, 0.25); outline: none; }} 
-        .tab-buttons {{ display: flex; justify-content: center; margin-bottom: 25px; border-bottom: 2px solid #dee2e6; flex-wrap: wrap; padding: 0 10px; }} 
-        .tab-button {{ padding: 10px 15px; cursor: pointer; border: none; background-color: transparent; font-size: 1.05em; color: #007bff; margin: 0 3px 0px 3px; border-bottom: 3px solid transparent; transition: color 0.2s ease, border-color 0.2s ease; white-space: nowrap; }} 
-        .tab-button:hover {{ color: #0056b3; }} 
-        .tab-button.active {{ color: #0056b3; font-weight: bold; border-bottom-color: #0056b3; }} 
-        /* *** 新增：Tab 上最新日期的樣式 *** */
-        .tab-latest-date {{ font-size: 0.8em; color: #6c757d; margin-left: 5px; font-weight: normal; }}
-        .tab-content {{ }} 
-        .content-pane {{ display: none; animation: fadeIn 0.3s ease-in-out; }} 
-        .content-pane.active {{ display: block; }} 
-        @keyframes fadeIn {{ from {{ opacity: 0; }} to {{ opacity: 1; }} }} 
-        .day-group {{ margin-bottom: 15px; border: 1px solid #e9ecef; border-radius: 4px; background-color: #fff; overflow: hidden; }} 
-        .day-header {{ background-color: #f1f3f5; color: #495057; padding: 10px 15px; margin: 0; cursor: pointer; font-weight: bold; display: flex; align-items: center; transition: background-color 0.2s ease; }} 
-        .day-header:hover {{ background-color: #e9ecef; }} 
-        .toggle-icon {{ display: inline-block; width: 1em; margin-right: 8px; text-align: center; font-weight: bold; }} 
-        .update-list {{ list-style: none; padding: 0 15px 15px 15px; margin: 0; display: none; }} 
-        .update-list.visible {{ display: block; }} 
-        h3 {{ color: #17a2b8; margin-top: 20px; margin-bottom: 10px; border-left: 4px solid #17a2b8; padding-left: 10px; font-size: 1.3em; }} 
-        li.update-item {{ margin-bottom: 10px; padding: 10px 12px; background-color: #fff; border: none; border-bottom: 1px solid #eee; border-radius: 0; box-shadow: none; transition: background-color 0.1s ease; }} 
-        li.update-item:last-child {{ border-bottom: none; }} 
-        .item-header {{ display: flex; justify-content: space-between; align-items: baseline; margin-bottom: 4px; }} 
-        .item-header strong {{ font-size: 1.05em; color: #003975; margin-bottom: 0; flex-grow: 1; margin-right: 10px; word-break: break-all; }} 
-        .item-time {{ font-size: 0.8em; color: #777; white-space: nowrap; }} 
-        .file-path {{ font-family: 'Courier New', Courier, monospace; font-size: 0.8em; color: #666; margin-bottom: 6px; word-break: break-all; }} 
-        blockquote {{ margin: 6px 0 6px 0px; padding: 6px 10px; border-left: 3px solid #007bff; background-color: #e9f5ff; color: #333; font-size: 0.85em; }} 
-        a {{ color: #007bff; text-decoration: none; }} 
-        a:hover {{ text-decoration: underline; }} 
-        .tmdb-link {{ display: inline-block; margin-top: 4px; font-size: 0.85em; }} 
-        .update-item.hidden-item {{ display: none; }} 
-        .load-more-button.day-pagination {{ display: block; margin: 15px auto 5px auto; padding: 8px 16px; font-size: 0.9em; cursor: pointer; background-color: #28a745; color: white; border: none; border-radius: 4px; transition: background-color 0.2s ease; }} 
-        .load-more-button.day-pagination:hover {{ background-color: #218838; }} 
-        .highlight {{ background-color: yellow; font-weight: bold; }} 
-        .update-item.search-hidden {{ display: none !important; }} 
-        .day-group.search-hidden {{ display: none !important; }} 
-        h3.search-hidden {{ display: none !important; }} 
-        .search-active .load-more-button.day-pagination {{ display: none !important; }} 
-        .footer-time {{ margin-top: 40px; text-align: center; font-size: 0.9em; color: #888; }} 
-    </style>    
+    <link rel="stylesheet" href="{asset_urls['index_css']}">
 </head>
 <body> <div class="container"> <h1>媒體更新總覽 (最新 {MAX_ITEMS_ON_INDEX_PAGE} 筆)</h1>
         <div class="archive-link-container">
@@ -423,94 +1804,286 @@ def generate_html(all_updates_full_history):
         </div>
         <div class="search-container">
             <input type="search" id="search-input" placeholder="搜尋 劇集/電影/全集/動漫(依路徑) 或 雜誌(依檔名)...">
-        </div> <div class="tab-buttons"> {tab_buttons_html} </div> <div class="tab-content"> {tab_content_html} </div> <p class="footer-time"><small>頁面最後生成時間: {now_str}</small></p>
+        </div> <div class="tab-buttons"> {tab_buttons_html} </div> <div class="tab-content"> {TAB_CONTENT_MARKER} </div> <p class="footer-time"><small>頁面最後生成時間: {GENERATED_TIME_MARKER}</small></p>
     </div>
-    <script>
-        const tsMap = {{'剧':'劇','集':'集','电':'電','影':'影','杂':'雜','志':'誌','时':'時','间':'間','档':'檔','案':'案','更':'更','新':'新','列':'列','表':'表','签':'簽','标':'標','题':'題','内':'內','容':'容','搜':'搜','寻':'尋','显':'顯','示':'示','隐':'隱','藏':'藏','数':'數','据':'據','库': '庫','简':'簡','繁':'繁','体':'體','字':'字','转':'轉','换':'換','优':'優','化':'化','验':'驗','证':'證','权':'權','限':'限','设':'設','置':'置','错':'錯','误':'誤','讯':'訊','息':'息','系':'系','统':'統','环':'環','境':'境','版':'版','本':'本','处':'處','理':'理','回':'回','应': '應','网':'網','页':'頁','浏':'瀏','览':'覽','器':'器','缓':'緩','存':'存','清':'清','除':'除','模':'模','块':'塊','组':'組','织':'織','结':'結','构':'構','状':'狀','态':'態','负':'負','载':'載','压':'壓','力':'力','测':'測','试':'試','性':'性','能':'能','调':'調','优':'優','部':'部', '署':'署','迭':'疊','代':'代','开':'開','发':'發','周':'週','期':'期','计':'計','划':'劃','实':'實','现':'現','功':'功','能':'能','需':'需','求':'求','规':'規','范':'範','说':'說','明':'明','书':'書','用':'用','户':'戶','体':'體','验':'驗','界':'界','面':'面','计':'計','交互':'互動', '动':'動','画':'畫','视':'視','觉':'覺','元':'元','素':'素','图':'圖','标':'標','颜':'顏','色':'色','体':'體','排':'排','版':'版','布':'佈','局':'局','响':'響','应':'應','式':'式','适':'適','配':'配','不':'不','同':'同','备':'備','屏':'屏','幕':'幕','尺':'尺','寸':'寸','全':'全','漫':'漫', ' ': ' '}};
-        const stMap = {{}}; for (const t in tsMap) {{ stMap[tsMap[t]] = t; }}
-        function toSimp(t) {{ if(!t) return ""; let r=""; for(let i=0;i<t.length;i++) {{ r += stMap[t[i]]||t[i]; }} return r; }}
-        function toTrad(t) {{ if(!t) return ""; let r=""; for(let i=0;i<t.length;i++) {{ r += tsMap[t[i]]||t[i]; }} return r; }}
-        document.addEventListener('DOMContentLoaded', function() {{
-            const itemsPerPage = {items_per_page_val};
-            const tabButtons = document.querySelectorAll('.tab-button'); const contentPanes = document.querySelectorAll('.content-pane');
-            const tabContainer = document.querySelector('.tab-buttons'); const searchInput = document.getElementById('search-input');
-            const container = document.querySelector('.container'); const latestDateStr = "{latest_date_overall.isoformat() if latest_date_overall else ''}";
-            if (tabContainer) {{ tabContainer.addEventListener('click', function(event) {{ if (event.target.classList.contains('tab-button')) {{
-                const targetCategory = event.target.getAttribute('data-category'); tabButtons.forEach(button => {{ button.classList.remove('active'); }}); event.target.classList.add('active');
-                contentPanes.forEach(pane => {{ pane.classList.toggle('active', pane.id === `pane-${{targetCategory}}`); }});
-                filterItems(); resetAccordionState(targetCategory); updateAllPaginationButtonsVisibility(); }} }});
-            }} else {{ console.error("Tab container not found!"); }}
-            contentPanes.forEach(pane => {{ pane.addEventListener('click', function(event) {{
-                const header = event.target.closest('.day-header');
-                if (header && !event.target.closest('.load-more-button')) {{
-                    const targetListId = header.getAttribute('data-target'); const targetList = pane.querySelector(targetListId);
-                    const dayGroup = header.parentElement; const icon = header.querySelector('.toggle-icon');
-                    if (targetList && dayGroup && icon) {{ dayGroup.classList.toggle('expanded'); targetList.classList.toggle('visible'); icon.textContent = dayGroup.classList.contains('expanded') ? '-' : '+'; }} }} }}); }});
-             function setupDayPagination(listElement) {{ if (!listElement) return; const listId = listElement.id; const button = listElement.parentElement.querySelector(`.load-more-button.day-pagination[data-target-list="#${{listId}}"]`); if (!button) {{ return; }}
-                 const allItemsInList = listElement.querySelectorAll('.update-item'); let visibleCount = 0;
-                 allItemsInList.forEach(item => {{ if (!item.classList.contains('hidden-item') && !item.classList.contains('search-hidden')) {{ visibleCount++; }} }});
-                 const totalVisibleItems = Array.from(allItemsInList).filter(item => !item.classList.contains('search-hidden')).length;
-                 button.style.display = (totalVisibleItems > visibleCount && !container.classList.contains('search-active')) ? 'block' : 'none';
-                 if (!button.dataset.listenerAttached) {{ button.addEventListener('click', function() {{ let newlyShown = 0; const hiddenItems = listElement.querySelectorAll('.update-item.hidden-item:not(.search-hidden)'); hiddenItems.forEach((item) => {{ if (newlyShown < itemsPerPage) {{ item.classList.remove('hidden-item'); newlyShown++; }} }}); if (listElement.querySelectorAll('.update-item.hidden-item:not(.search-hidden)').length === 0) {{ button.style.display = 'none'; }} }}); button.dataset.listenerAttached = 'true'; }} }}
-            function updateAllPaginationButtonsVisibility() {{ document.querySelectorAll('ul.update-list').forEach(list => {{ setupDayPagination(list); const button = list.parentElement.querySelector(`.load-more-button.day-pagination[data-target-list="#${{list.id}}"]`); if (button && container.classList.contains('search-active')) {{ button.style.display = 'none'; }} }}); }}
-            function filterItems() {{ const searchTerm = searchInput.value.toLowerCase().trim(); const activeTabButton = document.querySelector('.tab-button.active'); const activeCategory = activeTabButton ? activeTabButton.getAttribute('data-category') : null; container.classList.toggle('search-active', searchTerm !== ""); if (!activeCategory) return; const searchTrad = toTrad(searchTerm); const searchSimp = toSimp(searchTerm); let visibleMonths = new Set(); let visibleDays = new Set();
-                document.querySelectorAll('.update-item').forEach(item => {{ const itemCategory = item.getAttribute('data-category'); let isMatch = false;
-                    if (itemCategory === activeCategory) {{ if (searchTerm === "") {{ isMatch = true; }} else {{ const filename = item.getAttribute('data-filename').toLowerCase(); const path = item.getAttribute('data-path').toLowerCase(); let textToSearch = (itemCategory === 'magazine') ? filename : path; const targetTrad = toTrad(textToSearch); const targetSimp = toSimp(textToSearch); if ((targetTrad.includes(searchTrad) || targetTrad.includes(searchSimp)) || (targetSimp.includes(searchTrad) || targetSimp.includes(searchSimp))) {{ isMatch = true; }} }} }}
-                    item.classList.toggle('search-hidden', !isMatch);
-                    if (isMatch) {{ const dayGroup = item.closest('.day-group'); if (dayGroup) {{ visibleDays.add(dayGroup); const monthHeader = dayGroup.previousElementSibling; if (monthHeader && monthHeader.tagName === 'H3') {{ visibleMonths.add(monthHeader); }} if (!dayGroup.classList.contains('expanded')) {{ dayGroup.classList.add('expanded'); const list = dayGroup.querySelector('.update-list'); if (list) list.classList.add('visible'); const icon = dayGroup.querySelector('.toggle-icon'); if (icon) icon.textContent = '-'; }} }} }} }});
-                document.querySelectorAll('.day-group').forEach(group => {{ const parentPane = group.closest('.content-pane'); if (parentPane && parentPane.id === `pane-${{activeCategory}}`) {{ group.classList.toggle('search-hidden', !visibleDays.has(group)); }} else if (!parentPane || !parentPane.classList.contains('active')) {{ group.classList.add('search-hidden'); }} }});
-                 document.querySelectorAll('.tab-content h3').forEach(h3 => {{ const parentPane = h3.closest('.content-pane'); if (parentPane && parentPane.id === `pane-${{activeCategory}}`) {{ h3.classList.toggle('search-hidden', !visibleMonths.has(h3)); }} else if (!parentPane || !parentPane.classList.contains('active')) {{ h3.classList.add('search-hidden'); }} }});
-                 if (searchTerm === "") {{ resetAccordionState(activeCategory); updateAllPaginationButtonsVisibility(); }} else {{ document.querySelectorAll('.load-more-button.day-pagination').forEach(btn => {{ btn.style.display = 'none'; }}); }} }}
-            function resetAccordionState(activeCategory) {{ document.querySelectorAll('.day-group').forEach(group => {{ const parentPane = group.closest('.content-pane'); const dayHeader = group.querySelector('.day-header'); const list = group.querySelector('.update-list'); const icon = group.querySelector('.toggle-icon');
-                if (parentPane && dayHeader && list && icon) {{ if(parentPane.id === `pane-${{activeCategory}}`) {{ const listId = list.id; const dateStrFromId = listId ? listId.split('-').pop() : null; const isLatestDay = latestDateStr && dateStrFromId && dateStrFromId === latestDateStr.replace(/-/g, ''); group.classList.toggle('expanded', isLatestDay); list.classList.toggle('visible', isLatestDay); icon.textContent = isLatestDay ? '-' : '+'; }} else {{ group.classList.remove('expanded'); list.classList.remove('visible'); icon.textContent = '+'; }} }} }}); }}
-            if (searchInput) {{ searchInput.addEventListener('input', filterItems); }}
-            updateAllPaginationButtonsVisibility(); const initialActiveTabButton = document.querySelector('.tab-button.active'); const initialActiveCategory = initialActiveTabButton ? initialActiveTabButton.getAttribute('data-category') : null; if(initialActiveCategory) {{ resetAccordionState(initialActiveCategory); }}
-        }});
-    </script>
+    <script>const PAGE_CONFIG = {{ itemsPerPage: {items_per_page_val}, latestDateStr: "{latest_date_overall.isoformat() if latest_date_overall else ''}" }};</script>
+    <script src="{asset_urls['search_js']}"></script>
+    <script src="{asset_urls['index_js']}"></script>
 </body>
 </html>"""
-    return html_output
+    html_head, html_tail = html_output.split(TAB_CONTENT_MARKER, 1)
+    yield html_head
+    if not found_updates_overall: yield "<p>目前沒有任何更新紀錄。</p>\n"
+    for category_key, _ in processed_categories:
+        updates_in_category = categorized_updates.get(category_key, [])
+        if not updates_in_category: continue
+        is_active_pane = "";
+        if default_category_has_content:
+            if category_key == default_category_val: is_active_pane = "active"
+        elif available_categories and category_key == available_categories[0]: is_active_pane = "active"
+        yield f'        <div class="content-pane {is_active_pane}" id="pane-{category_key}">\n'; month_groups = groupby(updates_in_category, key=lambda x: x.timestamp.strftime('%Y-%m')); has_content_in_pane = False
+        for year_month, month_group in month_groups:
+            month_items = list(month_group);
+            if not month_items: continue
+            try: month_dt = datetime.datetime.strptime(year_month + "-01", "%Y-%m-%d"); month_str = month_dt.strftime("%Y 年 %m 月")
+            except ValueError: month_str = year_month
+            yield f'            <h3>{month_str}</h3>\n'
+            day_groups = groupby(month_items, key=lambda x: x.timestamp.strftime('%Y-%m-%d'))
+            for day, day_group in day_groups:
+                day_items = list(day_group);
+                if not day_items: continue
+                day_dt = None
+                try: day_dt = datetime.datetime.strptime(day, "%Y-%m-%d")
+                except ValueError: pass
+                has_content_in_pane = True
+                is_latest_day_in_active_pane = bool(is_active_pane == "active" and day_dt and day_dt.date() == latest_date_overall)
+                yield get_day_group_html(category_key, day, day_items, is_latest_day_in_active_pane, items_per_page_val); used_fragment_keys.add((category_key, day))
+        if not has_content_in_pane: yield "            <p>此分類目前沒有更新紀錄。</p>\n"
+        yield '        </div>\n'
+    for stale_key in set(day_fragment_cache) - used_fragment_keys: del day_fragment_cache[stale_key] # 已滑出最新範圍的日期
+    html_tail_before_time, html_tail_after_time = html_tail.split(GENERATED_TIME_MARKER, 1)
+    yield html_tail_before_time; yield VolatileChunk(now_str); yield html_tail_after_time
+
+def generate_html(all_updates_full_history):
+    return "".join(iter_index_html(all_updates_full_history))
 
 # --- 產生 archive.html 的函數 ---
-def generate_archive_html_shell():
+def generate_archive_html_shell(asset_urls=None):
     global ARCHIVE_JS_FILE, OUTPUT_HTML_FILE
+    asset_urls = asset_urls or publish_static_assets()
     archive_html_content = f"""<!DOCTYPE html>
 <html lang="zh-TW">
 <head>
     <meta charset="UTF-8"> <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>完整歷史媒體更新列表</title>
-    <style> body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; padding: 15px; background-color: #f8f9fa; color: #333; }} .container {{ max-width: 1200px; margin: 0 auto; }} h1 {{ text-align: center; color: #0056b3; margin-bottom: 20px; }} .search-container {{ margin-bottom: 20px; text-align: center; }} #archive-search-input {{ padding: 8px 12px; font-size: 1em; border: 1px solid #ccc; border-radius: 4px; width: 60%; max-width: 400px; }} .archive-controls {{ margin-bottom: 20px; text-align: center; }} .archive-controls label {{ margin-right: 10px; }} .archive-controls select, .archive-controls input[type="number"] {{ padding: 6px; border-radius: 4px; border: 1px solid #ccc; margin-right: 15px;}} #loading-indicator {{ text-align: center; font-size: 1.2em; padding: 20px; display: none; }} #archive-results-container {{ margin-top: 20px; }} .pagination-controls {{ text-align: center; margin-top: 20px; }} .pagination-controls button {{ padding: 8px 15px; margin: 0 5px; cursor: pointer; background-color: #007bff; color:white; border:none; border-radius:4px; }} .pagination-controls button:disabled {{ background-color: #ccc; cursor: not-allowed; }} .pagination-info {{ margin: 0 15px; }} .tab-buttons {{ display: flex; justify-content: center; margin-bottom: 25px; border-bottom: 2px solid #dee2e6; flex-wrap: wrap; padding: 0 10px; }} .tab-button {{ padding: 10px 15px; cursor: pointer; border: none; background-color: transparent; font-size: 1.05em; color: #007bff; margin: 0 3px 0px 3px; border-bottom: 3px solid transparent; transition: color 0.2s ease, border-color 0.2s ease; white-space: nowrap; }} .tab-button:hover {{ color: #0056b3; }} .tab-button.active {{ color: #0056b3; font-weight: bold; border-bottom-color: #0056b3; }} .content-pane {{ display: none; animation: fadeIn 0.3s ease-in-out; }} .content-pane.active {{ display: block; }} @keyframes fadeIn {{ from {{ opacity: 0; }} to {{ opacity: 1; }} }} .day-group {{ margin-bottom: 15px; border: 1px solid #e9ecef; border-radius: 4px; background-color: #fff; overflow: hidden; }} .day-header {{ background-color: #f1f3f5; color: #495057; padding: 10px 15px; margin: 0; cursor: pointer; font-weight: bold; display: flex; align-items: center; transition: background-color 0.2s ease; }} .day-header:hover {{ background-color: #e9ecef; }} .toggle-icon {{ display: inline-block; width: 1em; margin-right: 8px; text-align: center; font-weight: bold; }} .update-list {{ list-style: none; padding: 0 15px 15px 15px; margin: 0; display: none; }} .update-list.visible {{ display: block; }} h3 {{ color: #17a2b8; margin-top: 20px; margin-bottom: 10px; border-left: 4px solid #17a2b8; padding-left: 10px; font-size: 1.3em; }} li.update-item {{ margin-bottom: 10px; padding: 10px 12px; background-color: #fff; border: none; border-bottom: 1px solid #eee; border-radius: 0; box-shadow: none; transition: background-color 0.1s ease; }} li.update-item:last-child {{ border-bottom: none; }} .item-header {{ display: flex; justify-content: space-between; align-items: baseline; margin-bottom: 4px; }} .item-header strong {{ font-size: 1.05em; color: #003975; margin-bottom: 0; flex-grow: 1; margin-right: 10px; word-break: break-all; }} .item-time {{ font-size: 0.8em; color: #777; white-space: nowrap; }} .file-path {{ font-family: 'Courier New', Courier, monospace; font-size: 0.8em; color: #666; margin-bottom: 6px; word-break: break-all; }} blockquote {{ margin: 6px 0 6px 0px; padding: 6px 10px; border-left: 3px solid #007bff; background-color: #e9f5ff; color: #333; font-size: 0.85em; }} a {{ color: #007bff; text-decoration: none; }} a:hover {{ text-decoration: underline; }} .tmdb-link {{ display: inline-block; margin-top: 4px; font-size: 0.85em; }} .highlight {{ background-color: yellow; font-weight: bold; }} .footer-time {{ margin-top: 40px; text-align: center; font-size: 0.9em; color: #888; }} .no-results {{ text-align: center; padding: 20px; font-style: italic; color: #6c757d; }} </style>
+    <link rel="stylesheet" href="{asset_urls['archive_css']}">
     <script> const DEFAULT_CATEGORY = "{escape_html(DEFAULT_CATEGORY)}"; </script>
 </head>
-<body> <div class="container"> <h1>完整歷史媒體更新</h1> <div class="search-container"> <input type="search" id="archive-search-input" placeholder="搜尋歷史記錄 (可輸入繁/簡中文)..."> </div> <div class="archive-controls"> <label for="items-per-page-select">每頁顯示:</label> <select id="items-per-page-select"> <option value="30">30</option> <option value="50">50</option> <option value="100" selected>100</option> <option value="200">200</option> </select> <label for="goto-page-input">跳至頁碼:</label> <input type="number" id="goto-page-input" min="1" style="width: 60px;"> <button id="goto-page-btn">跳轉</button> </div> <div id="loading-indicator" style="display: none;">正在載入歷史記錄...</div> <div id="archive-results-container"> <div class="tab-buttons" id="archive-tab-buttons"></div> <div class="tab-content" id="archive-tab-content"> </div> </div> <div class="pagination-controls" id="archive-pagination-controls" style="display:none;"> <button id="prev-page">上一頁</button> <span id="page-info"></span> <button id="next-page">下一頁</button> </div> <p class="footer-time"><small><a href="{OUTPUT_HTML_FILE}">返回最新更新列表</a></small></p> </div> <script src="{ARCHIVE_JS_FILE}"></script> </body>
+<body> <div class="container"> <h1>完整歷史媒體更新</h1> <div class="search-container"> <input type="search" id="archive-search-input" placeholder="搜尋歷史記錄 (可輸入繁/簡中文)..."> </div> <div class="archive-controls"> <label for="items-per-page-select">每頁顯示:</label> <select id="items-per-page-select"> <option value="30">30</option> <option value="50">50</option> <option value="100" selected>100</option> <option value="200">200</option> </select> <label for="goto-page-input">跳至頁碼:</label> <input type="number" id="goto-page-input" min="1" style="width: 60px;"> <button id="goto-page-btn">跳轉</button> </div> <div id="loading-indicator" style="display: none;">正在載入歷史記錄...</div> <div id="archive-results-container"> <div class="tab-buttons" id="archive-tab-buttons"></div> <div class="tab-content" id="archive-tab-content"> </div> </div> <div class="pagination-controls" id="archive-pagination-controls" style="display:none;"> <button id="prev-page">上一頁</button> <span id="page-info"></span> <button id="next-page">下一頁</button> </div> <p class="footer-time"><small><a href="{OUTPUT_HTML_FILE}">返回最新更新列表</a></small></p> </div> <script src="{asset_urls['search_js']}"></script> <script src="{asset_urls['archive_js']}"></script> </body>
 </html>"""
     return archive_html_content
 
 # --- 延遲執行的函數 ---
 def delayed_git_action():
-    global media_updates, git_update_triggered, REPO_PATH, OUTPUT_HTML_FILE, ARCHIVE_HTML_FILE
+    global git_update_triggered, REPO_PATH, OUTPUT_HTML_FILE, ARCHIVE_HTML_FILE, archive_shards_synced
     logging.info("觸發延遲 Git 操作 (delayed_git_action)...")
     main_html_generated = False
     archive_html_generated = False
-    try:
-        main_html_output = generate_html(media_updates)
-        output_path_main = os.path.join(REPO_PATH, OUTPUT_HTML_FILE)
-        with open(output_path_main, 'w', encoding='utf-8') as f: f.write(main_html_output)
-        logging.info(f"已更新主頁 HTML 檔案: {output_path_main}")
-        main_html_generated = True
-    except Exception as e_html_main: logging.exception(f"產生主頁 index.html 時發生嚴重錯誤: {e_html_main}")
-    try:
-        archive_html_content = generate_archive_html_shell() 
-        output_path_archive = os.path.join(REPO_PATH, ARCHIVE_HTML_FILE)
-        with open(output_path_archive, 'w', encoding='utf-8') as f: f.write(archive_html_content)
-        logging.info(f"已更新歷史記錄頁面 HTML 檔案: {output_path_archive}")
-        archive_html_generated = True
-    except Exception as e_html_archive: logging.exception(f"產生 archive.html 時發生嚴重錯誤: {e_html_archive}")
-    if commit_and_push_changes(): logging.info("Git 推送完成。")
+    built_artifacts = []; skipped_artifacts = []
+    freshness_tracer.advance_all('publish_started', 'parsed')
+    asset_urls = publish_static_assets()
+    records_digest = media_index.content_digest()
+    # archive 頁面只讀取分片；media_updates.json 只在日誌達門檻 (背景) 或停止時壓實，不在發布路徑上重寫
+    snapshot_manifest_path = f"{ARCHIVE_DATA_DIRECTORY}/{ARCHIVE_MANIFEST_FILE}"
+    snapshot_inputs = compute_build_inputs(records_digest)
+    if is_artifact_current('snapshot', snapshot_inputs): skipped_artifacts.append('snapshot'); archive_shards_synced = True
+    else:
+        render_started = time.perf_counter()
+        with journal_lock: dirty_shards = archive_dirty_shards.copy(); archive_dirty_shards.clear()
+        try:
+            write_archive_shards(media_index, dirty_shards if archive_shards_synced else None) # 啟動後第一次做完整比對，之後只重寫有新紀錄的月份
+            archive_shards_synced = True
+            record_artifact('snapshot', snapshot_inputs, {snapshot_manifest_path: None}); built_artifacts.append('snapshot')
+            metric_render_seconds.observe(time.perf_counter() - render_started, artifact='snapshot')
+        except Exception as e_shards:
+            with journal_lock: archive_dirty_shards.update(dirty_shards) # 下次發布再試
+            logging.exception(f"輸出 archive 分片時發生錯誤: {e_shards}")
+    index_inputs = compute_build_inputs(records_digest, asset_urls)
+    if is_artifact_current(OUTPUT_HTML_FILE, index_inputs): skipped_artifacts.append(OUTPUT_HTML_FILE)
+    else:
+        try:
+            output_path_main = os.path.join(OUTPUT_DIRECTORY, OUTPUT_HTML_FILE)
+            previous_hash = get_recorded_output_hash(OUTPUT_HTML_FILE, OUTPUT_HTML_FILE); render_started = time.perf_counter()
+            content_hash = write_file_atomic(output_path_main, iter_index_html(media_index, asset_urls), unchanged_hash=previous_hash)
+            metric_render_seconds.observe(time.perf_counter() - render_started, artifact=OUTPUT_HTML_FILE)
+            record_artifact(OUTPUT_HTML_FILE, index_inputs, {OUTPUT_HTML_FILE: content_hash}); built_artifacts.append(OUTPUT_HTML_FILE)
+            metric_output_bytes.set(os.path.getsize(output_path_main), artifact=OUTPUT_HTML_FILE)
+            if content_hash == previous_hash: logging.info(f"主頁 HTML 內容未變 (不計生成時間)，保留原檔: {output_path_main}")
+            else: logging.info(f"已更新主頁 HTML 檔案: {output_path_main}")
+            main_html_generated = True
+        except Exception as e_html_main: logging.exception(f"產生主頁 index.html 時發生嚴重錯誤: {e_html_main}")
+    if main_html_generated or OUTPUT_HTML_FILE in skipped_artifacts: freshness_tracer.advance_all('rendered', 'publish_started')
+    archive_inputs = compute_build_inputs(asset_urls) # archive.html 只取決於 DEFAULT_CATEGORY (含於原始碼雜湊) 與靜態資源路徑
+    if is_artifact_current(ARCHIVE_HTML_FILE, archive_inputs): skipped_artifacts.append(ARCHIVE_HTML_FILE)
+    else:
+        try:
+            render_started = time.perf_counter()
+            archive_html_content = generate_archive_html_shell(asset_urls)
+            output_path_archive = os.path.join(OUTPUT_DIRECTORY, ARCHIVE_HTML_FILE)
+            content_hash = write_file_atomic(output_path_archive, archive_html_content, unchanged_hash=get_recorded_output_hash(ARCHIVE_HTML_FILE, ARCHIVE_HTML_FILE))
+            metric_render_seconds.observe(time.perf_counter() - render_started, artifact=ARCHIVE_HTML_FILE)
+            metric_output_bytes.set(os.path.getsize(output_path_archive), artifact=ARCHIVE_HTML_FILE)
+            record_artifact(ARCHIVE_HTML_FILE, archive_inputs, {ARCHIVE_HTML_FILE: content_hash}); built_artifacts.append(ARCHIVE_HTML_FILE)
+            logging.info(f"已更新歷史記錄頁面 HTML 檔案: {output_path_archive}")
+            archive_html_generated = True
+        except Exception as e_html_archive: logging.exception(f"產生 archive.html 時發生嚴重錯誤: {e_html_archive}")
+    build_stats['built'] += len(built_artifacts); build_stats['skipped'] += len(skipped_artifacts)
+    if built_artifacts: save_build_manifest()
+    logging.info(f"建置 manifest：重建 {built_artifacts or '無'}，輸入未變而略過 {skipped_artifacts or '無'}。")
+    if not has_pending_git_work(): logging.info("沒有任何輸出檔案變更，略過 Git 操作。"); record_unchanged_publish()
+    elif commit_and_push_changes(): logging.info("Git 推送完成。")
     else: logging.error("Git 推送失敗。")
     git_update_triggered = False
 
 # --- Git 操作函數 (V9.1.6 - 自動處理 index.lock 問題) ---
+PUBLISHED_OUTPUT_PATHSPECS = (OUTPUT_HTML_FILE, ARCHIVE_HTML_FILE, ARCHIVE_JS_FILE, UPDATES_JSON_FILE, ARCHIVE_DATA_DIRECTORY, ASSETS_DIRECTORY)
+OUTPUT_BRANCH_INDEX_PATH = os.path.join(state_directory, 'output_branch.index') # 輸出分支模式使用的獨立索引檔
+PUBLISH_INDEX_PATH = os.path.join(state_directory, 'publish.index') # targeted 模式建立 commit 用的獨立索引檔
+published_outputs_seeded = False
+
+def record_unchanged_publish():
+    """本次發布沒有新 commit：已產生頁面的項目內容早已在 commit 中；推送排程器也沒有待推送的 commit 時即視為推送完成"""
+    freshness_tracer.advance_all('committed', 'rendered')
+    if not push_scheduler.get_stats()['pending']: freshness_tracer.finalize(freshness_tracer.advance_all('pushed', 'committed'))
+
+def has_pending_git_work():
+    """沒有任何待 commit 的輸出路徑時，發布可完全不執行 git；'add_all' 模式無法得知，一律執行"""
+    if GIT_PUBLISH_MODE == 'targeted' and not published_outputs_seeded: return True
+    if GIT_PUBLISH_MODE == 'output_branch' and not os.path.exists(OUTPUT_BRANCH_INDEX_PATH): return True
+    if GIT_PUBLISH_MODE not in ('targeted', 'output_branch'): return True
+    with published_paths_lock: return bool(published_output_paths)
+
+def run_git(args, input_text=None, env=None, cwd=None):
+    """在 REPO_PATH (或 cwd) 執行 git 指令並回傳去除空白的 stdout；失敗時拋出 CalledProcessError"""
+    result = subprocess.run(['git'] + list(args), cwd=cwd or REPO_PATH, input=input_text, env=env, capture_output=True, text=True, check=True, encoding='utf-8')
+    return result.stdout.strip()
+
+def seed_published_outputs_from_status():
+    """啟動後第一次發布時，補上輸出目錄中尚未 commit 的變更 (例如上次寫出後程式中斷)；只檢查輸出路徑，不掃描整個工作目錄"""
+    global published_outputs_seeded
+    if published_outputs_seeded: return
+    status_output = subprocess.run(['git', 'status', '--porcelain', '-z', '--untracked-files=all', '--'] + list(PUBLISHED_OUTPUT_PATHSPECS),
+                                   cwd=REPO_PATH, capture_output=True, text=True, check=True, encoding='utf-8').stdout
+    with published_paths_lock:
+        for entry in status_output.split('\0'):
+            if len(entry) > 3: published_output_paths.add(entry[3:])
+    published_outputs_seeded = True
+
+def commit_published_outputs():
+    """以 GDState 下的獨立索引檔 (由 HEAD 建立) 只暫存記錄過的輸出路徑，再以 write-tree / commit-tree / update-ref 建立 commit；
+    使用者在 .git/index 暫存的其他變更不會被帶入。無變更時回傳 False"""
+    seed_published_outputs_from_status()
+    with published_paths_lock: paths_to_stage = sorted(published_output_paths)
+    if not paths_to_stage:
+        logging.info("沒有任何已記錄的輸出檔案變更，跳過 commit 和 push。")
+        return False
+    git_env = dict(os.environ, GIT_INDEX_FILE=PUBLISH_INDEX_PATH)
+    try: parent_sha, parent_tree_sha = run_git(['rev-parse', 'HEAD', 'HEAD^{tree}']).split()
+    except subprocess.CalledProcessError: parent_sha, parent_tree_sha = None, None # 尚無任何 commit 的新 repo
+    run_git(['read-tree', parent_sha] if parent_sha else ['read-tree', '--empty'], env=git_env) # 每次都從 HEAD 重建，HEAD 可能已被手動移動
+    logging.info(f"執行: git update-index --add --remove ({len(paths_to_stage)} 個輸出路徑，獨立索引)")
+    run_git(['update-index', '--add', '--remove', '-z', '--stdin'], input_text='\0'.join(paths_to_stage) + '\0', env=git_env)
+    tree_sha = run_git(['write-tree'], env=git_env)
+    with published_paths_lock: published_output_paths.difference_update(paths_to_stage)
+    if tree_sha == parent_tree_sha:
+        logging.info("輸出檔案內容與 HEAD 相同，跳過 commit 和 push。")
+        return False
+    commit_message = f"Automated update: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    logging.info(f"執行: git commit-tree (訊息 '{commit_message}')")
+    commit_sha = run_git(['commit-tree', tree_sha, '-m', commit_message] + (['-p', parent_sha] if parent_sha else []))
+    run_git(['update-ref', '-m', f"commit: {commit_message}", 'HEAD', commit_sha] + ([parent_sha] if parent_sha else []))
+    logging.info(f"已建立 commit {commit_sha[:10]}，包含 {len(paths_to_stage)} 個輸出路徑。")
+    try: # 只把 .git/index 中這些輸出路徑同步為新的 HEAD，否則 git status 會顯示反向的已暫存變更；其他項目不動
+        run_git(['reset', '-q', '--pathspec-from-file=-', '--pathspec-file-nul'], input_text='\0'.join(paths_to_stage) + '\0')
+    except subprocess.CalledProcessError as e: logging.warning(f"同步 .git/index 中的輸出路徑失敗 (不影響 commit): {e.stderr}")
+    return True
+
+def commit_all_changes():
+    """舊版流程：git add . 後 commit；無變更時回傳 False"""
+    # --- 步驟 1: 使用 'git add .' 來暫存所有變更 ---
+    logging.info("執行: git add .")
+    subprocess.run(['git', 'add', '.'], cwd=REPO_PATH, capture_output=True, text=True, check=True, encoding='utf-8')
+
+    # --- 步驟 2: 檢查是否有任何東西被放入暫存區 ---
+    result_status_staged = subprocess.run(['git', 'diff', '--staged', '--quiet'], cwd=REPO_PATH, check=False)
+
+    if result_status_staged.returncode == 0:
+         logging.info(f"沒有偵測到任何已暫存的檔案變更，跳過 commit 和 push。")
+         return False
+
+    # --- 步驟 3: 如果暫存區有內容，則執行 commit ---
+    commit_message = f"Automated update: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    logging.info(f"執行: git commit -m '{commit_message}'")
+    result_commit = subprocess.run(['git', 'commit', '-m', commit_message], cwd=REPO_PATH, capture_output=True, text=True, check=True, encoding='utf-8')
+    logging.info(f"Git commit 輸出:\n{result_commit.stdout}")
+    return True
+
+def list_published_output_files():
+    """列出磁碟上目前所有的輸出檔 (repo 相對路徑)；輸出分支的索引第一次建立時使用"""
+    output_files = []
+    for pathspec in PUBLISHED_OUTPUT_PATHSPECS:
+        full_path = os.path.join(OUTPUT_DIRECTORY, pathspec)
+        if os.path.isfile(full_path): output_files.append(pathspec)
+        elif os.path.isdir(full_path):
+            for root, _, files in os.walk(full_path):
+                for filename in files:
+                    if filename.startswith('.') and filename.endswith('.tmp'): continue # 寫入中的暫存檔
+                    output_files.append(os.path.relpath(os.path.join(root, filename), OUTPUT_DIRECTORY).replace(os.sep, '/'))
+    return output_files
+
+def commit_output_branch():
+    """以 GDState 下的獨立索引檔與輸出目錄 (OUTPUT_DIRECTORY 作為 GIT_WORK_TREE) 把輸出檔 commit 到 GIT_OUTPUT_BRANCH，
+    不影響目前分支、索引與工作目錄；無變更時回傳 False"""
+    index_path = OUTPUT_BRANCH_INDEX_PATH
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    git_env = dict(os.environ, GIT_INDEX_FILE=index_path, GIT_DIR=run_git(['rev-parse', '--absolute-git-dir']), GIT_WORK_TREE=OUTPUT_DIRECTORY)
+    branch_ref = f"refs/heads/{GIT_OUTPUT_BRANCH}"
+    try: parent_sha, parent_tree_sha = run_git(['rev-parse', branch_ref, f"{branch_ref}^{{tree}}"]).split()
+    except subprocess.CalledProcessError: parent_sha, parent_tree_sha = None, None # 輸出分支尚未建立
+    paths_to_stage = set()
+    if not os.path.exists(index_path):
+        run_git(['read-tree', parent_sha] if parent_sha else ['read-tree', '--empty'], env=git_env)
+        paths_to_stage.update(list_published_output_files())
+    with published_paths_lock: paths_to_stage.update(published_output_paths)
+    if not paths_to_stage:
+        logging.info("沒有任何已記錄的輸出檔案變更，跳過 commit 和 push。")
+        return False
+    logging.info(f"執行: git update-index --add --remove ({len(paths_to_stage)} 個輸出路徑，輸出分支 {GIT_OUTPUT_BRANCH})")
+    run_git(['update-index', '--add', '--remove', '-z', '--stdin'], input_text='\0'.join(sorted(paths_to_stage)) + '\0', env=git_env, cwd=OUTPUT_DIRECTORY)
+    tree_sha = run_git(['write-tree'], env=git_env)
+    with published_paths_lock: published_output_paths.difference_update(paths_to_stage)
+    if tree_sha == parent_tree_sha:
+        logging.info("輸出檔案內容與輸出分支相同，跳過 commit 和 push。")
+        return False
+    # 歷史過長時以不帶 parent 的 commit 取代整段歷史，舊物件於之後的維護中清除
+    squash_history = parent_sha is not None and int(run_git(['rev-list', '--count', parent_sha])) >= GIT_OUTPUT_SQUASH_COMMITS
+    commit_message = f"Automated update: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    commit_sha = run_git(['commit-tree', tree_sha, '-m', commit_message] + (['-p', parent_sha] if parent_sha and not squash_history else []))
+    run_git(['update-ref', '-m', f"commit: {commit_message}", branch_ref, commit_sha] + ([parent_sha] if parent_sha else []))
+    logging.info(f"已在輸出分支 {GIT_OUTPUT_BRANCH} 建立 commit {commit_sha[:10]}{' (已壓縮歷史)' if squash_history else ''}。")
+    schedule_repository_maintenance(force=squash_history)
+    return True
+
+# --- 儲存庫維護 (輸出分支模式) ---
+# 壓縮歷史後舊的 commit 只剩輸出分支的 reflog 參照；定期只 expire 輸出分支 (與其遠端追蹤分支) 的 reflog 並 gc，
+# 讓 .git 大小維持平穩。其他分支、stash 的 reflog 保持不動，仍可用於復原。
+git_repo_lock = threading.RLock() # 本程式的 commit 與 gc 不同時進行；其他程序的新物件由 GIT_GC_PRUNE_GRACE 保護
+last_maintenance_time = 0
+maintenance_thread = None
+
+def schedule_repository_maintenance(force=False):
+    global maintenance_thread
+    if GIT_PUBLISH_MODE != 'output_branch': return
+    if not force and time.time() - last_maintenance_time < GIT_MAINTENANCE_INTERVAL_SECONDS: return
+    if maintenance_thread is not None and maintenance_thread.is_alive(): return
+    maintenance_thread = threading.Thread(target=run_repository_maintenance, name='git-maintenance', daemon=True)
+    maintenance_thread.start()
+
+def run_repository_maintenance():
+    global last_maintenance_time
+    with git_repo_lock:
+        started = time.time()
+        try:
+            output_refs = run_git(['for-each-ref', '--format=%(refname)', f"refs/heads/{GIT_OUTPUT_BRANCH}", f"refs/remotes/{push_scheduler.remote}/{GIT_OUTPUT_BRANCH}"]).split() # 不存在的 ref 會讓 reflog expire 失敗
+            logging.info(f"執行儲存庫維護: git reflog expire --expire-unreachable=now {' '.join(output_refs)} && git gc --prune={GIT_GC_PRUNE_GRACE}")
+            run_git(['reflog', 'expire', '--expire-unreachable=now'] + output_refs)
+            run_git(['gc', f'--prune={GIT_GC_PRUNE_GRACE}', '--quiet'])
+            size_info = run_git(['count-objects', '-vH']).replace('\n', ', ')
+            last_maintenance_time = time.time()
+            logging.info(f"儲存庫維護完成，耗時 {last_maintenance_time - started:.1f} 秒。{size_info}")
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            logging.error(f"儲存庫維護失敗: {getattr(e, 'stderr', None) or e}")
+
 def commit_and_push_changes():
     global REPO_PATH # 確保引用全域變數
     logging.info("開始執行 Git 操作...")
@@ -527,32 +2100,25 @@ def commit_and_push_changes():
             logging.error(f"自動移除 .git/index.lock 檔案失敗: {e}")
             return False # 如果無法刪除鎖定檔，則直接失敗
 
+    commit_started = time.perf_counter(); committed = False
     try:
-        # --- 步驟 1: 使用 'git add .' 來暫存所有變更 ---
-        logging.info("執行: git add .")
-        subprocess.run(['git', 'add', '.'], cwd=REPO_PATH, capture_output=True, text=True, check=True, encoding='utf-8')
-
-        # --- 步驟 2: 檢查是否有任何東西被放入暫存區 ---
-        result_status_staged = subprocess.run(['git', 'diff', '--staged', '--quiet'], cwd=REPO_PATH, check=False)
+        with git_repo_lock:
+            if GIT_PUBLISH_MODE == 'output_branch': committed = commit_output_branch()
+            elif GIT_PUBLISH_MODE == 'targeted': committed = commit_published_outputs()
+            else: committed = commit_all_changes()
+        metric_git_seconds.observe(time.perf_counter() - commit_started, operation='commit')
+        if not committed: record_unchanged_publish(); return True
+        freshness_tracer.advance_all('committed', 'rendered')
+        metric_git_last_success.set(time.time(), operation='commit')
 
-        if result_status_staged.returncode == 0:
-             logging.info(f"沒有偵測到任何已暫存的檔案變更，跳過 commit 和 push。")
-             return True
-
-        # --- 步驟 3: 如果暫存區有內容，則執行 commit 和 push ---
-        commit_message = f"Automated update: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        logging.info(f"執行: git commit -m '{commit_message}'")
-        result_commit = subprocess.run(['git', 'commit', '-m', commit_message], cwd=REPO_PATH, capture_output=True, text=True, check=True, encoding='utf-8')
-        logging.info(f"Git commit 輸出:\n{result_commit.stdout}")
-
-        logging.info("執行: git push origin main")
-        result_push = subprocess.run(['git', 'push', 'origin', 'main'], cwd=REPO_PATH, capture_output=True, text=True, check=True, encoding='utf-8')
-        logging.info(f"Git push 輸出:\n{result_push.stdout}")
-
-        logging.info("Git 操作成功完成。")
+        # push 交由背景排程器合併執行；排程器未啟動時 (例如單獨呼叫) 直接同步推送
+        push_scheduler.request()
+        if not push_scheduler.is_running(): return push_scheduler.push_now()
+        logging.info("Commit 完成，已交由推送排程器推送。")
         return True
         
     except subprocess.CalledProcessError as e:
+        if not committed: metric_git_failures.inc(operation='commit')
         # 在這裡再次檢查是否是鎖定檔錯誤，以防萬一
         if 'index.lock' in e.stderr:
             logging.error(f"Git 操作因 index.lock 再次失敗，請手動檢查是否有其他 Git 程序正在運行。錯誤: {e.stderr}")
@@ -560,111 +2126,482 @@ def commit_and_push_changes():
             logging.error(f"Git 操作失敗: {e}\n指令: {e.cmd}\n返回碼: {e.returncode}\n輸出: {e.stdout}\n錯誤: {e.stderr}")
         return False
     except FileNotFoundError:
+        metric_git_failures.inc(operation='commit')
         logging.error("Git 指令未找到。請確保 Git 已安裝並在 PATH 中。")
         return False
     except Exception as e:
+        if not committed: metric_git_failures.inc(operation='commit')
         logging.error(f"執行 Git 操作時發生未知錯誤: {e}")
         return False
 
+# --- 背景推送排程器 ---
+# commit 與 push 分離：任意數量的本機 commit 合併為一次 push，兩次 push 至少間隔 GIT_PUSH_MIN_INTERVAL_SECONDS；
+# 失敗時以指數退避重試，遠端無法連線時不會每個事件都重推一次。
+class PushScheduler:
+    """在背景執行緒中推送本機 commit；request() 只標記有待推送的 commit"""
+    def __init__(self, remote=GIT_PUSH_REMOTE, branch=GIT_PUSH_BRANCH, min_interval=GIT_PUSH_MIN_INTERVAL_SECONDS,
+                 backoff_initial=GIT_PUSH_BACKOFF_INITIAL_SECONDS, backoff_max=GIT_PUSH_BACKOFF_MAX_SECONDS, force=False):
+        self.remote = remote; self.branch = branch; self.min_interval = min_interval; self.force = force # force: 輸出分支壓縮歷史後需強制推送
+        self.backoff_initial = backoff_initial; self.backoff_max = backoff_max
+        self.condition = threading.Condition()
+        self.push_lock = threading.Lock() # 同一時間只執行一個 git push
+        self.pending = False
+        self.requested_commits = 0 # 上次成功推送後要求推送的 commit 數
+        self.next_attempt_time = 0
+        self.consecutive_failures = 0
+        self.stats = {'pushes': 0, 'failures': 0, 'coalesced_commits': 0, 'last_error': None}
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='git-push-scheduler', daemon=True)
+        self.thread.start()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def request(self):
+        """有新的本機 commit 待推送"""
+        with self.condition:
+            self.pending = True; self.requested_commits += 1
+            self.condition.notify()
+
+    def pending_commit_count(self):
+        """本機分支領先遠端追蹤分支的 commit 數；無法查詢時回傳已要求但尚未推送的次數"""
+        try: return int(run_git(['rev-list', '--count', f'{self.remote}/{self.branch}..{self.branch}']))
+        except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+            with self.condition: return self.requested_commits
+
+    def get_stats(self):
+        with self.condition:
+            stats = dict(self.stats); stats['pending'] = self.pending; stats['consecutive_failures'] = self.consecutive_failures
+            stats['next_attempt_in'] = max(self.next_attempt_time - time.time(), 0) if self.pending else 0
+        return stats
+
+    def push_args(self):
+        return ['push', self.remote, f"{'+' if self.force else ''}refs/heads/{self.branch}:refs/heads/{self.branch}"]
+
+    def push_now(self):
+        """立即推送一次 (若有待推送的 commit)；回傳是否成功"""
+        with self.push_lock:
+            with self.condition:
+                if not self.pending: return True
+                self.pending = False; commit_count = self.requested_commits; self.requested_commits = 0
+            push_args = self.push_args()
+            logging.info(f"執行: git {' '.join(push_args)} (合併 {commit_count} 次 commit)")
+            push_started = time.perf_counter(); push_started_at = time.time()
+            try:
+                push_output = run_git(push_args)
+            except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                metric_git_seconds.observe(time.perf_counter() - push_started, operation='push'); metric_git_failures.inc(operation='push')
+                error_text = (getattr(e, 'stderr', None) or str(e)).strip()
+                with self.condition:
+                    self.pending = True; self.requested_commits += commit_count
+                    self.consecutive_failures += 1; self.stats['failures'] += 1; self.stats['last_error'] = error_text
+                    backoff_seconds = min(self.backoff_initial * (2 ** (self.consecutive_failures - 1)), self.backoff_max)
+                    self.next_attempt_time = time.time() + backoff_seconds
+                logging.error(f"Git push 失敗 (連續第 {self.consecutive_failures} 次)，{backoff_seconds} 秒後重試。錯誤: {error_text}")
+                return False
+            metric_git_seconds.observe(time.perf_counter() - push_started, operation='push'); metric_git_last_success.set(time.time(), operation='push')
+            freshness_tracer.finalize(freshness_tracer.advance_all('pushed', 'committed', not_after=push_started_at))
+            with self.condition:
+                self.consecutive_failures = 0; self.stats['pushes'] += 1; self.stats['coalesced_commits'] += commit_count
+                self.next_attempt_time = time.time() + self.min_interval
+            logging.info(f"Git push 完成。{push_output}")
+            return True
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.pending: self.condition.wait(); continue
+                    wait_seconds = self.next_attempt_time - time.time()
+                    if wait_seconds <= 0: break
+                    self.condition.wait(timeout=wait_seconds)
+            try: self.push_now()
+            except Exception as e: logging.exception(f"推送排程器發生未預期錯誤: {e}")
+
+push_scheduler = PushScheduler(branch=GIT_OUTPUT_BRANCH, force=True) if GIT_PUBLISH_MODE == 'output_branch' else PushScheduler()
+
 # --- 文件監視器事件處理 與 輪詢輔助 ---
 def trigger_update_process():
-    global media_updates, git_update_triggered, git_timer
+    global git_update_triggered, git_timer
     logging.info(">>> trigger_update_process() 被調用")
-    save_updates(media_updates) 
-    if git_update_triggered: 
-        if git_timer is not None and git_timer.is_alive():
-            git_timer.cancel(); logging.info("取消了之前的延遲 Git 操作計時器 (因 trigger_update_process)。")
-    logging.info(f"將在 {GIT_ACTION_DELAY_SECONDS} 秒後執行 Git HTML 生成與推送 (由 trigger_update_process 安排)...")
-    git_timer = threading.Timer(GIT_ACTION_DELAY_SECONDS, delayed_git_action)
-    git_timer.start(); git_update_triggered = True
+    with trigger_lock:
+        save_updates(media_index) 
+        if git_update_triggered: 
+            if git_timer is not None and git_timer.is_alive():
+                git_timer.cancel(); logging.info("取消了之前的延遲 Git 操作計時器 (因 trigger_update_process)。")
+        logging.info(f"將在 {GIT_ACTION_DELAY_SECONDS} 秒後執行 Git HTML 生成與推送 (由 trigger_update_process 安排)...")
+        git_timer = threading.Timer(GIT_ACTION_DELAY_SECONDS, delayed_git_action)
+        git_timer.start(); git_update_triggered = True
+
+# 事件逐筆處理完成時不直接呼叫 trigger_update_process()；匯入大量檔案時合併成一次儲存與發布排程
+trigger_request_lock = threading.Lock()
+trigger_request_timer = None
+trigger_request_stats = {'requested': 0, 'executed': 0}
+
+def request_update_trigger():
+    global trigger_request_timer
+    with trigger_request_lock:
+        trigger_request_stats['requested'] += 1
+        if trigger_request_timer is not None: return # 已有排定的觸發，本次要求併入其中
+        trigger_request_timer = threading.Timer(TRIGGER_COALESCE_SECONDS, run_requested_update_trigger)
+        trigger_request_timer.daemon = True; trigger_request_timer.start()
+
+def run_requested_update_trigger():
+    global trigger_request_timer
+    with trigger_request_lock:
+        trigger_request_timer = None; trigger_request_stats['executed'] += 1
+    trigger_update_process()
+
+# --- 背景處理佇列 (監視器執行緒只排入事件，由固定數量的工作執行緒處理) ---
+ingest_queue = queue.Queue(maxsize=INGEST_QUEUE_MAXSIZE)
+ingest_stats_lock = threading.Lock()
+ingest_in_flight_paths = set() # 正在處理中的路徑 (小寫)，避免重複事件同時處理同一檔案
+ingest_stats = {'enqueued': 0, 'dropped': 0, 'processed': 0}
+ingest_workers = []
+
+def enqueue_ingest(filepath, is_directory, path_key=None):
+    freshness_tracer.mark(filepath, 'settled', path_key)
+    try:
+        ingest_queue.put_nowait((filepath, is_directory, path_key))
+        with ingest_stats_lock: ingest_stats['enqueued'] += 1
+    except queue.Full:
+        with ingest_stats_lock: ingest_stats['dropped'] += 1
+        logging.warning(f"[{os.path.basename(filepath)}] (事件) 處理佇列已滿 ({INGEST_QUEUE_MAXSIZE})，略過此事件，將由定期輪詢補上。")
+
+settle_scheduler = SettleScheduler(on_settled=enqueue_ingest) # 事件先經寫入完成偵測，穩定後才排入處理佇列
+
+# --- 事件合併層 (監視器與寫入完成偵測之間) ---
+# 複製整季或搬入資料夾時會湧入大量建立事件 (含暫存檔與同一路徑的重複事件)；
+# 在此去重、過濾後每隔 EVENT_COALESCE_INTERVAL_SECONDS 整批放行。
+def is_temp_file_name(name):
+    name_lower = name.lower()
+    return name_lower.startswith(TEMP_FILE_PREFIXES) or name_lower.endswith(TEMP_FILE_SUFFIXES)
+
+class EventCoalescer:
+    """合併同一路徑的重複事件、略過暫存檔與不會被處理的事件，以及 collection 目錄仍在處理中時其底下的事件"""
+    def __init__(self, on_release):
+        self.on_release = on_release
+        self.lock = threading.Lock()
+        self.pending = {} # PathKey -> (路徑, 是否為目錄, 首次收到時間)
+        self.recently_released = {} # PathKey -> 放行時間 (時間窗內的重複事件仍視為重複)
+        self.pending_collections = {} # 已收到、尚未處理完成的 collection 目錄 PathKey -> 收到時間
+        self.stats = {'received': 0, 'released': 0, 'batches': 0, 'duplicates': 0, 'temp_files': 0, 'ignored': 0, 'under_collection': 0}
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='event-coalescer', daemon=True)
+        self.thread.start()
+
+    def add(self, path, is_directory):
+        """收到建立 (或搬入) 事件；回傳是否排入待放行清單"""
+        with self.lock: self.stats['received'] += 1
+        if is_temp_file_name(os.path.basename(path)):
+            with self.lock: self.stats['temp_files'] += 1
+            return False
+        path_key = PathKey.of(path); config = get_media_config(path_key)
+        # 與 process_new_media 相同的判斷，提早略過一定會被忽略的事件
+        is_collection = config is not None and config['category'] == 'collection'
+        if config is None or is_directory != is_collection or (not is_directory and not path.lower().endswith(TARGET_EXTENSIONS)):
+            with self.lock: self.stats['ignored'] += 1
+            return False
+        now = time.time()
+        with self.lock:
+            if self._is_under_pending_collection(path_key): self.stats['under_collection'] += 1; return False
+            if path_key in self.pending or now - self.recently_released.get(path_key, 0) < EVENT_COALESCE_WINDOW_SECONDS:
+                self.stats['duplicates'] += 1; return False
+            self.pending[path_key] = (path, is_directory, now)
+            if is_directory: self.pending_collections[path_key] = now
+        freshness_tracer.start(path, 'event', path_key, when=now)
+        return True
+
+    def forget_collection(self, path_key):
+        """collection 目錄處理完成後呼叫，之後其底下的事件恢復正常處理"""
+        with self.lock: self.pending_collections.pop(path_key, None)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats); stats['pending'] = len(self.pending)
+        return stats
+
+    def _is_under_pending_collection(self, path_key):
+        parent = os.path.dirname(path_key)
+        while parent and parent != path_key:
+            if parent in self.pending_collections: return True
+            path_key, parent = parent, os.path.dirname(parent)
+        return False
+
+    def _take_ready_batch(self):
+        now = time.time(); ready = []
+        with self.lock:
+            for path_key, (path, is_directory, first_seen) in list(self.pending.items()):
+                if now - first_seen < EVENT_COALESCE_WINDOW_SECONDS: continue
+                del self.pending[path_key]; self.recently_released[path_key] = now
+                # collection 目錄事件可能比其底下的事件晚到，放行前再確認一次
+                if not is_directory and self._is_under_pending_collection(path_key): self.stats['under_collection'] += 1; continue
+                ready.append((path, is_directory, path_key))
+            for path_key, released_at in list(self.recently_released.items()):
+                if now - released_at >= EVENT_COALESCE_WINDOW_SECONDS: del self.recently_released[path_key]
+            for path_key, received_at in list(self.pending_collections.items()):
+                if now - received_at >= COLLECTION_PENDING_MAX_SECONDS: del self.pending_collections[path_key]
+            if ready: self.stats['released'] += len(ready); self.stats['batches'] += 1
+        return ready
+
+    def _run(self):
+        while True:
+            time.sleep(EVENT_COALESCE_INTERVAL_SECONDS)
+            ready = self._take_ready_batch()
+            if not ready: continue
+            logging.info(f"(事件合併) 放行 {len(ready)} 個項目至寫入完成偵測。")
+            for path, is_directory, path_key in ready:
+                try: self.on_release(path, is_directory, path_key)
+                except Exception as e: logging.exception(f"[{os.path.basename(path)}] (事件合併) 放行時發生錯誤: {e}")
+
+event_coalescer = EventCoalescer(on_release=settle_scheduler.submit)
+
+def get_ingest_stats():
+    """回傳佇列深度、處理中數量與累計計數"""
+    with ingest_stats_lock:
+        stats = dict(ingest_stats); stats['in_flight'] = len(ingest_in_flight_paths)
+    stats['queue_depth'] = ingest_queue.qsize(); stats['settling'] = settle_scheduler.pending_count(); stats['workers'] = sum(1 for worker in ingest_workers if worker.is_alive())
+    return stats
+
+def handle_created_path(filepath, is_directory, path_key=None):
+    abs_filepath_lower = PathKey.of(path_key or filepath)
+    event_type_str = "目錄" if is_directory else "檔案"
+    with ingest_stats_lock:
+        if abs_filepath_lower in ingest_in_flight_paths: logging.info(f"[{os.path.basename(filepath)}] (事件) 此路徑正在處理中，忽略重複事件。"); return
+        ingest_in_flight_paths.add(abs_filepath_lower)
+    logging.info(f"---------- [Event Start] 偵測到新{event_type_str}: {filepath} ----------")
+    try:
+        if abs_filepath_lower in media_index: logging.warning(f"[{os.path.basename(filepath)}] (事件) 此路徑已在 media_index 中，忽略。"); freshness_tracer.discard(filepath, abs_filepath_lower); return
+        update_info = process_new_media(filepath, is_directory_event=is_directory, settled=True, path_key=abs_filepath_lower)
+        if update_info:
+            if record_new_update(update_info, abs_filepath_lower):
+                logging.info(f"新增更新記錄 (來自事件 - 分類: {update_info.category}): {update_info.filename}")
+                request_update_trigger()
+            else: logging.warning(f"[{update_info.filename}] (事件) 加入列表前再次確認為重複，跳過。"); freshness_tracer.discard(filepath, abs_filepath_lower)
+    except Exception as e: logging.exception(f"[{os.path.basename(filepath)}] !! 處理 '{event_type_str}' 創建事件時發生未預期錯誤: {e}")
+    finally:
+        with ingest_stats_lock: ingest_in_flight_paths.discard(abs_filepath_lower); ingest_stats['processed'] += 1
+        if is_directory: event_coalescer.forget_collection(abs_filepath_lower)
+        logging.info(f"---------- [Event End] 完成處理{event_type_str}: {filepath} ----------")
+
+def ingest_worker_loop():
+    while True:
+        task = ingest_queue.get()
+        try:
+            if task is None: return # 停止訊號
+            handle_created_path(*task)
+        finally: ingest_queue.task_done()
+
+def start_ingest_workers(worker_count=INGEST_WORKER_COUNT):
+    for index in range(worker_count):
+        worker = threading.Thread(target=ingest_worker_loop, name=f'ingest-worker-{index + 1}', daemon=True)
+        worker.start(); ingest_workers.append(worker)
+    logging.info(f"已啟動 {worker_count} 個背景處理執行緒 (佇列上限 {INGEST_QUEUE_MAXSIZE})。")
+
+def stop_ingest_workers():
+    for _ in ingest_workers: ingest_queue.put(None)
+    for worker in ingest_workers: worker.join(timeout=30)
+    ingest_workers.clear()
 
 class MyHandler(FileSystemEventHandler):
+    def on_any_event(self, event):
+        # 任何變動都讓相關目錄的清單快取失效 (搬移事件同時處理來源與目的地)
+        invalidate_directory_listing(event.src_path)
+        if getattr(event, 'dest_path', None): invalidate_directory_listing(event.dest_path)
+
     def on_created(self, event):
-        global media_updates, processed_paths_set
-        filepath = event.src_path; abs_filepath_lower = os.path.abspath(filepath).lower()
-        event_type_str = "目錄" if event.is_directory else "檔案"
-        logging.info(f"---------- [Event Start] 偵測到新{event_type_str}: {filepath} ----------")
-        try:
-            if abs_filepath_lower in processed_paths_set: logging.warning(f"[{os.path.basename(filepath)}] (事件) 此路徑已在 processed_paths_set 中，忽略。"); return
-            time.sleep(0.5)
-            update_info = process_new_media(filepath, is_directory_event=event.is_directory)
-            if update_info:
-                if not any(item.get('absolute_path', '').lower() == abs_filepath_lower for item in media_updates):
-                    media_updates.append(update_info); processed_paths_set.add(abs_filepath_lower) 
-                    media_updates.sort(key=lambda x: x.get('timestamp', datetime.datetime.min), reverse=True)
-                    logging.info(f"新增更新記錄 (來自事件 - 分類: {update_info['category']}): {update_info['filename']}")
-                    trigger_update_process() 
-                else: logging.warning(f"[{update_info['filename']}] (事件) 加入列表前再次確認為重複，跳過。")
-        except Exception as e: logging.exception(f"[{os.path.basename(filepath)}] !! 處理 '{event_type_str}' 創建事件時發生未預期錯誤: {e}")
-        finally: logging.info(f"---------- [Event End] 完成處理{event_type_str}: {filepath} ----------")
+        metric_events_received.inc(event='created')
+        # 只交給事件合併層；去重後整批送往寫入完成偵測，穩定後才排入佇列由工作執行緒解析，不會阻塞監視器的事件分派
+        event_coalescer.add(event.src_path, event.is_directory)
+
+    def on_moved(self, event):
+        metric_events_received.inc(event='moved')
+        # 暫存檔改名為正式檔名，或整個資料夾搬入時，以目的路徑視為新項目
+        event_coalescer.add(event.dest_path, event.is_directory)
 
 # --- 定期掃描函數 ---
-def scan_and_process_new_files():
-    global media_updates, processed_paths_set
-    logging.info(">>> 開始定期輪詢新檔案/目錄...")
-    batch_items_for_update = [] 
-    for monitored_dir in MONITORED_DIRECTORIES:
-        if not os.path.exists(monitored_dir):
-            logging.warning(f"(輪詢) 監控目錄不存在: {monitored_dir}")
-            continue
-
-        config = get_media_config(monitored_dir)
-        if not config:
-            logging.error(f"(輪詢) 監控目錄 {monitored_dir} 在 PATH_CONFIG 中沒有對應設定，跳過。")
-            continue
+# 增量輪詢：記住每個目錄上次的修改時間，只重新列出修改時間有變的目錄 (新增、刪除、改名子項目都會更新目錄的修改時間)；
+# 未變動的目錄只需一次 stat 並沿用上次的子目錄清單。另定期完整掃描一次作為保險。
+poll_arrival_floor = time.time() # 本輪輪詢之前的上一輪開始時間 (首輪為程式啟動時間)
+poll_directory_state = {} # normcase 目錄路徑 -> {'mtime_ns', 'listed_at_ns', 'subdirs', 'candidates'}
+last_full_poll_time = 0
+poll_batch_lock = threading.Lock()
 
-        if config['category'] == 'collection':
-            try:
-                for item_name in os.listdir(monitored_dir):
-                    item_path = os.path.join(monitored_dir, item_name)
-                    if os.path.isdir(item_path):
-                        abs_item_path_lower = os.path.abspath(item_path).lower()
-                        if abs_item_path_lower not in processed_paths_set:
-                            logging.info(f"(輪詢) 發現新目錄 (collection): {item_path}")
-                            update_info = process_new_media(item_path, is_directory_event=True)
-                            if update_info:
-                                if abs_item_path_lower not in processed_paths_set:
-                                    media_updates.append(update_info)
-                                    processed_paths_set.add(abs_item_path_lower)
-                                    batch_items_for_update.append(update_info)
-                                    if len(batch_items_for_update) >= POLLING_BATCH_SAVE_COUNT:
-                                        logging.info(f"(輪詢) 達到批次數量 {POLLING_BATCH_SAVE_COUNT} (目錄)，觸發儲存與 Git 更新...")
-                                        media_updates.sort(key=lambda x: x.get('timestamp', datetime.datetime.min), reverse=True)
-                                        trigger_update_process()
-                                        batch_items_for_update = []
-            except Exception as e_list_dir:
-                logging.exception(f"(輪詢) 遍歷 collection 目錄 {monitored_dir} 時出錯: {e_list_dir}")
-            continue
+def list_poll_directory(directory):
+    """以 os.scandir 列出目錄，回傳 (子目錄名稱, 可遞迴的子目錄名稱, 檔案名稱)，並順便填入目錄清單快取"""
+    dirnames, walk_dirnames, filenames = [], [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try: is_dir = entry.is_dir()
+            except OSError: is_dir = False
+            if is_dir:
+                dirnames.append(entry.name)
+                if not entry.is_symlink(): walk_dirnames.append(entry.name) # 與 os.walk 相同，不進入符號連結目錄
+            else: filenames.append(entry.name)
+    prime_directory_listing(directory, dirnames, filenames)
+    return dirnames, walk_dirnames, filenames
 
-        try:
-            for root, _, files in os.walk(monitored_dir):
-                for filename in files:
-                    filepath = os.path.join(root, filename)
-                    abs_filepath_lower = os.path.abspath(filepath).lower()
-                    if filename.lower().endswith(TARGET_EXTENSIONS):
-                        if abs_filepath_lower not in processed_paths_set:
-                            logging.info(f"(輪詢) 發現新檔案: {filepath}")
-                            update_info = process_new_media(filepath, is_directory_event=False)
-                            if update_info:
-                                if abs_filepath_lower not in processed_paths_set:
-                                    media_updates.append(update_info)
-                                    processed_paths_set.add(abs_filepath_lower)
-                                    batch_items_for_update.append(update_info)
-                                    if len(batch_items_for_update) >= POLLING_BATCH_SAVE_COUNT:
-                                        logging.info(f"(輪詢) 達到批次數量 {POLLING_BATCH_SAVE_COUNT} (檔案)，觸發儲存與 Git 更新...")
-                                        media_updates.sort(key=lambda x: x.get('timestamp', datetime.datetime.min), reverse=True)
-                                        trigger_update_process()
-                                        batch_items_for_update = []
-        except Exception as e_walk:
-            logging.exception(f"(輪詢) 遍歷目錄 {monitored_dir} 時 (os.walk) 出錯: {e_walk}")
+def forget_poll_subtree(directory_key):
+    state = poll_directory_state.pop(directory_key, None)
+    if state:
+        for subdir in state['subdirs']: forget_poll_subtree(os.path.join(directory_key, os.path.normcase(subdir)))
+
+def collect_poll_candidates(monitored_dir, is_collection, full_sweep, scan_stats):
+    """回傳本輪尚未處理的 (路徑, PathKey, 是否為目錄)；collection 只看第一層子目錄，其餘分類遞迴尋找目標副檔名檔案"""
+    candidates = []; pending_dirs = [(monitored_dir, PathKey.of(monitored_dir))]
+    while pending_dirs:
+        directory, path_key = pending_dirs.pop(); directory_key = os.path.normcase(directory)
+        try: mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError: forget_poll_subtree(directory_key); continue
+        previous = poll_directory_state.get(directory_key)
+        # 修改時間與上次列出時間過於接近時，同一時間刻度內的變動可能未反映在 mtime，下輪仍重新列出
+        if full_sweep or previous is None or previous['mtime_ns'] != mtime_ns or mtime_ns >= previous['listed_at_ns'] - POLL_MTIME_RACE_SECONDS * 1_000_000_000:
+            listed_at_ns = time.time_ns()
+            dirnames, walk_dirnames, filenames = list_poll_directory(directory)
+            names = dirnames if is_collection else [name for name in filenames if name.lower().endswith(TARGET_EXTENSIONS)]
+            if previous:
+                for removed_subdir in set(previous['subdirs']) - set(walk_dirnames): forget_poll_subtree(os.path.join(directory_key, os.path.normcase(removed_subdir)))
+            state = {'mtime_ns': mtime_ns, 'listed_at_ns': listed_at_ns, 'subdirs': [] if is_collection else walk_dirnames, 'candidates': names}
+            scan_stats['listed'] += 1
+        else:
+            state = previous; scan_stats['skipped'] += 1
+        # 只保留仍未處理的項目，下輪目錄未變動時也會重試 (例如處理失敗或檔案尚未寫完)
+        candidate_keys = [(name, path_key.child(name)) for name in state['candidates']]
+        candidate_keys = [(name, item_key) for name, item_key in candidate_keys if item_key not in media_index]
+        state['candidates'] = [name for name, _ in candidate_keys]
+        poll_directory_state[directory_key] = state
+        candidates.extend((os.path.join(directory, name), item_key, is_collection) for name, item_key in candidate_keys)
+        pending_dirs.extend((os.path.join(directory, subdir), path_key.child(subdir)) for subdir in state['subdirs'])
+    return candidates
 
+def estimate_poll_arrival(path):
+    """輪詢發現的項目無法得知實際出現時間：取修改時間，但不早於上一輪輪詢開始 (更早出現的話上一輪就會發現)"""
+    try: mtime = os.stat(path).st_mtime
+    except OSError: return time.time()
+    return min(max(mtime, poll_arrival_floor), time.time())
+
+def add_poll_batch_item(batch_items_for_update, update_info):
+    """加入輪詢批次；累積達 POLLING_BATCH_SAVE_COUNT 時觸發儲存與 Git 更新 (多個掃描執行緒共用)"""
+    with poll_batch_lock:
+        batch_items_for_update.append(update_info)
+        if len(batch_items_for_update) < POLLING_BATCH_SAVE_COUNT: return
+        batch_items_for_update.clear()
+    logging.info(f"(輪詢) 達到批次數量 {POLLING_BATCH_SAVE_COUNT}，觸發儲存與 Git 更新...")
+    trigger_update_process()
+
+def scan_monitored_root(monitored_dir, full_sweep, batch_items_for_update):
+    """掃描單一監控根目錄並處理新項目，回傳此根目錄的統計 (於輪詢執行緒池中執行)"""
+    root_started = time.time(); root_stats = {'root': monitored_dir, 'listed': 0, 'skipped': 0, 'added': 0, 'elapsed': 0.0}
+    if not os.path.exists(monitored_dir):
+        logging.warning(f"(輪詢) 監控目錄不存在: {monitored_dir}")
+        return root_stats
+
+    config = get_media_config(monitored_dir)
+    if not config:
+        logging.error(f"(輪詢) 監控目錄 {monitored_dir} 在 PATH_CONFIG 中沒有對應設定，跳過。")
+        return root_stats
+
+    is_collection = config['category'] == 'collection'
+    try:
+        candidates = collect_poll_candidates(monitored_dir, is_collection, full_sweep, root_stats)
+    except Exception as e_scan:
+        logging.exception(f"(輪詢) 掃描目錄 {monitored_dir} 時出錯: {e_scan}")
+        return root_stats
+
+    for item_path, abs_item_path_lower, is_directory in candidates:
+        if abs_item_path_lower in media_index: continue
+        logging.info(f"(輪詢) 發現新{'目錄 (collection)' if is_directory else '檔案'}: {item_path}")
+        freshness_tracer.start(item_path, 'poll', abs_item_path_lower, when=estimate_poll_arrival(item_path)); freshness_tracer.mark(item_path, 'discovered', abs_item_path_lower)
+        try: update_info = process_new_media(item_path, is_directory_event=is_directory, path_key=abs_item_path_lower)
+        except Exception as e_item: logging.exception(f"(輪詢) 處理 {item_path} 時出錯: {e_item}"); freshness_tracer.discard(item_path, abs_item_path_lower); continue
+        if update_info:
+            if record_new_update(update_info, abs_item_path_lower):
+                root_stats['added'] += 1
+                add_poll_batch_item(batch_items_for_update, update_info)
+            else: freshness_tracer.discard(item_path, abs_item_path_lower)
+    root_stats['elapsed'] = time.time() - root_started
+    return root_stats
+
+def scan_and_process_new_files(full_sweep=None):
+    global last_full_poll_time, poll_arrival_floor
+    poll_started = time.time()
+    if full_sweep is None: full_sweep = (poll_started - last_full_poll_time) >= POLLING_FULL_SWEEP_INTERVAL_SECONDS
+    logging.info(f">>> 開始定期輪詢新檔案/目錄 ({'完整掃描' if full_sweep else '增量掃描'})...")
+    batch_items_for_update = []; all_root_stats = []
+    # 各根目錄分屬不同掛載點、大小差異大，平行掃描讓慢的根目錄不拖累其他根目錄
+    worker_count = max(1, min(POLL_WORKER_COUNT, len(MONITORED_DIRECTORIES)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='poll') as executor:
+        futures = [executor.submit(scan_monitored_root, monitored_dir, full_sweep, batch_items_for_update) for monitored_dir in MONITORED_DIRECTORIES]
+        for future in concurrent.futures.as_completed(futures):
+            try: all_root_stats.append(future.result())
+            except Exception as e_root: logging.exception(f"(輪詢) 掃描執行緒發生未預期錯誤: {e_root}")
+
+    if full_sweep: last_full_poll_time = poll_started
+    poll_arrival_floor = poll_started
+    for root_stats in all_root_stats: metric_poll_root_seconds.observe(root_stats['elapsed'], root=root_stats['root'])
+    metric_poll_last_timestamp.set(time.time())
+    for root_stats in sorted(all_root_stats, key=lambda x: x['elapsed'], reverse=True):
+        logging.info(f"(輪詢) {root_stats['root']}: 耗時 {root_stats['elapsed']:.2f} 秒，列出 {root_stats['listed']} / 略過 {root_stats['skipped']} 個目錄，新增 {root_stats['added']} 項")
+    logging.info(f"(輪詢) 本輪列出 {sum(x['listed'] for x in all_root_stats)} 個目錄，略過 {sum(x['skipped'] for x in all_root_stats)} 個未變動目錄，"
+                 f"總耗時 {time.time() - poll_started:.2f} 秒 (最慢根目錄 {max((x['elapsed'] for x in all_root_stats), default=0):.2f} 秒)。")
     if batch_items_for_update:
         logging.info(f"(輪詢) 完成，處理剩餘 {len(batch_items_for_update)} 個新項目。觸發儲存與 Git 更新...")
-        media_updates.sort(key=lambda x: x.get('timestamp', datetime.datetime.min), reverse=True)
         trigger_update_process()
     else:
         logging.info(">>> 定期輪詢完成，本輪無新檔案/目錄被實際加入列表。")
 
+# --- /metrics HTTP 端點 ---
+def get_store_size_bytes():
+    """快照、日誌 (或 SQLite 資料庫) 的總大小"""
+    paths = [get_updates_json_path(), get_journal_paths()[0]]
+    if media_store is not None: paths.append(media_store.db_path)
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+def get_pending_work_samples():
+    """各等待中的計時器與佇列，供判斷發布是否卡住"""
+    ingest_stats_now = get_ingest_stats(); push_stats_now = push_scheduler.get_stats()
+    return [({'stage': 'coalescing'}, event_coalescer.get_stats()['pending']), ({'stage': 'settling'}, ingest_stats_now['settling']),
+            ({'stage': 'ingest_queue'}, ingest_stats_now['queue_depth']), ({'stage': 'in_flight'}, ingest_stats_now['in_flight']),
+            ({'stage': 'trigger_timer'}, int(trigger_request_timer is not None)), ({'stage': 'git_timer'}, int(git_timer is not None and git_timer.is_alive())),
+            ({'stage': 'push'}, int(push_stats_now['pending']))]
+
+GaugeMetric('watcher_store_records', 'media_index 中的紀錄數', callback=lambda: len(media_index))
+GaugeMetric('watcher_store_bytes', '更新紀錄快照與日誌 (或 SQLite 資料庫) 的總大小', callback=get_store_size_bytes)
+GaugeMetric('watcher_journal_lines', '尚未壓實的日誌行數', callback=lambda: journal_line_count)
+GaugeMetric('watcher_pending_items', '各階段等待中的項目或計時器數', ('stage',), callback=get_pending_work_samples)
+def get_freshness_quantile_samples():
+    summary = freshness_tracer.get_summary()
+    return [({'quantile': quantile}, summary[name]) for quantile, name in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')) if summary[name] is not None]
+
+GaugeMetric('watcher_freshness_quantile_seconds', '最近推送完成項目的新鮮度百分位數', ('quantile',), callback=get_freshness_quantile_samples)
+GaugeMetric('watcher_freshness_traces_in_flight', '尚未推送完成的追蹤項目數', callback=lambda: len(freshness_tracer.traces))
+GaugeMetric('watcher_nfo_cache_entries', 'NFO 解析快取筆數', callback=lambda: get_nfo_cache_stats()['entries'])
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics': self.send_error(404); return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'); self.send_header('Content-Length', str(len(body)))
+        self.end_headers(); self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"(metrics) {self.address_string()} {format % args}")
+
+def start_metrics_server(port=METRICS_PORT, bind_address=METRICS_BIND_ADDRESS):
+    """METRICS_PORT 有設定時於背景執行緒提供 /metrics；啟動失敗只記錄錯誤，不影響監視器"""
+    if port is None: return None
+    try: server = http.server.ThreadingHTTPServer((bind_address, port), MetricsRequestHandler)
+    except OSError as e: logging.error(f"無法啟動 /metrics 端點 ({bind_address}:{port}): {e}"); return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logging.info(f"已於 http://{bind_address}:{port}/metrics 提供執行期指標。")
+    return server
+
 # --- 主程式 ---
 if __name__ == "__main__":
     logging.info("="*30); logging.info("啟動檔案監視器腳本 (V9.1.2 - 補上 archive_html_shell)...") # 更新版本標示
@@ -678,6 +2615,9 @@ if __name__ == "__main__":
         else: logging.warning(f"目錄不存在，無法監控: {path}")
     if monitored_count == 0: logging.error("沒有任何有效的目錄被監控，腳本即將退出。"); print("錯誤：沒有任何有效的目錄被監控。"); exit()
     
+    start_ingest_workers(); settle_scheduler.start(); event_coalescer.start(); push_scheduler.start(); metrics_server = start_metrics_server()
+    pending_commits_at_start = push_scheduler.pending_commit_count()
+    if pending_commits_at_start > 0: logging.info(f"偵測到 {pending_commits_at_start} 個尚未推送的本機 commit，交由推送排程器推送。"); push_scheduler.request()
     observer.start(); logging.info("文件監視器已啟動，等待檔案變更與定期輪詢..."); print("文件監視器已啟動，等待檔案變更與定期輪詢...")
     
     last_poll_time = time.time()
@@ -687,7 +2627,16 @@ if __name__ == "__main__":
             time.sleep(10)
             main_loop_counter += 1
             if main_loop_counter % 360 == 0: 
-                logging.info(f"主循環正常運行中。media_updates 長度: {len(media_updates)}, processed_paths_set 長度: {len(processed_paths_set)}")
+                ingest_stats_now = get_ingest_stats(); coalescer_stats_now = event_coalescer.get_stats(); push_stats_now = push_scheduler.get_stats(); nfo_cache_stats_now = get_nfo_cache_stats(); dir_listing_stats_now = get_dir_listing_cache_stats()
+                logging.info(f"主循環正常運行中。media_index 紀錄數: {len(media_index)}, 已索引路徑數: {media_index.path_count()}, "
+                             f"等待寫入完成: {ingest_stats_now['settling']}, 處理佇列深度: {ingest_stats_now['queue_depth']}, 處理中: {ingest_stats_now['in_flight']}, 已處理/略過事件: {ingest_stats_now['processed']}/{ingest_stats_now['dropped']}, "
+                             f"事件 收到/放行/重複/暫存檔/略過/collection 底下: {coalescer_stats_now['received']}/{coalescer_stats_now['released']}/{coalescer_stats_now['duplicates']}/{coalescer_stats_now['temp_files']}/{coalescer_stats_now['ignored']}/{coalescer_stats_now['under_collection']}, "
+                             f"儲存觸發 要求/執行: {trigger_request_stats['requested']}/{trigger_request_stats['executed']}, "
+                             f"Git push 成功/失敗: {push_stats_now['pushes']}/{push_stats_now['failures']} (待推送: {'是' if push_stats_now['pending'] else '否'}), "
+                             f"NFO 快取命中/未命中: {nfo_cache_stats_now['hits']}/{nfo_cache_stats_now['misses']} ({nfo_cache_stats_now['entries']} 筆), "
+                             f"目錄清單查詢/實際列出: {dir_listing_stats_now['lookups']}/{dir_listing_stats_now['listings']}, "
+                             f"輸出 重建/略過: {build_stats['built']}/{build_stats['skipped']}")
+                logging.info(format_freshness_summary(freshness_tracer.get_summary()))
             current_time = time.time()
             if (current_time - last_poll_time) >= POLLING_INTERVAL_SECONDS:
                 logging.info(f"--- 觸發定期輪詢任務 (距離上次 {int(current_time - last_poll_time)} 秒) ---")
@@ -695,14 +2644,16 @@ if __name__ == "__main__":
                 last_poll_time = time.time()
     except KeyboardInterrupt:
         observer.stop()
-        logging.info("收到停止訊號 (KeyboardInterrupt)。")
+        logging.info(f"收到停止訊號 (KeyboardInterrupt)。處理佇列中尚有 {ingest_queue.qsize()} 個事件未處理 (將由下次啟動後的輪詢補上)。")
         if git_timer is not None and git_timer.is_alive():
             git_timer.cancel()
             logging.info("取消了待處理的延遲 Git 操作。")
+        if push_scheduler.get_stats()['pending']: logging.info(f"尚有 {push_scheduler.pending_commit_count()} 個本機 commit 未推送，將於下次啟動後推送。")
     except Exception as e:
         logging.exception(f"監視器主循環發生未預期錯誤: {e}")
     finally:
         if observer.is_alive(): 
             observer.join()
+        flush_updates_on_shutdown()
         logging.info("文件監視器已停止。")
         print("文件監視器已停止。") 
\ No newline at end of file